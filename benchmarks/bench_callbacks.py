@@ -0,0 +1,91 @@
+# benchmarks/bench_callbacks.py
+"""
+Стоимость выбора обработчика нажатия кнопки: прежняя цепочка из 14
+CallbackQueryHandler с регулярками (PTB проверяет их по очереди, затем
+обработчик сам делит query.data) против CallbackRouter (один разбор и словарь).
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_callbacks --presses 200000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+# Бот импортируется с отдельной временной БД, чтобы не трогать triggerbot.db
+os.environ.setdefault("BOT_TOKEN", "0:bench")
+os.environ["DB_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+
+from telegram import CallbackQuery, Update, User
+from telegram.ext import CallbackQueryHandler
+
+import bot
+from callbacks.router import CallbackRouter
+
+# Порядок и шаблоны — как в main() до роутера
+LEGACY_PATTERNS = [
+    r"^back_to_my_chats$", r"^chat_settings\|", r"^view_group\|", r"^back_to_my_groups$",
+    r"^my_groups_from_menu$", r"^create_group\|", r"^1\|", r"^assign_group_confirm\|",
+    r"^local_cats\|", r"^group_cats\|", r"^(local|group)_add_cat\|", r"^(local|group)_edit_cat\|",
+    r"^(local|group)_delete_cat\|", r"^noop$",
+]
+
+# Типичная смесь нажатий: навигация по меню и категории
+PRESSES = [
+    ("chat_settings", -1001234567890), ("local_cats", -1001234567890), ("back_to_my_chats",),
+    ("group_edit_cat", 42, -1001234567890), ("group_delete_cat", 42, -1001234567890), ("noop",),
+]
+
+
+async def _noop(update, context):
+    pass
+
+
+def legacy_parse(data: str):
+    # Что делал каждый обработчик после выбора: split и int() по позициям
+    parts = data.split("|")
+    return parts[0], tuple(int(part) for part in parts[1:])
+
+
+def make_update(data: str) -> Update:
+    user = User(id=1, first_name="bench", is_bot=False)
+    return Update(update_id=1, callback_query=CallbackQuery(id="1", from_user=user, chat_instance="1", data=data))
+
+
+def run(presses: int):
+    handlers = [CallbackQueryHandler(_noop, pattern=pattern) for pattern in LEGACY_PATTERNS]
+    router = CallbackRouter()
+    bot.register_callbacks(router)
+
+    legacy_updates = [make_update("|".join(map(str, press))) for press in PRESSES]
+    router_updates = [make_update(router.build(*press)) for press in PRESSES]
+    n = len(PRESSES)
+
+    start = time.perf_counter()
+    for i in range(presses):
+        update = legacy_updates[i % n]
+        for handler in handlers:
+            if handler.check_update(update):
+                legacy_parse(update.callback_query.data)
+                break
+    legacy = time.perf_counter() - start
+
+    start = time.perf_counter()
+    # Один CallbackQueryHandler без pattern + разбор роутером
+    single = CallbackQueryHandler(_noop)
+    for i in range(presses):
+        update = router_updates[i % n]
+        if single.check_update(update):
+            router.parse(update.callback_query.data)
+    routed = time.perf_counter() - start
+
+    print(f"presses={presses} routes={router.stats()['routes']} legacy_handlers={len(handlers)}")
+    print(f"{'regex chain':<14}{legacy / presses * 1e6:>8.2f} us/press")
+    print(f"{'router':<14}{routed / presses * 1e6:>8.2f} us/press  x{legacy / routed:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--presses", type=int, default=200_000)
+    args = parser.parse_args()
+    run(args.presses)
@@ -0,0 +1,155 @@
+# benchmarks/bench_fuzzy.py
+"""
+Нечёткое сопоставление на одном сообщении: полный перебор (расстояние до
+каждого слова каждого ключа) против CompiledCategories с FuzzyIndex —
+холодным (без запомненных слов) и прогретым. Поиск, упёршийся в предел
+TRIGGER_FUZZY_MAX_CANDIDATES, обрывается, поэтому его время не показательно:
+задержка считается только по завершённым поискам, а оборванные
+выводятся отдельно (число и доля). Код выхода 1 — p99 завершённых поисков
+холодного индекса больше --target-ms.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_fuzzy --categories 200 --keywords 5 --messages 5000 --distance 1
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+
+import config
+from triggers.fuzzy import within_distance
+from triggers.matcher import KEYWORD_MODE_FUZZY, CompiledCategories
+from triggers.normalize import MessageText
+
+LETTERS = "абвгдежзийклмнопрстуфхцчшщыэюя"
+
+
+class BenchCategory:
+    def __init__(self, terms):
+        self.terms = terms
+        self.keyword_mode = KEYWORD_MODE_FUZZY
+        self.priority = 0
+
+
+def random_word(rng, low=3, high=10) -> str:
+    return "".join(rng.choice(LETTERS) for _ in range(rng.randint(low, high)))
+
+
+def typo(rng, word: str) -> str:
+    chars = list(word)
+    position = rng.randrange(len(chars))
+    operation = rng.randrange(4)
+    if operation == 0:
+        chars[position] = rng.choice(LETTERS)
+    elif operation == 1:
+        chars.insert(position, rng.choice(LETTERS))
+    elif operation == 2 and len(chars) > 1:
+        del chars[position]
+    elif position + 1 < len(chars):
+        chars[position], chars[position + 1] = chars[position + 1], chars[position]
+    return "".join(chars)
+
+
+def percentile(samples: list, share: float) -> float:
+    return sorted(samples)[min(len(samples) - 1, int(len(samples) * share))]
+
+
+def timed(fn, messages: list) -> list:
+    samples = []
+    for message in messages:
+        start = time.perf_counter()
+        fn(message)
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+
+def timed_index(compiled, messages: list) -> tuple:
+    """(время завершённых поисков, число оборванных по пределу кандидатов)."""
+    samples, truncated = [], 0
+    for message in messages:
+        before = compiled.fuzzy.over_budget
+        start = time.perf_counter()
+        compiled.matches(message)
+        elapsed = (time.perf_counter() - start) * 1e6
+        if compiled.fuzzy.over_budget > before:
+            truncated += 1
+        else:
+            samples.append(elapsed)
+    return samples, truncated
+
+
+def candidates_per_message(fuzzy, message) -> int:
+    return sum(fuzzy._near(token)[1] for token in message.tokens)
+
+
+def run(categories: int, keywords: int, messages: int, words: int, distance: int, max_candidates: int,
+        target_ms: float) -> bool:
+    rng = random.Random(42)
+    cats = [BenchCategory([random_word(rng, 4, 10) for _ in range(keywords)]) for _ in range(categories)]
+    vocabulary = [random_word(rng) for _ in range(2000)]
+    all_keywords = [term for cat in cats for term in cat.terms]
+
+    # Обычная речь чата + в части сообщений ключ с опечаткой
+    texts = []
+    for _ in range(messages):
+        text = [rng.choice(vocabulary) for _ in range(words)]
+        if rng.random() < 0.3:
+            text[rng.randrange(words)] = typo(rng, rng.choice(all_keywords))
+        texts.append(MessageText(" ".join(text)))
+
+    # Холодный индекс: запоминание слов выключено, каждое сообщение считается с нуля
+    cold = CompiledCategories(cats, fuzzy_distance=distance, fuzzy_max_candidates=max_candidates)
+    cold.fuzzy.max_cached = 0
+    min_length = cold.fuzzy.min_length
+
+    def brute_force(message):
+        # Отдельное сравнение с каждым словом каждого ключа (те же правила для коротких слов)
+        return {index for index, cat in enumerate(cats) for term in cat.terms for token in message.tokens
+                if token == term or (len(term) >= min_length and within_distance(token, term, distance))}
+
+    warm = CompiledCategories(cats, fuzzy_distance=distance, fuzzy_max_candidates=max_candidates)
+    warm_pass = timed_index(warm, texts)  # прогрев: лексика чата запоминается
+
+    sample = texts[:max(1, messages // 20)]  # перебор медленный — на части сообщений
+    results = [
+        ("brute force", (timed(brute_force, sample), 0)),
+        ("index cold", timed_index(cold, texts)),
+        ("index warming", warm_pass),
+        ("index warm", timed_index(warm, texts)),
+    ]
+    # Оборванный поиск может не найти опечатку — сравниваем с перебором только завершённые
+    complete = [message for message in sample if candidates_per_message(warm.fuzzy, message) <= max_candidates]
+    agree = sum(set(cold.matches(message)) == brute_force(message) for message in complete)
+    candidates = [candidates_per_message(warm.fuzzy, message) for message in texts]
+
+    print(f"categories={categories} keywords={keywords} words/message={words} distance={distance} "
+          f"fuzzy_words={len(cold.fuzzy)} max_candidates={max_candidates}")
+    print(f"fuzzy candidates per message: avg={statistics.fmean(candidates):.1f} p99={percentile(candidates, 0.99)} "
+          f"max={max(candidates)}")
+    for name, (samples, truncated) in results:
+        latency = (f"avg={statistics.fmean(samples):>9.1f} us  p50={percentile(samples, 0.5):>9.1f} us  "
+                   f"p99={percentile(samples, 0.99):>9.1f} us" if samples else "no complete searches")
+        print(f"{name:<14} {latency}  truncated={truncated}")
+    print(f"same result as brute force (complete searches): {agree}/{len(complete)}")
+
+    samples = results[1][1][0]
+    p99 = percentile(samples, 0.99) if samples else float("inf")
+    within = p99 <= target_ms * 1000
+    print(f"cold p99 of complete searches {p99:.1f} us {'within' if within else 'EXCEEDS'} "
+          f"target {target_ms * 1000:.0f} us; truncated {results[1][1][1]}/{messages}")
+    return within
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--categories", type=int, default=200)
+    parser.add_argument("--keywords", type=int, default=5, help="ключевых слов в категории")
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--words", type=int, default=12, help="слов в сообщении")
+    parser.add_argument("--distance", type=int, default=config.TRIGGER_FUZZY_MAX_DISTANCE)
+    parser.add_argument("--max-candidates", type=int, default=config.TRIGGER_FUZZY_MAX_CANDIDATES)
+    parser.add_argument("--target-ms", type=float, default=2.0, help="цель по p99 завершённого холодного поиска")
+    args = parser.parse_args()
+    sys.exit(0 if run(args.categories, args.keywords, args.messages, args.words, args.distance, args.max_candidates,
+                      args.target_ms) else 1)
@@ -0,0 +1,139 @@
+# benchmarks/bench_logging.py
+"""
+Накладные расходы логирования на один update: прежний get_log_for_update
+(uuid4 + разбор update + слияние словарей на каждый вызов) против текущего
+(общий адаптер на event_type, update в contextvar, разбор после выборки).
+Логгер с теми же фильтрами, что у бота (SamplingFilter, UpdateContextFilter);
+каждый update обрабатывается в своём контексте, как задачи PTB. parsed —
+сколько раз на update разбирался контекст в текущем варианте.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_logging --updates 20000
+"""
+import argparse
+import contextvars
+import logging
+import time
+import uuid
+
+from telegram import Update
+
+import locallog.update_context as update_context
+from locallog.adapters import BotLoggerAdapter, extract_context_data
+from locallog.context import set_log, set_trace_id, set_update_context
+from locallog.sampling import SamplingFilter, parse_rules
+from locallog.update_context import UpdateContext, UpdateContextFilter
+
+UPDATE_DATA = {
+    "update_id": 1,
+    "message": {
+        "message_id": 10,
+        "date": 1700000000,
+        "text": "Привет всем, как дела?",
+        "chat": {"id": -1001, "type": "supergroup", "title": "Тестовый чат"},
+        "from": {"id": 42, "is_bot": False, "first_name": "Test", "username": "tester"},
+    },
+}
+
+
+class LegacyAdapter(logging.LoggerAdapter):
+    """Адаптер в прежнем виде: слияние трёх словарей на каждый вызов."""
+
+    def process(self, msg, kwargs):
+        call_extra = kwargs.get("extra", {})
+        combined_extra = {**self.extra, **call_extra}
+        adapter_payload = self.extra.get("payload", {})
+        call_payload = call_extra.get("payload", {})
+        combined_extra["payload"] = {**adapter_payload, **call_payload}
+        kwargs["extra"] = combined_extra
+        return msg, kwargs
+
+
+def legacy_get_log_for_update(update, event_type, logger):
+    trace_id = str(uuid.uuid4())
+    ctx = extract_context_data(update)
+    extra = {
+        "event_type": event_type,
+        "trace_id": trace_id,
+        "chat_id": ctx["chat_id"],
+        "user_id": ctx["user_id"],
+        "payload": {
+            "text": ctx["text"],
+            "username": "@" + ctx["username"],
+            "chatname": ctx["chatname"],
+            "update_type": ctx["update_type"],
+        },
+    }
+    return LegacyAdapter(logger, extra)
+
+
+ADAPTERS = {}
+
+
+def lazy_get_log_for_update(update, event_type, logger):
+    # Как locallog.adapters.get_log_for_update, но с логгером бенчмарка
+    set_trace_id()
+    set_update_context(UpdateContext(update))
+    log = ADAPTERS.get(event_type)
+    if log is None:
+        log = ADAPTERS[event_type] = BotLoggerAdapter(logger, {"event_type": event_type})
+    set_log(log)
+    return log
+
+
+def handle_update(get_log, update, logger):
+    # Типичный обработчик: пара DEBUG и одна INFO-запись с payload
+    log = get_log(update, "handle_trigger_message", logger)
+    log.debug("Поступило сообщение")
+    log.debug("Проверка категорий", extra={"payload": {"categories": 3}})
+    log.info("Сообщение обработано успешно")
+
+
+def bench(get_log, update, logger, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        # Свой контекст на update — как у задач обработки в PTB (свой trace_id и контекст update)
+        contextvars.Context().run(handle_update, get_log, update, logger)
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def make_logger(level, rules):
+    logger = logging.getLogger(f"bench_logging.{level}.{rules}")
+    logger.propagate = False
+    logger.setLevel(level)
+    if rules:
+        logger.addFilter(SamplingFilter(parse_rules(rules)))
+    logger.addFilter(UpdateContextFilter())
+    logger.addHandler(logging.NullHandler())
+    return logger
+
+
+def run(n):
+    update = Update.de_json(UPDATE_DATA, None)
+    parsed = [0]
+
+    def counting_extract(data):
+        parsed[0] += 1
+        return extract_context_data(data)
+
+    update_context.extract_context_data = counting_extract
+
+    print(f"{'scenario':<36}{'legacy us/update':>18}{'lazy us/update':>16}{'parsed':>8}")
+    for title, level, rules in (("nothing emitted (WARNING)", logging.WARNING, None),
+                                ("INFO emitted", logging.INFO, None),
+                                ("DEBUG sampled out, INFO emitted", logging.DEBUG, "*:DEBUG=0"),
+                                ("DEBUG and INFO sampled out", logging.DEBUG, "*:DEBUG=0; *:INFO=0"),
+                                ("everything emitted (DEBUG)", logging.DEBUG, None)):
+        logger = make_logger(level, rules)
+        ADAPTERS.clear()  # адаптеры привязаны к логгеру сценария
+        legacy = bench(legacy_get_log_for_update, update, logger, n)
+        parsed[0] = 0
+        lazy = bench(lazy_get_log_for_update, update, logger, n)
+        print(f"{title:<36}{legacy:>18.2f}{lazy:>16.2f}{parsed[0] / n:>8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=20000)
+    args = parser.parse_args()
+    run(args.updates)
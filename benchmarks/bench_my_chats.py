@@ -0,0 +1,137 @@
+# benchmarks/bench_my_chats.py
+"""
+Время сборки /my_chats: прежний последовательный обход всех чатов против
+поиска по индексу chat_admins + параллельного получения недостающих названий
+(fetch_chat_titles) и сборки целиком из БД на фейковом боте с задержкой API.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_my_chats --chats 200 --latency 0.05 --admin-share 0.1
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+# Бот импортируется с отдельной временной БД, чтобы не трогать triggerbot.db
+os.environ.setdefault("BOT_TOKEN", "0:bench")
+os.environ["DB_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+
+from telegram import ChatMember
+
+import bot
+from database.db import AsyncSession
+from database.models import Chat
+from permissions.store import get_managed_chats
+
+
+class FakeChat:
+    def __init__(self, chat_id):
+        self.id = chat_id
+        self.title = f"Чат {chat_id}"
+        self.type = "supergroup"
+        self.username = None
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+
+
+class FakeMember:
+    def __init__(self, status, user_id=None):
+        self.status = status
+        self.user = FakeUser(user_id)
+
+
+class FakeBot:
+    """Бот с настраиваемой задержкой API; часть чатов «зависает» дольше таймаута."""
+
+    def __init__(self, admin_chats, latency, slow_chats=(), slow_latency=30.0):
+        self.admin_chats = set(admin_chats)
+        self.latency = latency
+        self.slow_chats = set(slow_chats)
+        self.slow_latency = slow_latency
+        self.calls = 0
+
+    async def _delay(self, chat_id):
+        self.calls += 1
+        await asyncio.sleep(self.slow_latency if chat_id in self.slow_chats else self.latency)
+
+    async def get_chat_member(self, chat_id, user_id):
+        await self._delay(chat_id)
+        return FakeMember(ChatMember.ADMINISTRATOR if chat_id in self.admin_chats else ChatMember.MEMBER)
+
+    async def get_chat_administrators(self, chat_id):
+        await self._delay(chat_id)
+        return [FakeMember(ChatMember.ADMINISTRATOR, 1)] if chat_id in self.admin_chats else []
+
+    async def get_chat(self, chat_id):
+        await self._delay(chat_id)
+        return FakeChat(chat_id)
+
+
+async def legacy_collect(fake_bot, user_id, chat_ids):
+    """Прежнее поведение: по одному чату, два ожидания API на каждый админский."""
+    managed = {}
+    for chat_id in chat_ids:
+        role = (await fake_bot.get_chat_member(chat_id, user_id)).status
+        if role in [ChatMember.OWNER, ChatMember.ADMINISTRATOR]:
+            tg_chat = await fake_bot.get_chat(chat_id)
+            managed[chat_id] = (role, tg_chat.title)
+    return managed
+
+
+async def run(chats, latency, admin_share, slow, concurrency, call_timeout):
+    chat_ids = [-1000 - i for i in range(chats)]
+    admin_chats = random.sample(chat_ids, int(chats * admin_share))
+    slow_chats = random.sample(chat_ids, slow)
+
+    print(f"chats={chats} latency={latency}s admins={len(admin_chats)} slow={slow} concurrency={concurrency}")
+    if not slow:
+        fake_bot = FakeBot(admin_chats, latency)
+        start = time.perf_counter()
+        managed = await legacy_collect(fake_bot, 1, chat_ids)
+        print(f"{'sequential':<12}{time.perf_counter() - start:>8.2f}s  listed={len(managed)} calls={fake_bot.calls}")
+    else:
+        print(f"{'sequential':<12}   skipped: a slow chat blocks it for {FakeBot([], 0).slow_latency:.0f}s each")
+
+    async with AsyncSession() as session:
+        session.add_all(Chat(id=chat_id) for chat_id in chat_ids)
+        await session.commit()
+
+    # Разовое заполнение индекса (при старте бота — backfill_admin_index в фоне)
+    fake_bot = FakeBot(admin_chats, latency, slow_chats)
+    start = time.perf_counter()
+    await bot.backfill_admin_index(fake_bot, concurrency=concurrency, call_timeout=call_timeout)
+    print(f"{'backfill':<12}{time.perf_counter() - start:>8.2f}s  one-off calls={fake_bot.calls}")
+
+    # Запрос пользователя: одна выборка по индексу, к API идут только get_chat админских чатов
+    fake_bot.calls = 0
+    start = time.perf_counter()
+    managed = await get_managed_chats(1)
+    lookup = time.perf_counter() - start
+    titles, failed = await bot.fetch_chat_titles(fake_bot, [chat.id for chat, _ in managed],
+                                                 concurrency=concurrency, call_timeout=call_timeout)
+    print(f"{'indexed':<12}{time.perf_counter() - start:>8.2f}s  listed={len(managed)} failed={failed} "
+          f"calls={fake_bot.calls} lookup={lookup * 1000:.1f}ms")
+
+    # Повторный запрос: названия уже сохранены в chats, к API не идём вовсе
+    fake_bot.calls = 0
+    start = time.perf_counter()
+    text, markup = await bot.build_my_chats_reply(1, fake_bot)
+    print(f"{'from db':<12}{time.perf_counter() - start:>8.2f}s  listed={len(markup.inline_keyboard) - 1} "
+          f"calls={fake_bot.calls}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--admin-share", type=float, default=0.1)
+    parser.add_argument("--slow", type=int, default=0, help="сколько чатов отвечают дольше таймаута")
+    parser.add_argument("--concurrency", type=int, default=bot.MY_CHATS_CONCURRENCY)
+    parser.add_argument("--call-timeout", type=float, default=1.0)
+    args = parser.parse_args()
+    asyncio.run(run(args.chats, args.latency, args.admin_share, args.slow, args.concurrency, args.call_timeout))
@@ -0,0 +1,71 @@
+# benchmarks/bench_storage.py
+"""
+Сравнение скорости записи trigger_events и logs в разных профилях хранилища.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_storage --rows 2000 --batch 200
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
+
+from database.models import Base, Log, TriggerEvent
+from database.profiles import PROFILES, create_storage_engines
+
+
+def trigger_event_row(i):
+    return {"chat_id": -100 - i % 50, "user_id": i % 1000, "category_id": i % 20, "timestamp": datetime.utcnow()}
+
+
+def log_row(i):
+    return {
+        "timestamp": datetime.utcnow(), "level": "DEBUG", "event_type": "handle_trigger_message",
+        "trace_id": f"trace-{i}", "message": "Поступило сообщение", "chat_id": -100, "user_id": i % 1000,
+        "payload": {"text": "x" * 80, "username": "@user", "update_type": "message"},
+    }
+
+
+def bench_table(Session, table, make_row, rows, batch):
+    """Возвращает (строк/с по одной с commit, строк/с пачками)."""
+    start = time.perf_counter()
+    with Session() as session:
+        for i in range(rows):
+            session.execute(insert(table), [make_row(i)])
+            session.commit()
+    single = rows / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with Session() as session:
+        for offset in range(0, rows, batch):
+            session.execute(insert(table), [make_row(i) for i in range(offset, min(offset + batch, rows))])
+            session.commit()
+    batched = rows / (time.perf_counter() - start)
+    return single, batched
+
+
+def run(profile_names, rows, batch):
+    print(f"{'profile':<10}{'table':<16}{'single rows/s':>16}{'batched rows/s':>16}")
+    for name in profile_names:
+        with tempfile.TemporaryDirectory() as tmp:
+            url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+            engine, async_engine, async_read_engine = create_storage_engines(url, PROFILES[name])
+            Base.metadata.create_all(engine)
+            Session = sessionmaker(bind=engine)
+            for table, make_row in ((TriggerEvent, trigger_event_row), (Log, log_row)):
+                single, batched = bench_table(Session, table, make_row, rows, batch)
+                print(f"{name:<10}{table.__tablename__:<16}{single:>16.0f}{batched:>16.0f}")
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", nargs="*", default=list(PROFILES), choices=list(PROFILES))
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=200)
+    args = parser.parse_args()
+    run(args.profiles, args.rows, args.batch)
@@ -1,56 +1,97 @@
 # bot.py
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ChatMember
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ChatMemberHandler, MessageHandler, filters, ContextTypes
-from config import TOKEN
+from config import TOKEN, MY_CHATS_CONCURRENCY, MY_CHATS_CALL_TIMEOUT, MY_CHATS_DEADLINE
+from config import BOT_MODE, UPDATE_QUEUE_SIZE, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET, \
+    WEBHOOK_URL, WEBHOOK_MAX_CONNECTIONS
+from config import TRIGGER_MATCH_MODE, TRIGGER_MAX_REPLIES, TRIGGER_MAX_IN_FLIGHT
 from locallog.adapters import get_log_for_update
 from locallog.context import get_log
+from locallog.logger import logger, log_stats
 from language.lang import t
 from triggers.manager import TriggerManager
-from database.db import Session
+from triggers.cache import category_cache
+from triggers.counters import trigger_counter
+from triggers.events import trigger_events
+from permissions.roster import admin_roster
+from callbacks.router import callback_router
+from runtime.processor import update_processor, GatedUpdateQueue
+from runtime.webhook import WebhookServer, serve_webhook
+from runtime.outbound import outbound_scheduler
+from permissions.store import get_managed_chats, chats_without_admins
+from database.db import AsyncSession, AsyncReadSession
+from database.chat_meta import chat_metadata, chat_fields
+from database.keywords import replace_category_keywords, delete_category_keywords
 from database.models import Chat, ChatGroup, Category
+from sqlalchemy import select
 import asyncio
 
 
 
 log = get_log_for_update  # Для простоты
 
+# Один менеджер на процесс: он держит скомпилированные автоматы ключевых слов по чатам
+trigger_manager = TriggerManager(match_mode=TRIGGER_MATCH_MODE, max_replies=TRIGGER_MAX_REPLIES,
+                                 max_in_flight=TRIGGER_MAX_IN_FLIGHT)
+
 async def handle_my_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
     log = get_log_for_update(update, "my_chat_member")
     new_status = update.my_chat_member.new_chat_member.status
     chat_id = update.my_chat_member.chat.id
+    # Права бота изменились — список админов перечитаем при следующем обращении
+    admin_roster.drop(chat_id)
 
     if new_status == "administrator":
-        # Бот добавлен в чат
-        await ensure_chat_exists(chat_id)
+        # Бот добавлен в чат (или сменились его права) — заодно обновляем название/тип
+        await ensure_chat_exists(chat_id, update.my_chat_member.chat)
+        await chat_metadata.observe(update.my_chat_member.chat)
+        # Сразу загружаем админов, чтобы чат появился в /my_chats без ожидания
+        await get_user_role(context.bot, chat_id, update.my_chat_member.from_user.id)
         log.info("Бот добавлен в чат", extra={"payload": {"chat_id": chat_id}})
     elif new_status in ["left", "kicked"]:
         # Бот удалён
-        with Session() as session:
-            chat = session.get(Chat,chat_id)
+        async with AsyncSession() as session:
+            chat = await session.get(Chat,chat_id)
             if chat:
-                session.delete(chat)
-                session.commit()
+                await session.delete(chat)
+                await session.commit()
+        await admin_roster.forget_chat(chat_id)
+        chat_metadata.forget(chat_id)
+        category_cache.invalidate(chat_id)
         log.info("Бот удалён из чата", extra={"payload": {"chat_id": chat_id}})
+    else:
+        # Бот остался в чате без прав админа: настройки чата сохраняются, но в /my_chats его нет
+        await admin_roster.forget_chat(chat_id)
+        log.info("Бот лишён прав администратора", extra={"payload": {"chat_id": chat_id, "status": new_status}})
+
+
+async def handle_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Повышения/понижения/выходы участников — инкрементально обновляют список админов."""
+    member_update = update.chat_member
+    await admin_roster.apply_member_update(member_update.chat.id, member_update.new_chat_member.user.id,
+                                     member_update.new_chat_member.status, context.bot)
 
 
 
 # === ПРАВА ===
 async def get_user_role(bot, chat_id: int, user_id: int):
     try:
-        member = await bot.get_chat_member(chat_id, user_id)
-        return member.status
+        # Список админов чата держится в памяти; Telegram спрашиваем только при промахе/истечении TTL
+        return await admin_roster.get_role(bot, chat_id, user_id)
     except Exception as e:
         log_error = get_log_for_update(None, "get_user_role")
-        log_error.exception(f"Ошибка get_chat_member: {e}")
+        log_error.exception(f"Ошибка get_chat_administrators: {e}")
         return None
 
-async def ensure_chat_exists(chat_id: int):
-    with Session() as session:
-        chat = session.get(Chat,chat_id)
+async def ensure_chat_exists(chat_id: int, tg_chat=None):
+    async with AsyncSession() as session:
+        chat = await session.get(Chat,chat_id)
         if not chat:
-            chat = Chat(id=chat_id)
+            chat = Chat(id=chat_id, **(chat_fields(tg_chat) if tg_chat else {}))
             session.add(chat)
-            session.commit()
+            await session.commit()
+            category_cache.invalidate(chat_id)
+            chat_metadata.forget(chat_id)
         return chat
 
 # === /start ===
@@ -69,55 +110,95 @@ async def my_chats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(text, reply_markup=markup)
     log.info("Показан список чатов")
 
+async def resolve_chat_title(bot, chat_id: int, semaphore: asyncio.Semaphore, timeout: float):
+    """Название чата из Telegram; заодно сохраняется в chats, чтобы больше не спрашивать."""
+    async with semaphore:
+        tg_chat = await asyncio.wait_for(bot.get_chat(chat_id), timeout)
+        await chat_metadata.observe(tg_chat)
+        return tg_chat.title or f"Чат {chat_id}"
+
+
+async def fetch_chat_titles(bot, chat_ids: list,
+                            concurrency: int = MY_CHATS_CONCURRENCY,
+                            call_timeout: float = MY_CHATS_CALL_TIMEOUT,
+                            deadline: float = MY_CHATS_DEADLINE):
+    """
+    Параллельно (не больше concurrency запросов к Telegram одновременно) получает
+    названия чатов. Возвращает ({chat_id: title}, число чатов без ответа).
+    Чаты, не успевшие за call_timeout или общий deadline, в словарь не попадают.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = {asyncio.create_task(resolve_chat_title(bot, chat_id, semaphore, call_timeout)): chat_id
+             for chat_id in chat_ids}
+    if not tasks:
+        return {}, 0
+
+    done, pending = await asyncio.wait(tasks, timeout=deadline)
+    for task in pending:
+        task.cancel()
+
+    titles = {}
+    failed = len(pending)
+    for task in done:
+        if task.exception() is not None:
+            failed += 1
+        else:
+            titles[tasks[task]] = task.result()
+    return titles, failed
+
+
 async def build_my_chats_reply(user_id: int, bot):
     log = get_log()  # или контекст
     max_len = 28
     len_name = 2*round(max_len/3)
     len_group = round(max_len/3)
-    with Session() as session:
-        chats = session.query(Chat).all()
-        keyboard = []
-        for chat in chats:
-            role = await get_user_role(bot, chat.id, user_id)
-            if role in [ChatMember.OWNER, ChatMember.ADMINISTRATOR]:
-                try:
-                    tg_chat = await bot.get_chat(chat.id)
-                    chat_title = tg_chat.title or f"Чат {chat.id}"
-                except:
-                    chat_title = f"Чат {chat.id} (недоступен)"
-
-
-                display_title = (chat_title[:len_name] + "…") if len(chat_title) > len_name else chat_title
-
-                if chat.group_id:
-                    group = session.get(ChatGroup, chat.group_id)
-                    if group:
-                        display_group = (group.name[:len_group] + "…") if len(group.name) > len_group else group.name
-                        display_title += f" ({display_group})"
-                role_icon = "👑" if role == ChatMember.OWNER else "🛠️"
-                role_text = "OWN" if role == ChatMember.OWNER else "ADM"
-                display_title += f" {role_icon}{role_text}"
-                button_text = f"⠀{display_title}⠀"  # невидимые пробелы для ширины
-                keyboard.append([InlineKeyboardButton(button_text, callback_data=f"chat_settings|{chat.id}")])
-
-
-        if keyboard:
-            keyboard.append([InlineKeyboardButton(t(user_id, "my_groups_button"), callback_data="my_groups_from_menu")])
-
-        if not keyboard:
-            text = t(user_id, "no_chats")
-            markup = None
-        else:
-            text = t(user_id, "your_chats")
-            markup = InlineKeyboardMarkup(keyboard)
+    # Чаты пользователя — одним запросом по индексу chat_admins.user_id, без обхода всех чатов
+    managed = await get_managed_chats(user_id)
+    group_ids = {chat.group_id for chat, _ in managed if chat.group_id}
+    group_names = {}
+    if group_ids:
+        async with AsyncReadSession() as session:
+            groups = await session.scalars(select(ChatGroup).where(ChatGroup.id.in_(group_ids)))
+            group_names = {group.id: group.name for group in groups}
+
+    # Названия берутся из БД; к Telegram — только для чатов, записанных до появления колонки title
+    titles, failed = await fetch_chat_titles(bot, [chat.id for chat, _ in managed if chat.title is None])
+    if failed and log:
+        log.warning("Часть чатов не ответила, названия недоступны",
+                    extra={"payload": {"failed": failed, "total": len(managed)}})
 
+    keyboard = []
+    for chat, role in managed:
+        chat_title = chat.title or titles.get(chat.id, f"Чат {chat.id} (недоступен)")
+
+        display_title = (chat_title[:len_name] + "…") if len(chat_title) > len_name else chat_title
+
+        group_name = group_names.get(chat.group_id)
+        if group_name:
+            display_group = (group_name[:len_group] + "…") if len(group_name) > len_group else group_name
+            display_title += f" ({display_group})"
+        role_icon = "👑" if role == ChatMember.OWNER else "🛠️"
+        role_text = "OWN" if role == ChatMember.OWNER else "ADM"
+        display_title += f" {role_icon}{role_text}"
+        button_text = f"⠀{display_title}⠀"  # невидимые пробелы для ширины
+        keyboard.append([InlineKeyboardButton(button_text, callback_data=callback_router.build("chat_settings", chat.id))])
+
+    if keyboard:
+        keyboard.append([InlineKeyboardButton(t(user_id, "my_groups_button"), callback_data=callback_router.build("my_groups_from_menu"))])
+
+    if not keyboard:
+        text = t(user_id, "no_chats")
+        markup = None
+    else:
+        text = t(user_id, "your_chats")
+        markup = InlineKeyboardMarkup(keyboard)
 
-        return text, markup
+    return text, markup
 
 
-def get_user_groups(user_id: int):
-    with Session() as session:
-        return session.query(ChatGroup).filter_by(owner_id=user_id).all()
+async def get_user_groups(user_id: int):
+    async with AsyncReadSession() as session:
+        return (await session.scalars(select(ChatGroup).filter_by(owner_id=user_id))).all()
 
 # === /my_groups ===
 async def my_groups(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -125,7 +206,7 @@ async def my_groups(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     log.info("Запрос списка групп", extra={"payload": {"user_id": user_id}})
 
-    groups = get_user_groups(user_id)
+    groups = await get_user_groups(user_id)
 
     if not groups:
         await update.message.reply_text(t(user_id, "no_groups"))
@@ -133,11 +214,11 @@ async def my_groups(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     keyboard = [
-        [InlineKeyboardButton(group.name, callback_data=f"view_group|{group.id}")]
+        [InlineKeyboardButton(group.name, callback_data=callback_router.build("view_group", group.id))]
         for group in groups
     ]
 
-    keyboard.append([InlineKeyboardButton(t(user_id, "back"), callback_data="back_to_my_chats")])
+    keyboard.append([InlineKeyboardButton(t(user_id, "back"), callback_data=callback_router.build("back_to_my_chats"))])
 
     markup = InlineKeyboardMarkup(keyboard)
 
@@ -173,15 +254,15 @@ async def back_to_my_groups(update: Update, context: ContextTypes.DEFAULT_TYPE):
     log = get_log_for_update(update, "back_to_my_groups")
     user_id = query.from_user.id
 
-    with Session() as session:
-        groups = session.query(ChatGroup).filter_by(owner_id=user_id).all()
+    async with AsyncReadSession() as session:
+        groups = (await session.scalars(select(ChatGroup).filter_by(owner_id=user_id))).all()
 
     if not groups:
         await query.edit_message_text(t(user_id, "no_groups"))
         return
 
     keyboard = [
-        [InlineKeyboardButton(group.name, callback_data=f"view_group|{group.id}")]
+        [InlineKeyboardButton(group.name, callback_data=callback_router.build("view_group", group.id))]
         for group in groups
     ]
     markup = InlineKeyboardMarkup(keyboard)
@@ -191,47 +272,49 @@ async def back_to_my_groups(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 # === view_group_callback ===
-async def view_group_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def view_group_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, group_id: int):
     query = update.callback_query
     await query.answer()
     log = get_log_for_update(update, "view_group")
     user_id = query.from_user.id
-    group_id = int(query.data.split("|")[1])
 
-    with Session() as session:
-        group = session.get(ChatGroup, group_id)
-        if not group:
-            await query.edit_message_text(t(user_id, "group_not_found"))
-            return
+    # Сессия закрывается до обращений к Telegram: соединение пула не ждёт сеть
+    async with AsyncReadSession() as session:
+        group = await session.get(ChatGroup, group_id)
+        chats = []
+        if group and group.owner_id == user_id:
+            chats = (await session.scalars(select(Chat).filter_by(group_id=group_id))).all()
 
-        if group.owner_id != user_id:
-            await query.edit_message_text(t(user_id, "group_no_access"))
-            log.warning("Попытка просмотра чужой группы", extra={"payload": {"user_id": user_id, "group_id": group_id}})
-            return
+    if not group:
+        await query.edit_message_text(t(user_id, "group_not_found"))
+        return
 
-        chats = session.query(Chat).filter_by(group_id=group_id).all()
-        text = t(user_id, "group_chats_list", name=group.name)
-        if not chats:
-            text += "\n" + t(user_id, "group_chats_empty")
-        else:
-            for chat in chats:
-                text += f"\n• {chat.id}"
+    if group.owner_id != user_id:
+        await query.edit_message_text(t(user_id, "group_no_access"))
+        log.warning("Попытка просмотра чужой группы", extra={"payload": {"user_id": user_id, "group_id": group_id}})
+        return
 
-        keyboard = [[InlineKeyboardButton(t(user_id, "back"), callback_data="back_to_my_groups")]]
-        markup = InlineKeyboardMarkup(keyboard)
+    text = t(user_id, "group_chats_list", name=group.name)
+    if not chats:
+        text += "\n" + t(user_id, "group_chats_empty")
+    else:
+        for chat in chats:
+            text += f"\n• {chat.title or chat.id}"
 
-        await query.edit_message_text(text, reply_markup=markup)
-        log.info("Просмотр содержимого группы", extra={"payload": {"group_id": group_id, "chat_count": len(chats)}})
+    keyboard = [[InlineKeyboardButton(t(user_id, "back"), callback_data=callback_router.build("back_to_my_groups"))]]
+    markup = InlineKeyboardMarkup(keyboard)
+
+    await query.edit_message_text(text, reply_markup=markup)
+    log.info("Просмотр содержимого группы", extra={"payload": {"group_id": group_id, "chat_count": len(chats)}})
 
 
 
 # === chat_settings ===
-async def chat_settings_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def chat_settings_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int):
     query = update.callback_query
     await query.answer()
     log = get_log_for_update(update, "chat_settings")
     user_id = query.from_user.id
-    chat_id = int(query.data.split("|")[1])
     bot = context.bot
 
 
@@ -241,29 +324,19 @@ async def chat_settings_callback(update: Update, context: ContextTypes.DEFAULT_T
         log.warning("Попытка доступа без прав", extra={"payload": {"chat_id": chat_id, "user_id": user_id}})
         return
 
-    chat_title = context.user_data.get("chat_title")
-    if chat_title is None:
-        try:
-            tg_chat = await bot.get_chat(chat_id)
-            chat_title = tg_chat.title or f"Чат {chat_id}"
-        except:
-            chat_title = f"Чат {chat_id} (недоступен)"
-    else:
-        await back_to_my_chats(update,context)
-        return
-
-    await ensure_chat_exists(chat_id)
+    chat = await ensure_chat_exists(chat_id)
+    chat_title = chat.title or f"Чат {chat_id}"
     keyboard = []
 
     role_text = "OWNER" if role == ChatMember.OWNER else "ADMIN"
 
     if role == ChatMember.OWNER:
-        keyboard.append([InlineKeyboardButton(t(user_id, "create_group"), callback_data=f"create_group|{chat_id}")])
-        keyboard.append([InlineKeyboardButton(t(user_id, "assign_group"), callback_data=f"1|{chat_id}")])
-        keyboard.append([InlineKeyboardButton(t(user_id, "group_categories"), callback_data=f"group_cats|{chat_id}")])
+        keyboard.append([InlineKeyboardButton(t(user_id, "create_group"), callback_data=callback_router.build("create_group", chat_id))])
+        keyboard.append([InlineKeyboardButton(t(user_id, "assign_group"), callback_data=callback_router.build("assign_group", chat_id))])
+        keyboard.append([InlineKeyboardButton(t(user_id, "group_categories"), callback_data=callback_router.build("group_cats", chat_id))])
 
-    keyboard.append([InlineKeyboardButton(t(user_id, "local_categories"), callback_data=f"local_cats|{chat_id}")])
-    keyboard.append([InlineKeyboardButton(t(user_id, "back"), callback_data="back_to_my_chats")])
+    keyboard.append([InlineKeyboardButton(t(user_id, "local_categories"), callback_data=callback_router.build("local_cats", chat_id))])
+    keyboard.append([InlineKeyboardButton(t(user_id, "back"), callback_data=callback_router.build("back_to_my_chats"))])
 
     reply_markup = InlineKeyboardMarkup(keyboard)
     await query.edit_message_text(
@@ -273,63 +346,63 @@ async def chat_settings_callback(update: Update, context: ContextTypes.DEFAULT_T
     log.info("Открыты настройки чата", extra={"payload": {"chat_id": chat_id,"chat_title": chat_title,"role": role_text}})
 
 # === assign_group_callback ===
-async def assign_group_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def assign_group_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int):
     query = update.callback_query
     await query.answer()
     log = get_log_for_update(update, "assign_group")
     user_id = query.from_user.id
-    chat_id = int(query.data.split("|")[1])
 
     if await get_user_role(context.bot, chat_id, user_id) != ChatMember.OWNER:
         await query.edit_message_text(t(user_id, "only_owner"))
         log.warning("Попытка привязки группы без прав", extra={"payload": {"user_id": user_id, "chat_id": chat_id}})
         return
 
-    with Session() as session:
-        chat =  session.query(chat_id)
-        groups = session.query(ChatGroup).filter_by(owner_id=user_id).all()
-        if not groups:
-            await query.edit_message_text(t(user_id, "no_groups_for_assign"))
-            return
-        keyboard = []
-        for group in groups:
-            marker = "✅ " if chat.group_id == group.id else ""
-            keyboard.append([InlineKeyboardButton(f"{marker}{group.name}",
-                                                  callback_data=f"assign_group_confirm|{chat_id}|{group.id}")])
+    async with AsyncReadSession() as session:
+        chat = await session.get(Chat, chat_id)
+        groups = (await session.scalars(select(ChatGroup).filter_by(owner_id=user_id))).all()
 
-        keyboard.append([InlineKeyboardButton(t(user_id, "back"), callback_data=f"chat_settings|{chat_id}")])
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(t(user_id, "choose_group_to_assign"), reply_markup=reply_markup)
-        log.info("Выбор группы для привязки", extra={"payload": {"chat_id": chat_id}})
+    if not groups:
+        await query.edit_message_text(t(user_id, "no_groups_for_assign"))
+        return
+    keyboard = []
+    for group in groups:
+        marker = "✅ " if chat and chat.group_id == group.id else ""
+        keyboard.append([InlineKeyboardButton(f"{marker}{group.name}",
+                                              callback_data=callback_router.build("assign_group_confirm", chat_id, group.id))])
+
+    keyboard.append([InlineKeyboardButton(t(user_id, "back"), callback_data=callback_router.build("chat_settings", chat_id))])
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    await query.edit_message_text(t(user_id, "choose_group_to_assign"), reply_markup=reply_markup)
+    log.info("Выбор группы для привязки", extra={"payload": {"chat_id": chat_id}})
 
 
 # === assign_group_confirm_callback ===
-async def assign_group_confirm_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def assign_group_confirm_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int, group_id: int):
     query = update.callback_query
     await query.answer()
     log = get_log_for_update(update, "assign_group_confirm")
-    _, chat_id, group_id = query.data.split("|")
-    chat_id = int(chat_id)
-    group_id = int(group_id)
     user_id = query.from_user.id
     group_name = ""
     if await get_user_role(context.bot, chat_id, user_id) != ChatMember.OWNER:
         await query.edit_message_text(t(user_id, "only_owner"))
         return
 
-    with Session() as session:
-        chat = session.get(Chat, chat_id)
-        group = session.get(ChatGroup, group_id)
-        if not chat or not group:
-            await query.edit_message_text(t(user_id, "assign_error_not_found"))
-            return
-
-        chat.group_id = group_id
-        group_name = group.name
-        session.commit()
+    # Транзакция закрывается до ответа в Telegram: единственное соединение писателя не ждёт сеть
+    async with AsyncSession() as session:
+        chat = await session.get(Chat, chat_id)
+        group = await session.get(ChatGroup, group_id)
+        if chat and group:
+            chat.group_id = group_id
+            group_name = group.name
+            await session.commit()
+
+    if not chat or not group:
+        await query.edit_message_text(t(user_id, "assign_error_not_found"))
+        return
+    category_cache.invalidate(chat_id)
 
     keyboard=[]
-    keyboard.append([InlineKeyboardButton(t(user_id, "back"), callback_data=f"chat_settings|{chat_id}")])
+    keyboard.append([InlineKeyboardButton(t(user_id, "back"), callback_data=callback_router.build("chat_settings", chat_id))])
     reply_markup = InlineKeyboardMarkup(keyboard)
     await query.edit_message_text(t(user_id, "chat_assigned_to_group", name=group_name), reply_markup=reply_markup)
     log.info("Чат привязан к группе", extra={"payload": {"chat_id": chat_id, "group_id": group_id}})
@@ -337,12 +410,11 @@ async def assign_group_confirm_callback(update: Update, context: ContextTypes.DE
 
 
 # === create_group ===
-async def create_group_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def create_group_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int):
     query = update.callback_query
     await query.answer()
     log = get_log_for_update(update, "create_group")
     user_id = query.from_user.id
-    chat_id = int(query.data.split("|")[1])
 
     if await get_user_role(context.bot, chat_id, user_id) != ChatMember.OWNER:
         await query.edit_message_text(t(user_id, "only_owner"))
@@ -378,19 +450,20 @@ async def handle_text_private(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
 
     keyboard = []
-    keyboard.append([InlineKeyboardButton(t(user_id, "back"), callback_data=f"chat_settings|{chat_id}")])
+    keyboard.append([InlineKeyboardButton(t(user_id, "back"), callback_data=callback_router.build("chat_settings", chat_id))])
     reply_markup = InlineKeyboardMarkup(keyboard)
 
     try:
-        with Session() as session:
+        async with AsyncSession() as session:
             group = ChatGroup(name=name, owner_id=user_id)
             session.add(group)
-            session.commit()
-            chat = session.get(Chat,chat_id)
+            await session.commit()
+            chat = await session.get(Chat,chat_id)
             chat.group_id = group.id
-            session.commit()
-            log.info("Группа создана", extra={"payload": {"name": name, "group_id": group.id, "chat_id": chat_id}})
-            await update.message.reply_text(t(user_id, "group_created", name=name),reply_markup=reply_markup)
+            await session.commit()
+        category_cache.invalidate(chat_id)
+        log.info("Группа создана", extra={"payload": {"name": name, "group_id": group.id, "chat_id": chat_id}})
+        await update.message.reply_text(t(user_id, "group_created", name=name),reply_markup=reply_markup)
 
     except Exception as e:
         await update.message.reply_text(t(user_id, "error_creating_group"),reply_markup=reply_markup)
@@ -402,12 +475,7 @@ async def back_to_my_chats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     log = get_log_for_update(update, "back_to_my_chats")
     user_id = update.effective_user.id
 
-    try:
-        from_chat_title = context.user_data.pop("chat_title")
-    except:
-        from_chat_title = None
-
-    log.info("Запрос списка чатов", extra={"payload": {"user_id": user_id,"return_from": from_chat_title}})
+    log.info("Запрос списка чатов", extra={"payload": {"user_id": user_id}})
 
     query = update.callback_query
     await query.answer()
@@ -425,66 +493,60 @@ async def back_to_my_chats(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def build_categories_reply(chat_id: int, user_id: int, bot, is_group: bool = False):
     log = get_log()
 
-    with Session() as session:
-        categories = []
-        if is_group:
-            chat = session.get(Chat, chat_id)
-            if chat and chat.group_id:
-                categories = session.query(Category).filter(Category.group_id == chat.group_id).all()
-            title_key = "group_categories_title"
-            add_key = "add_group_category"
-        else:
-            categories = session.query(Category).filter(Category.chat_id == chat_id).all()
-            title_key = "local_categories_title"
-            add_key = "add_local_category"
+    # Наборы категорий чата — из кэша (тот же материализованный вид, что и для триггеров)
+    view = await category_cache.get(chat_id)
+    if is_group:
+        categories = view.group if view else []
+        title_key = "group_categories_title"
+        add_key = "add_group_category"
+    else:
+        categories = view.local if view else []
+        title_key = "local_categories_title"
+        add_key = "add_local_category"
 
-        keyboard = []
-        for cat in categories:
+    keyboard = []
+    for cat in categories:
+        keywords = cat.keywords or ""
+        response = cat.response or ""
+        preview = f"{cat.name} → {keywords} → {response}"
+        # owner_id для аудита (опционально в preview)
+        if cat.owner_id:
+            preview += f" (создатель: {cat.owner_id})"
+
+        keyboard.append([InlineKeyboardButton(preview, callback_data=callback_router.build("noop"))])
+
+        row = []
+        row.append(InlineKeyboardButton(t(user_id, "edit"), callback_data=callback_router.build(f"{'group' if is_group else 'local'}_edit_cat", cat.id, chat_id)))
+        row.append(InlineKeyboardButton(t(user_id, "delete"), callback_data=callback_router.build(f"{'group' if is_group else 'local'}_delete_cat", cat.id, chat_id)))
+        keyboard.append(row)
+
+    # Групповые в локальных
+    if not is_group and view and view.group:
+        keyboard.append(
+            [InlineKeyboardButton(t(user_id, "group_categories_from_group"), callback_data=callback_router.build("noop"))])
+        local_names = {c.name for c in categories}
+        for cat in view.group:
             keywords = cat.keywords or ""
             response = cat.response or ""
-            preview = f"{cat.name} → {keywords} → {response}"
-            # owner_id для аудита (опционально в preview)
-            if cat.owner_id:
-                preview += f" (создатель: {cat.owner_id})"
-
-            keyboard.append([InlineKeyboardButton(preview, callback_data="noop")])
-
-            row = []
-            row.append(InlineKeyboardButton(t(user_id, "edit"), callback_data=f"{'group' if is_group else 'local'}_edit_cat|{cat.id}|{chat_id}"))
-            row.append(InlineKeyboardButton(t(user_id, "delete"), callback_data=f"{'group' if is_group else 'local'}_delete_cat|{cat.id}|{chat_id}"))
-            keyboard.append(row)
-
-        # Групповые в локальных
-        chat = session.get(Chat, chat_id)
-        if not is_group and chat.group_id:
-            group_cats = session.query(Category).filter(Category.group_id == chat.group_id).all()
-            if group_cats:
-                keyboard.append(
-                    [InlineKeyboardButton(t(user_id, "group_categories_from_group"), callback_data="noop")])
-                for cat in group_cats:
-                    keywords = cat.keywords or ""
-                    response = cat.response or ""
-                    preview = f"{cat.name} → {keywords} → {response} (групповая)"
-                    local_override = any(c.name == cat.name for c in categories)
-                    if local_override:
-                        preview += " [переопределена]"
-                    keyboard.append([InlineKeyboardButton(preview, callback_data="noop")])
-
-        keyboard.append([InlineKeyboardButton(t(user_id, add_key),
-                                                  callback_data=f"{'group' if is_group else 'local'}_add_cat|{chat_id}")])
-        keyboard.append([InlineKeyboardButton(t(user_id, "back"), callback_data=f"chat_settings|{chat_id}")])
-
-        text = t(user_id, title_key)
-        markup = InlineKeyboardMarkup(keyboard)
-        return text, markup
+            preview = f"{cat.name} → {keywords} → {response} (групповая)"
+            if cat.name in local_names:
+                preview += " [переопределена]"
+            keyboard.append([InlineKeyboardButton(preview, callback_data=callback_router.build("noop"))])
+
+    keyboard.append([InlineKeyboardButton(t(user_id, add_key),
+                                              callback_data=callback_router.build(f"{'group' if is_group else 'local'}_add_cat", chat_id))])
+    keyboard.append([InlineKeyboardButton(t(user_id, "back"), callback_data=callback_router.build("chat_settings", chat_id))])
+
+    text = t(user_id, title_key)
+    markup = InlineKeyboardMarkup(keyboard)
+    return text, markup
 
 # === Локальные категории ===
-async def local_cats_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def local_cats_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int):
     query = update.callback_query
     await query.answer()
     log = get_log_for_update(update, "local_cats")
     user_id = query.from_user.id
-    chat_id = int(query.data.split("|")[1])
 
     role = await get_user_role(context.bot, chat_id, user_id)
     if role not in [ChatMember.OWNER, ChatMember.ADMINISTRATOR]:
@@ -496,12 +558,11 @@ async def local_cats_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
     log.info("Открыты локальные категории", extra={"payload": {"chat_id": chat_id}})
 
 # === Групповые категории ===
-async def group_cats_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def group_cats_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int):
     query = update.callback_query
     await query.answer()
     log = get_log_for_update(update, "group_cats")
     user_id = query.from_user.id
-    chat_id = int(query.data.split("|")[1])
 
     if await get_user_role(context.bot, chat_id, user_id) != ChatMember.OWNER:
         await query.edit_message_text(t(user_id, "only_owner"))
@@ -512,14 +573,11 @@ async def group_cats_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
     log.info("Открыты групповые категории", extra={"payload": {"chat_id": chat_id}})
 
 # === Добавление категории ===
-async def add_category_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def add_category_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int, is_group: bool):
     query = update.callback_query
     await query.answer()
     log = get_log_for_update(update, "add_category")
     user_id = query.from_user.id
-    data = query.data.split("|")
-    is_group = data[0].startswith("group")
-    chat_id = int(data[1])
 
     role = await get_user_role(context.bot, chat_id, user_id)
     if role != ChatMember.OWNER and not is_group:
@@ -539,15 +597,11 @@ async def add_category_callback(update: Update, context: ContextTypes.DEFAULT_TY
     log.info("Ожидание имени категории", extra={"payload": {"chat_id": chat_id, "is_group": is_group}})
 
 # === Редактирование категории ===
-async def edit_category_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def edit_category_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, cat_id: int, chat_id: int, is_group: bool):
     log = get_log_for_update(update, "edit_category_callback")
 
     query = update.callback_query
     await query.answer()
-    data = query.data.split("|")
-    is_group = data[0].startswith("group")
-    cat_id = int(data[1])
-    chat_id = int(data[2])
     user_id = query.from_user.id
 
     role = await get_user_role(context.bot, chat_id, user_id)
@@ -555,34 +609,31 @@ async def edit_category_callback(update: Update, context: ContextTypes.DEFAULT_T
         await query.edit_message_text(t(user_id, "only_owner"))
         return
 
-    with Session() as session:
-        cat = session.get(Category, cat_id)
-        if not cat or (is_group and cat.group_id is None) or (not is_group and cat.chat_id != chat_id):
-            await query.edit_message_text(t(user_id, "category_not_found"))
-            return
+    async with AsyncReadSession() as session:
+        cat = await session.get(Category, cat_id)
 
-        context.user_data["awaiting_category"] = {
-            "cat_id": cat_id,
-            "chat_id": chat_id,
-            "is_group": is_group,
-            "step": "name",
-            "old_name": cat.name,
-            "old_keywords": cat.keywords,
-            "old_response": cat.response
-        }
+    if not cat or (is_group and cat.group_id is None) or (not is_group and cat.chat_id != chat_id):
+        await query.edit_message_text(t(user_id, "category_not_found"))
+        return
+
+    context.user_data["awaiting_category"] = {
+        "cat_id": cat_id,
+        "chat_id": chat_id,
+        "is_group": is_group,
+        "step": "name",
+        "old_name": cat.name,
+        "old_keywords": cat.keywords,
+        "old_response": cat.response
+    }
 
     await query.edit_message_text(t(user_id, "enter_category_name_edit", old_name=cat.name))
     log.info("Редактирование категории", extra={"payload": {"cat_id": cat_id}})
 
 # === Удаление категории ===
-async def delete_category_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def delete_category_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, cat_id: int, chat_id: int, is_group: bool):
     log = get_log_for_update(update, "delete_category_callback")
     query = update.callback_query
     await query.answer()
-    data = query.data.split("|")
-    is_group = data[0].startswith("group")
-    cat_id = int(data[1])
-    chat_id = int(data[2])
     user_id = query.from_user.id
 
     role = await get_user_role(context.bot, chat_id, user_id)
@@ -590,11 +641,13 @@ async def delete_category_callback(update: Update, context: ContextTypes.DEFAULT
         await query.edit_message_text(t(user_id, "only_owner"))
         return
 
-    with Session() as session:
-        cat = session.get(Category, cat_id)
+    async with AsyncSession() as session:
+        cat = await session.get(Category, cat_id)
         if cat:
-            session.delete(cat)
-            session.commit()
+            await delete_category_keywords(session, cat.id)
+            await session.delete(cat)
+            await session.commit()
+            category_cache.invalidate_category(cat)
     text, markup = await build_categories_reply(chat_id, user_id, context.bot, is_group=is_group)
     await query.edit_message_text(text, reply_markup=markup)
     log.info("Категория удалена", extra={"payload": {"cat_id": cat_id}})
@@ -635,11 +688,13 @@ async def handle_category_input(update: Update, context: ContextTypes.DEFAULT_TY
         is_group = state["is_group"]
 
         try:
-            with Session() as session:
-                chat = session.get(Chat, chat_id)
+            async with AsyncSession() as session:
+                chat = await session.get(Chat, chat_id)
 
                 if "cat_id" in state:
-                    cat = session.get(Category, state["cat_id"])
+                    cat = await session.get(Category, state["cat_id"])
+                    # Сбрасываем кэш и для прежнего уровня категории
+                    category_cache.invalidate_category(cat)
                 else:
                     cat = Category()
                     session.add(cat)
@@ -653,7 +708,11 @@ async def handle_category_input(update: Update, context: ContextTypes.DEFAULT_TY
                 else:
                     cat.chat_id = chat_id
                     cat.group_id = None
-                session.commit()
+                # Рабочая копия слов — в category_keywords (новой категории нужен id)
+                await session.flush()
+                await replace_category_keywords(session, cat.id, state["keywords"])
+                await session.commit()
+                category_cache.invalidate_category(cat)
             await update.message.reply_text(t(user_id, "category_saved"))
             log.info("Категория сохранена", extra={"payload": {"name": state["name"], "chat_id": chat_id, "is_group": is_group}})
         except Exception as e:
@@ -681,56 +740,137 @@ async def handle_trigger_message_chats(update: Update, context: ContextTypes.DEF
         if not update.message or not update.message.text:
             return  # пропускаем не-текстовые сообщения
 
-        # Проверяем, зарегистрирован ли чат в базе
-        with Session() as session:
-            chat = session.get(Chat, update.message.chat.id)
-            if not chat:
-                log.debug("Сообщение из неучтённого чата, пропускаем",
-                          extra={"payload": {"chat_id": update.message.chat.id}})
-                return
+        # Название/тип чата пишутся в БД только при изменении и только для учтённых чатов.
+        # Кэш категорий читает строку чата и засевает ею chat_metadata, дальше — попадание в память
+        if await category_cache.get(update.message.chat.id) is not None:
+            await chat_metadata.observe(update.message.chat)
 
-        # Обработка триггеров
-        manager = TriggerManager()
-        await manager.process_message(update.message, context.bot)
+        # Обработка триггеров (неучтённые чаты отсекаются по кэшу категорий)
+        await trigger_manager.process_message(update.message, context.bot)
 
     except Exception as e:
         log.exception("Ошибка при обработке сообщения", extra={"payload": {"error": str(e)}})
 
 
 
+# === Жизненный цикл ===
+async def on_startup(app: Application):
+    # Окна счётчиков срабатываний восстанавливаются из недавних trigger_events
+    restored = await trigger_counter.rebuild()
+    logger.info("Счётчики триггеров восстановлены", extra={"event_type": "startup", "payload": {"events": restored}})
+    # Чаты, для которых ещё нет записей в chat_admins, дозаполняем в фоне.
+    # post_init вызывается до app.start(), поэтому задача своя, а не app.create_task
+    app.bot_data["backfill_task"] = asyncio.create_task(backfill_admin_index(app.bot))
+
+
+async def backfill_admin_index(bot, concurrency: int = MY_CHATS_CONCURRENCY,
+                               call_timeout: float = MY_CHATS_CALL_TIMEOUT):
+    """
+    Загружает списки админов для чатов, которых ещё нет в chat_admins (БД до
+    появления индекса). Чаты, где бот без прав, строк не получают и
+    перепроверяются при следующем запуске.
+    """
+    chat_ids = await chats_without_admins()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def load(chat_id):
+        async with semaphore:
+            try:
+                await asyncio.wait_for(admin_roster.get_roster(bot, chat_id), call_timeout)
+                return True
+            except Exception:
+                return False
+
+    results = await asyncio.gather(*(load(chat_id) for chat_id in chat_ids))
+    logger.info("Индекс админов дозаполнен", extra={"event_type": "startup",
+                "payload": {"chats": len(chat_ids), "failed": results.count(False)}})
+
+
+async def on_stop(app: Application):
+    # Update'ы дообработаны, бот и планировщик исходящих ещё работают — отправляем ответы в пути
+    await trigger_manager.close()
+
+
+async def on_shutdown(app: Application):
+    backfill = app.bot_data.pop("backfill_task", None)
+    if backfill is not None and not backfill.done():
+        backfill.cancel()
+    # Дописываем буфер trigger_events перед выходом
+    await trigger_events.close()
+    await trigger_counter.close()
+    # dropped — события, отброшенные при переполнении очереди из-за ошибок записи
+    logger.info("Буфер событий триггеров сброшен", extra={"event_type": "shutdown", "payload": trigger_events.stats()})
+    logger.info("Статистика логирования", extra={"event_type": "shutdown", "payload": log_stats()})
+    logger.info("Статистика обработки update'ов", extra={"event_type": "shutdown", "payload": update_processor.stats()})
+    logger.info("Статистика исходящих", extra={"event_type": "shutdown", "payload": outbound_scheduler.stats()})
+    logger.info("Подавленные ответы триггеров", extra={"event_type": "shutdown", "payload": trigger_manager.cooldown.stats()})
+    logger.info("Фоновые ответы триггеров", extra={"event_type": "shutdown", "payload": trigger_manager.stats()})
+    # fuzzy_over_budget — сообщения, где нечёткий поиск оборван пределом TRIGGER_FUZZY_MAX_CANDIDATES
+    logger.info("Кэш категорий", extra={"event_type": "shutdown", "payload": category_cache.stats()})
+
+
+# === Кнопки ===
+def register_callbacks(router):
+    router.add("back_to_my_chats", back_to_my_chats)
+    router.add("chat_settings", chat_settings_callback, int)
+
+    router.add("view_group", view_group_callback, int)
+    router.add("back_to_my_groups", back_to_my_groups)
+    router.add("my_groups_from_menu", my_groups_from_menu)
+
+    router.add("create_group", create_group_callback, int)
+    router.add("assign_group", assign_group_callback, int, aliases=("1",))  # "1|..." — кнопки старого формата
+    router.add("assign_group_confirm", assign_group_confirm_callback, int, int)
+
+    router.add("local_cats", local_cats_callback, int)
+    router.add("group_cats", group_cats_callback, int)
+    router.add("local_add_cat", add_category_callback, int, is_group=False)
+    router.add("group_add_cat", add_category_callback, int, is_group=True)
+    router.add("local_edit_cat", edit_category_callback, int, int, is_group=False)
+    router.add("group_edit_cat", edit_category_callback, int, int, is_group=True)
+    router.add("local_delete_cat", delete_category_callback, int, int, is_group=False)
+    router.add("group_delete_cat", delete_category_callback, int, int, is_group=True)
+    router.add("noop", noop_callback)
+
+
+# Маршруты нужны уже при сборке меню (callback_router.build), поэтому регистрируются при импорте
+register_callbacks(callback_router)
+
+
 # === main ===
 def main():
-    app = Application.builder().token(TOKEN).build()
+    if BOT_MODE not in ("polling", "webhook"):
+        raise ValueError(f"Неизвестный BOT_MODE: {BOT_MODE} (polling | webhook)")
+    # Чаты обрабатываются параллельно, update'ы одного чата — по порядку (runtime/processor.py).
+    # Очередь не отдаёт update'ы насыщенному процессору (UPDATE_MAX_PENDING), а сама ограничена
+    # UPDATE_QUEUE_SIZE — это бэкпрешер: polling ждёт, webhook отвечает 503
+    app = (Application.builder().token(TOKEN).concurrent_updates(update_processor)
+           .update_queue(GatedUpdateQueue(update_processor, maxsize=UPDATE_QUEUE_SIZE))
+           .rate_limiter(outbound_scheduler)  # все исходящие — через лимиты Telegram (runtime/outbound.py)
+           .post_init(on_startup).post_stop(on_stop).post_shutdown(on_shutdown).build())
 
     app.add_handler(CommandHandler("start", start,filters=filters.ChatType.PRIVATE))
     app.add_handler(CommandHandler("my_chats", my_chats,filters=filters.ChatType.PRIVATE))
     app.add_handler(CommandHandler("my_groups", my_groups,filters=filters.ChatType.PRIVATE))
 
-    app.add_handler(CallbackQueryHandler(back_to_my_chats, pattern=r"^back_to_my_chats$"))
-    app.add_handler(CallbackQueryHandler(chat_settings_callback, pattern=r"^chat_settings\|"))
-
-    app.add_handler(CallbackQueryHandler(view_group_callback, pattern=r"^view_group\|"))
-    app.add_handler(CallbackQueryHandler(back_to_my_groups, pattern=r"^back_to_my_groups$"))
-    app.add_handler(CallbackQueryHandler(my_groups_from_menu, pattern=r"^my_groups_from_menu$"))
-
-    app.add_handler(CallbackQueryHandler(create_group_callback, pattern=r"^create_group\|"))
-    app.add_handler(CallbackQueryHandler(assign_group_callback, pattern=r"^1\|"))  # старое поведение assign_group
-    app.add_handler(CallbackQueryHandler(assign_group_confirm_callback, pattern=r"^assign_group_confirm\|"))
-
-    app.add_handler(CallbackQueryHandler(local_cats_callback, pattern=r"^local_cats\|"))
-    app.add_handler(CallbackQueryHandler(group_cats_callback, pattern=r"^group_cats\|"))
-    app.add_handler(CallbackQueryHandler(add_category_callback, pattern=r"^(local|group)_add_cat\|"))
-    app.add_handler(CallbackQueryHandler(edit_category_callback, pattern=r"^(local|group)_edit_cat\|"))
-    app.add_handler(CallbackQueryHandler(delete_category_callback, pattern=r"^(local|group)_delete_cat\|"))
-    app.add_handler(CallbackQueryHandler(noop_callback, pattern=r"^noop$"))
+    # Все кнопки — через один обработчик с таблицей действий (см. register_callbacks)
+    app.add_handler(CallbackQueryHandler(callback_router.dispatch))
 
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND & filters.ChatType.GROUPS, handle_trigger_message_chats))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND & filters.ChatType.PRIVATE, handle_text_private))
     app.add_handler(ChatMemberHandler(handle_my_chat_member, ChatMemberHandler.MY_CHAT_MEMBER))
+    app.add_handler(ChatMemberHandler(handle_chat_member, ChatMemberHandler.CHAT_MEMBER))
 
 
+    if BOT_MODE == "webhook":
+        server = WebhookServer(app, WEBHOOK_SECRET, host=WEBHOOK_LISTEN, port=WEBHOOK_PORT, path=WEBHOOK_PATH)
+        print("Бот запущен (webhook)...")
+        asyncio.run(serve_webhook(app, server, WEBHOOK_URL, WEBHOOK_MAX_CONNECTIONS))
+        return
+
     print("Бот запущен...")
-    app.run_polling()
+    # chat_member не приходит без явного allowed_updates
+    app.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
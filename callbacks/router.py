@@ -0,0 +1,100 @@
+# callbacks/router.py
+from locallog.logger import logger
+
+SEPARATOR = "|"
+VERSION_MARK = "~"
+MAX_CALLBACK_BYTES = 64  # ограничение Telegram на callback_data
+
+
+class CallbackRoute:
+    """Действие кнопки: обработчик, типы аргументов и фиксированные именованные аргументы."""
+    __slots__ = ("action", "handler", "arg_types", "fixed")
+
+    def __init__(self, action: str, handler, arg_types: tuple, fixed: dict):
+        self.action = action
+        self.handler = handler
+        self.arg_types = arg_types
+        self.fixed = fixed
+
+
+class CallbackRouter:
+    """
+    Разбор callback_data за один проход и диспетчеризация по словарю вместо
+    цепочки CallbackQueryHandler с регулярками.
+
+    Формат: "~<версия>|<действие>|<арг1>|<арг2>...". Данные без "~" — кнопки,
+    отправленные до появления версий, считаются версией 0 и принимаются, пока
+    min_version == 0. Версии новее текущей (после отката) и старше min_version
+    отклоняются, как и неизвестные действия и аргументы не того типа.
+    """
+
+    def __init__(self, version: int = 1, min_version: int = 0):
+        self.version = version
+        self.min_version = min_version
+        self._routes = {}  # action -> CallbackRoute
+        self.dispatched = 0
+        self.rejected = 0
+
+    def add(self, action: str, handler, *arg_types, aliases=(), **fixed):
+        """Регистрирует обработчик handler(update, context, *args, **fixed) для действия и его псевдонимов."""
+        route = CallbackRoute(action, handler, arg_types, fixed)
+        for name in (action, *aliases):
+            if name in self._routes:
+                raise ValueError(f"Действие уже зарегистрировано: {name}")
+            self._routes[name] = route
+        return route
+
+    def build(self, action: str, *args) -> str:
+        """callback_data для кнопки; проверяет действие, число аргументов и лимит Telegram."""
+        route = self._routes.get(action)
+        if route is None:
+            raise ValueError(f"Неизвестное действие: {action}")
+        if len(args) != len(route.arg_types):
+            raise ValueError(f"{action}: ожидается аргументов {len(route.arg_types)}, передано {len(args)}")
+        data = SEPARATOR.join((f"{VERSION_MARK}{self.version}", action, *map(str, args)))
+        if len(data.encode()) > MAX_CALLBACK_BYTES:
+            raise ValueError(f"callback_data длиннее {MAX_CALLBACK_BYTES} байт: {data}")
+        return data
+
+    def parse(self, data: str):
+        """(route, args) или None, если данные не проходят проверку."""
+        parts = (data or "").split(SEPARATOR)
+        version = 0
+        if parts[0].startswith(VERSION_MARK):
+            try:
+                version = int(parts[0][1:])
+            except ValueError:
+                return None
+            parts = parts[1:]
+        if not parts or not self.min_version <= version <= self.version:
+            return None
+
+        route = self._routes.get(parts[0])
+        if route is None or len(parts) - 1 != len(route.arg_types):
+            return None
+        try:
+            args = tuple(arg_type(value) for arg_type, value in zip(route.arg_types, parts[1:]))
+        except ValueError:
+            return None
+        return route, args
+
+    async def dispatch(self, update, context):
+        """Единственный CallbackQueryHandler бота."""
+        query = update.callback_query
+        parsed = self.parse(query.data)
+        if parsed is None:
+            self.rejected += 1
+            logger.warning("Некорректные callback_data",
+                           extra={"event_type": "callback_router", "payload": {"data": query.data}})
+            await query.answer()
+            return
+        route, args = parsed
+        self.dispatched += 1
+        await route.handler(update, context, *args, **route.fixed)
+
+    def stats(self) -> dict:
+        return {"routes": len(self._routes), "dispatched": self.dispatched, "rejected": self.rejected}
+
+
+# Глобальный экземпляр
+callback_router = CallbackRouter()
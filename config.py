@@ -3,4 +3,72 @@ import os
 from dotenv import load_dotenv
 
 load_dotenv()
-TOKEN = os.getenv("BOT_TOKEN")
\ No newline at end of file
+TOKEN = os.getenv("BOT_TOKEN")
+
+def _int_env(name):
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+# --- Хранилище ---
+DB_URL = os.getenv("DB_URL", "sqlite:///triggerbot.db")
+DB_ASYNC_URL = os.getenv("DB_ASYNC_URL")  # если не задан — выводится из DB_URL
+DB_PROFILE = os.getenv("DB_PROFILE", "wal")  # default | wal | safe | fast
+# Точечные переопределения профиля (пусто — значение из профиля)
+DB_JOURNAL_MODE = os.getenv("DB_JOURNAL_MODE")
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS")
+DB_CACHE_SIZE = _int_env("DB_CACHE_SIZE")
+DB_MMAP_SIZE = _int_env("DB_MMAP_SIZE")
+DB_BUSY_TIMEOUT = _int_env("DB_BUSY_TIMEOUT")
+DB_READ_POOL_SIZE = _int_env("DB_READ_POOL_SIZE")
+DB_WRITE_POOL_SIZE = _int_env("DB_WRITE_POOL_SIZE")
+
+# --- Логирование в БД ---
+LOG_DB_QUEUE_SIZE = int(os.getenv("LOG_DB_QUEUE_SIZE", "10000"))
+LOG_DB_BATCH_SIZE = int(os.getenv("LOG_DB_BATCH_SIZE", "200"))
+LOG_DB_OVERFLOW = os.getenv("LOG_DB_OVERFLOW", "drop_debug")  # drop_debug | block | spill
+# Выборка логов: "event_type:LEVEL=доля/трасс_в_секунду; ..." (WARNING и выше не отбрасываются)
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "handle_trigger_message:DEBUG=0.1/20")
+
+# --- /my_chats ---
+MY_CHATS_CONCURRENCY = int(os.getenv("MY_CHATS_CONCURRENCY", "10"))  # одновременных запросов к Telegram
+MY_CHATS_CALL_TIMEOUT = float(os.getenv("MY_CHATS_CALL_TIMEOUT", "5"))  # секунд на один запрос
+MY_CHATS_DEADLINE = float(os.getenv("MY_CHATS_DEADLINE", "15"))  # секунд на весь список
+
+# --- Кэш администраторов ---
+ADMIN_ROSTER_TTL = float(os.getenv("ADMIN_ROSTER_TTL", "600"))  # секунд до повторной загрузки списка админов
+ADMIN_ROSTER_MAX_CHATS = int(os.getenv("ADMIN_ROSTER_MAX_CHATS", "10000"))
+
+# --- Обработка update'ов ---
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "16"))  # разных чатов одновременно
+UPDATE_MAX_PENDING = int(os.getenv("UPDATE_MAX_PENDING", "1000"))  # предел задач update'ов (в работе и в очередях чатов)
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "1000"))  # ещё не взятые в работу; 0 — без предела
+
+# --- Приём update'ов ---
+BOT_MODE = os.getenv("BOT_MODE", "polling")  # polling | webhook
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # обязателен в режиме webhook
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # публичный адрес для set_webhook; пусто — не регистрировать
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+
+# --- Исходящие сообщения (лимиты Telegram) ---
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))  # сообщений в секунду на бота
+OUTBOUND_GLOBAL_BURST = float(os.getenv("OUTBOUND_GLOBAL_BURST", "5"))
+OUTBOUND_GROUP_PER_MINUTE = float(os.getenv("OUTBOUND_GROUP_PER_MINUTE", "20"))  # в одну группу
+OUTBOUND_GROUP_BURST = float(os.getenv("OUTBOUND_GROUP_BURST", "3"))
+OUTBOUND_PRIVATE_RATE = float(os.getenv("OUTBOUND_PRIVATE_RATE", "1"))  # в один личный чат, в секунду
+OUTBOUND_PRIVATE_BURST = float(os.getenv("OUTBOUND_PRIVATE_BURST", "5"))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))  # повторов после RetryAfter
+
+# --- Ответы триггеров ---
+TRIGGER_COOLDOWN = float(os.getenv("TRIGGER_COOLDOWN", "60"))  # секунд тишины категории в чате после ответа
+TRIGGER_COALESCE_WINDOW = float(os.getenv("TRIGGER_COALESCE_WINDOW", "5"))  # окно слияния повторов
+TRIGGER_MATCH_MODE = os.getenv("TRIGGER_MATCH_MODE", "first")  # first | all — отвечать одной или всем совпавшим категориям
+TRIGGER_MAX_REPLIES = int(os.getenv("TRIGGER_MAX_REPLIES", "3"))  # предел ответов на одно сообщение в режиме all
+TRIGGER_MAX_IN_FLIGHT = int(os.getenv("TRIGGER_MAX_IN_FLIGHT", "1000"))  # ответов в пути (ждут лимитов отправки) в фоне
+# Нечёткое сопоставление (категории с keyword_mode = fuzzy)
+TRIGGER_FUZZY_MAX_DISTANCE = int(os.getenv("TRIGGER_FUZZY_MAX_DISTANCE", "1"))  # допустимых опечаток в слове
+TRIGGER_FUZZY_MIN_LENGTH = int(os.getenv("TRIGGER_FUZZY_MIN_LENGTH", "4"))  # короче — только точное совпадение
+TRIGGER_FUZZY_MAX_CANDIDATES = int(os.getenv("TRIGGER_FUZZY_MAX_CANDIDATES", "5000"))  # кандидатов нечёткого поиска на сообщение; сверх — слова не проверяются
@@ -0,0 +1,12 @@
+# conftest.py
+import os
+import sys
+import tempfile
+
+# Модули бота при импорте открывают БД (database/db.py) и файлы логов в текущем каталоге.
+# Тесты работают во временном каталоге со своей БД — рабочие triggerbot.db и bot.log не трогаются
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+os.chdir(tempfile.mkdtemp(prefix="triggerbot-tests-"))
+os.environ["DB_URL"] = "sqlite:///triggerbot.db"
+os.environ.pop("DB_ASYNC_URL", None)
@@ -0,0 +1,57 @@
+# database/chat_meta.py
+from collections import OrderedDict
+
+from sqlalchemy import update
+
+from .db import AsyncSession
+from .models import Chat
+
+
+def chat_fields(tg_chat) -> dict:
+    """Поля chats, которые берутся из объекта telegram.Chat."""
+    return {"title": tg_chat.title, "type": tg_chat.type, "username": tg_chat.username}
+
+
+class ChatMetadata:
+    """
+    Держит в памяти последние записанные title/type/username по чатам и пишет
+    в БД только при изменении — обычное сообщение не стоит ни одного запроса.
+    Известные поля засеваются строками chats, которые уже читает кэш
+    категорий (remember), поэтому после перезапуска записей тоже нет.
+    """
+
+    def __init__(self, max_chats: int = 50_000):
+        self.max_chats = max_chats
+        self._known = OrderedDict()  # chat_id -> dict полей, LRU
+        self.writes = 0
+
+    async def observe(self, tg_chat):
+        """Сверяет данные чата из update с сохранёнными и обновляет строку chats при изменении."""
+        fields = chat_fields(tg_chat)
+        if self._known.get(tg_chat.id) == fields:
+            self._known.move_to_end(tg_chat.id)
+            return
+        async with AsyncSession() as session:
+            # Незарегистрированные чаты не создаются: UPDATE просто не найдёт строку
+            await session.execute(update(Chat).where(Chat.id == tg_chat.id).values(**fields))
+            await session.commit()
+        self.writes += 1
+        self.remember(tg_chat.id, fields)
+
+    def remember(self, chat_id: int, fields: dict):
+        """Поля, уже сохранённые в строке chats (прочитанной или записанной)."""
+        self._known[chat_id] = fields
+        self._known.move_to_end(chat_id)
+        while len(self._known) > self.max_chats:
+            self._known.popitem(last=False)
+
+    def forget(self, chat_id: int):
+        """Строка чата создана или удалена — следующий update запишет поля заново."""
+        self._known.pop(chat_id, None)
+
+    def stats(self) -> dict:
+        return {"chats": len(self._known), "writes": self.writes}
+
+
+# Глобальный экземпляр
+chat_metadata = ChatMetadata()
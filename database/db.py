@@ -1,11 +1,34 @@
 # database/db.py
-from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.orm import sessionmaker
+
+import config
+from .migrations import run_migrations
 from .models import Base
+from .profiles import create_storage_engines, get_profile
+
+# Профиль хранилища (PRAGMA, пулы) из конфига
+profile = get_profile(
+    config.DB_PROFILE,
+    journal_mode=config.DB_JOURNAL_MODE,
+    synchronous=config.DB_SYNCHRONOUS,
+    cache_size=config.DB_CACHE_SIZE,
+    mmap_size=config.DB_MMAP_SIZE,
+    busy_timeout=config.DB_BUSY_TIMEOUT,
+    read_pool_size=config.DB_READ_POOL_SIZE,
+    write_pool_size=config.DB_WRITE_POOL_SIZE,
+)
 
-# Создаём движок для SQLite
-engine = create_engine("sqlite:///triggerbot.db")
-# Создаём таблицы на основе моделей
+# Создаём движки: синхронный и асинхронный писатели + асинхронный пул чтения
+engine, async_engine, async_read_engine = create_storage_engines(config.DB_URL, profile, config.DB_ASYNC_URL)
+# Создаём таблицы на основе моделей и дотягиваем схему старых таблиц
 Base.metadata.create_all(engine)
-# Создаём фабрику сессий
-Session = sessionmaker(bind=engine, expire_on_commit=True)
\ No newline at end of file
+run_migrations(engine)
+# Создаём фабрику сессий (синхронная — для логгера и фоновых потоков)
+Session = sessionmaker(bind=engine, expire_on_commit=True)
+
+# Асинхронные сессии — для обработчиков бота и triggers/
+# expire_on_commit=False: после commit объекты читаются без ленивой подгрузки
+AsyncSession = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+# Только чтение (админка, загрузка кэшей): отдельный пул, не мешает писателю
+AsyncReadSession = async_sessionmaker(bind=async_read_engine, expire_on_commit=False)
@@ -0,0 +1,79 @@
+# database/keywords.py
+from collections import defaultdict
+
+from sqlalchemy import delete, select
+
+from triggers.normalize import fold_text, normalize_text
+from .models import CategoryKeyword
+
+
+def split_keywords(keywords) -> list:
+    """Разбирает строку ключевых слов (через запятую) в список без пустых элементов."""
+    if not keywords:
+        return []
+    return [kw for kw in (part.strip() for part in keywords.split(",")) if kw]
+
+
+def normalize_keyword(keyword: str) -> str:
+    """Форма для сопоставления и индекса — та же, что у текста сообщений (triggers/normalize.py)."""
+    return normalize_text(keyword)
+
+
+def keyword_rows(category_id: int, keywords) -> list:
+    """
+    Строки category_keywords для строки ключевых слов. Отбрасываются пустые
+    после fold_text и повторы по нему: "5%" и "5" в режиме substring различаются.
+    Слова из одной пунктуации ("?!", "+") сохраняются с пустым normalized — их
+    ищет только режим substring, token и fuzzy пропускают их при компиляции.
+    """
+    rows, seen = [], set()
+    for keyword in split_keywords(keywords):
+        normalized = normalize_keyword(keyword)
+        folded = fold_text(keyword)
+        if not folded or folded in seen:
+            continue
+        seen.add(folded)
+        rows.append({"category_id": category_id, "position": len(rows),
+                     "keyword": keyword, "normalized": normalized})
+    return rows
+
+
+async def replace_category_keywords(session, category_id: int, keywords):
+    """Заменяет ключевые слова категории (в транзакции вызывающего, без commit)."""
+    await session.execute(delete(CategoryKeyword).where(CategoryKeyword.category_id == category_id))
+    rows = keyword_rows(category_id, keywords)
+    if rows:
+        await session.execute(CategoryKeyword.__table__.insert(), rows)
+
+
+async def delete_category_keywords(session, category_id: int):
+    await session.execute(delete(CategoryKeyword).where(CategoryKeyword.category_id == category_id))
+
+
+async def load_keywords(session, category_ids) -> dict:
+    """
+    {category_id: [keyword, ...]} в исходном порядке — одним запросом на все
+    категории. Слова как ввёл админ: форму под режим поиска выбирает matcher.
+    """
+    result = defaultdict(list)
+    if not category_ids:
+        return result
+    rows = await session.execute(
+        select(CategoryKeyword.category_id, CategoryKeyword.keyword)
+        .where(CategoryKeyword.category_id.in_(category_ids))
+        .order_by(CategoryKeyword.category_id, CategoryKeyword.position)
+    )
+    for category_id, keyword in rows:
+        result[category_id].append(keyword)
+    return result
+
+
+async def categories_for_keyword(session, keyword: str) -> list:
+    """id категорий, у которых есть такое ключевое слово (по индексу normalized)."""
+    normalized = normalize_keyword(keyword)
+    if not normalized:
+        return []  # пунктуация по слову не ищется
+    rows = await session.scalars(
+        select(CategoryKeyword.category_id).where(CategoryKeyword.normalized == normalized).distinct()
+    )
+    return list(rows)
@@ -0,0 +1,76 @@
+# database/migrations.py
+from sqlalchemy import inspect, text
+
+from .keywords import keyword_rows, normalize_keyword
+from .models import Base, CategoryKeyword
+
+
+def _add_column(engine, table, column):
+    # Без DEFAULT/NOT NULL: новые колонки заполняются кодом по мере поступления данных
+    column_type = column.type.compile(dialect=engine.dialect)
+    preparer = engine.dialect.identifier_preparer
+    with engine.begin() as connection:
+        connection.execute(text(
+            f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} {column_type}"
+        ))
+
+
+def run_migrations(engine):
+    """
+    Доводит уже существующую БД до текущих моделей. create_all создаёт только
+    новые таблицы, поэтому недостающие колонки и индексы старых таблиц
+    добавляются здесь. Добавляемые колонки должны быть nullable. Затем
+    переносятся данные, которым нужна новая схема (ключевые слова категорий).
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns:
+                _add_column(engine, table, column)
+        existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(engine)
+
+    _backfill_category_keywords(engine)
+    _renormalize_category_keywords(engine)
+
+
+def _backfill_category_keywords(engine):
+    # Перенос из колонки categories.keywords (её обновляет и редактор категорий): строки
+    # пересобираются у категорий, где их нет или набор слов разошёлся с правилами
+    # keyword_rows — например, слова из одной пунктуации раньше отбрасывались
+    with engine.begin() as connection:
+        categories = connection.execute(text(
+            "SELECT id, keywords FROM categories WHERE keywords IS NOT NULL AND keywords != ''"
+        )).all()
+        stored = {}
+        for category_id, keyword in connection.execute(text(
+                "SELECT category_id, keyword FROM category_keywords ORDER BY category_id, position")):
+            stored.setdefault(category_id, []).append(keyword)
+        rows, rebuilt = [], []
+        for category_id, keywords in categories:
+            expected = keyword_rows(category_id, keywords)
+            if [row["keyword"] for row in expected] == stored.get(category_id, []):
+                continue
+            if category_id in stored:
+                rebuilt.append({"category_id": category_id})
+            rows.extend(expected)
+        if rebuilt:
+            connection.execute(text("DELETE FROM category_keywords WHERE category_id = :category_id"), rebuilt)
+        if rows:
+            connection.execute(CategoryKeyword.__table__.insert(), rows)
+
+
+def _renormalize_category_keywords(engine):
+    # Правила нормализации могли измениться — индекс normalized должен им соответствовать
+    with engine.begin() as connection:
+        rows = connection.execute(text("SELECT id, keyword, normalized FROM category_keywords")).all()
+        changed = [{"id": row_id, "normalized": normalize_keyword(keyword)}
+                   for row_id, keyword, normalized in rows if normalize_keyword(keyword) != normalized]
+        if changed:
+            connection.execute(text("UPDATE category_keywords SET normalized = :normalized WHERE id = :id"), changed)
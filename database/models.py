@@ -22,24 +22,39 @@ class ChatGroup(Base):
     __tablename__ = "chat_groups"
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String, nullable=False)  # Название группы
-    owner_id = Column(BigInteger, nullable=False)  # Владелец группы (изоляция)
+    owner_id = Column(BigInteger, nullable=False, index=True)  # Владелец группы (изоляция)
 
 
 class Chat(Base):
     __tablename__ = "chats"
     id = Column(BigInteger, primary_key=True)
     group_id = Column(Integer, ForeignKey("chat_groups.id"), nullable=True)
+    # Данные из Telegram, обновляются из сообщений и my_chat_member (см. database/chat_meta.py)
+    title = Column(String, nullable=True)
+    type = Column(String, nullable=True)  # group | supergroup | ...
+    username = Column(String, nullable=True)
+
+
+class ChatAdmin(Base):
+    """Обратный индекс пользователь → чаты, где он админ. Поддерживается из списков админов."""
+    __tablename__ = "chat_admins"
+    chat_id = Column(BigInteger, primary_key=True)
+    user_id = Column(BigInteger, primary_key=True, index=True)
+    status = Column(String, nullable=False)  # creator | administrator
 
 
 class Category(Base):
     __tablename__ = "categories"
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String, nullable=False)  # Может повторяться (локально/группово)
-    keywords = Column(String)  # Через запятую
+    keywords = Column(String)  # Через запятую, как ввёл админ (для показа); рабочая копия — category_keywords
     response = Column(String)
     chat_id = Column(BigInteger, ForeignKey("chats.id"), nullable=True)  # Локальная
     group_id = Column(Integer, ForeignKey("chat_groups.id"), nullable=True)  # Групповая
     owner_id = Column(BigInteger)  # Кто создал (аудит, опционально)
+    priority = Column(Integer, nullable=True)  # Больше — раньше при нескольких совпадениях; NULL = 0
+    keyword_mode = Column(String, nullable=True)  # substring (NULL) | token | fuzzy — как сопоставлять ключевые слова
+    pipeline = Column(JSON, nullable=True)  # Условия и действия (см. triggers/pipeline.py); NULL — по умолчанию
 
     __table_args__ = (
         CheckConstraint(
@@ -49,6 +64,16 @@ class Category(Base):
     )
 
 
+class CategoryKeyword(Base):
+    """Ключевые слова категории по одному в строке; normalized индексирован для поиска по слову."""
+    __tablename__ = "category_keywords"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=False, index=True)
+    position = Column(Integer, nullable=False)  # Порядок в исходной строке
+    keyword = Column(String, nullable=False)  # Как ввёл админ
+    normalized = Column(String, nullable=False, index=True)  # См. triggers/normalize.py
+
+
 class TriggerEvent(Base):
     __tablename__ = "trigger_events"
     id = Column(Integer, primary_key=True)
@@ -0,0 +1,129 @@
+# database/profiles.py
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from locallog.serializer import dumps
+
+
+class StorageProfile:
+    """
+    Набор настроек хранилища. Для SQLite превращается в PRAGMA на каждом
+    новом соединении; для серверных БД используются только размеры пулов.
+    """
+
+    def __init__(self, name, journal_mode="DELETE", synchronous="FULL", cache_size=-2000,
+                 mmap_size=0, busy_timeout=5000, read_pool_size=4, write_pool_size=5):
+        self.name = name
+        self.journal_mode = journal_mode    # DELETE | WAL | ...
+        self.synchronous = synchronous      # OFF | NORMAL | FULL
+        self.cache_size = cache_size        # страницы (>0) или KiB (<0), как в SQLite
+        self.mmap_size = mmap_size          # байты, 0 — без mmap
+        self.busy_timeout = busy_timeout    # мс ожидания блокировки файла
+        self.read_pool_size = read_pool_size
+        self.write_pool_size = write_pool_size  # для SQLite не используется: у каждого писателя одно соединение
+
+    def with_overrides(self, **overrides):
+        """Копия профиля с заменёнными полями (None — оставить как есть)."""
+        values = dict(self.__dict__)
+        values.update({k: v for k, v in overrides.items() if v is not None})
+        return StorageProfile(**values)
+
+    def sqlite_pragmas(self, read_only=False) -> list:
+        pragmas = [
+            f"PRAGMA busy_timeout={int(self.busy_timeout)}",
+            f"PRAGMA cache_size={int(self.cache_size)}",
+            f"PRAGMA mmap_size={int(self.mmap_size)}",
+        ]
+        if read_only:
+            pragmas.append("PRAGMA query_only=ON")
+        else:
+            # journal_mode хранится в файле БД, поэтому выставляет его только писатель
+            pragmas.append(f"PRAGMA journal_mode={self.journal_mode}")
+            pragmas.append(f"PRAGMA synchronous={self.synchronous}")
+        return pragmas
+
+    def __repr__(self):
+        return f"StorageProfile({self.name!r})"
+
+
+PROFILES = {
+    # Поведение до появления профилей: журнал отката и полный fsync на каждый commit
+    "default": StorageProfile("default"),
+    # WAL: читатели не блокируют писателя, fsync только на checkpoint
+    "wal": StorageProfile("wal", journal_mode="WAL", synchronous="NORMAL",
+                          cache_size=-16000, mmap_size=64 * 1024 * 1024),
+    # WAL с полным fsync — надёжнее при отключении питания, медленнее на запись
+    "safe": StorageProfile("safe", journal_mode="WAL", synchronous="FULL", cache_size=-16000),
+    # Максимальная скорость записи ценой возможной потери последних транзакций при сбое ОС
+    "fast": StorageProfile("fast", journal_mode="WAL", synchronous="OFF",
+                           cache_size=-64000, mmap_size=256 * 1024 * 1024),
+}
+
+
+def get_profile(name: str, **overrides) -> StorageProfile:
+    if name not in PROFILES:
+        raise ValueError(f"Неизвестный профиль хранилища: {name} (доступны: {', '.join(PROFILES)})")
+    return PROFILES[name].with_overrides(**overrides)
+
+
+# Асинхронные драйверы для синхронных URL
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+
+def to_async_url(url):
+    url = make_url(url)
+    if url.drivername in ASYNC_DRIVERS:
+        return url.set(drivername=ASYNC_DRIVERS[url.drivername])
+    return url
+
+
+def _install_pragmas(sync_engine, profile: StorageProfile, read_only: bool):
+    pragmas = profile.sqlite_pragmas(read_only=read_only)
+
+    @event.listens_for(sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+def create_storage_engines(url, profile: StorageProfile, async_url=None):
+    """
+    Создаёт движки по профилю:
+      - engine — синхронный писатель (логгер, фоновые потоки, миграции, сброс при выходе);
+      - async_engine — асинхронный писатель (обработчики бота, triggers/);
+      - async_read_engine — пул только для чтения для админки и загрузки кэшей.
+
+    Для SQLite у каждого писателя ровно одно соединение, то есть писателей
+    к файлу два: синхронный работает из других потоков и без цикла событий,
+    асинхронный — в цикле через aiosqlite, и общее соединение у них быть не
+    может. Внутри каждого записи идут по очереди; между ними конфликт
+    блокировки файла разрешает busy_timeout (в WAL читатели писателям не мешают).
+    """
+    url = make_url(url)
+    async_url = make_url(async_url) if async_url else to_async_url(url)
+    is_sqlite = url.get_backend_name() == "sqlite"
+
+    if is_sqlite:
+        write_pool = {"pool_size": 1, "max_overflow": 0}
+    else:
+        write_pool = {"pool_size": profile.write_pool_size, "pool_pre_ping": True}
+    read_pool = {"pool_size": profile.read_pool_size, "max_overflow": 0 if is_sqlite else 10}
+
+    # JSON-колонки (logs.payload) сериализуются общим сериализатором: не падает и не кодирует дважды
+    engine = create_engine(url, json_serializer=dumps, **write_pool)
+    async_engine = create_async_engine(async_url, json_serializer=dumps, **write_pool)
+    async_read_engine = create_async_engine(async_url, json_serializer=dumps, **read_pool)
+
+    if is_sqlite:
+        _install_pragmas(engine, profile, read_only=False)
+        _install_pragmas(async_engine.sync_engine, profile, read_only=False)
+        _install_pragmas(async_read_engine.sync_engine, profile, read_only=True)
+
+    return engine, async_engine, async_read_engine
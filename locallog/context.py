@@ -1,16 +1,26 @@
 # locallog/context.py
 
-import uuid
+import itertools
+import os
 from contextvars import ContextVar
 
 trace_id_var = ContextVar("trace_id", default=None)
 user_id_var  = ContextVar("user_id", default=None)
 chat_id_var = ContextVar("chat_id", default=None)
 log_var = ContextVar("log_var", default=None)
+update_context_var = ContextVar("update_context", default=None)
+
+# trace_id = <случайный префикс процесса>-<монотонный счётчик>: уникален между перезапусками,
+# упорядочен внутри процесса и стоит одного next() вместо uuid4
+_trace_prefix = os.urandom(4).hex()
+_trace_counter = itertools.count(1)
+
+def new_trace_id():
+    return f"{_trace_prefix}-{next(_trace_counter):x}"
 
 def set_trace_id(value = None):
     if value is None:
-        value = str(uuid.uuid4())
+        value = new_trace_id()
     if get_trace_id() is None:
         trace_id_var.set(value)
     return value
@@ -34,4 +44,10 @@ def set_log(log):
     log_var.set(log)
 
 def get_log():
-    return log_var.get()
\ No newline at end of file
+    return log_var.get()
+
+def set_update_context(context):
+    update_context_var.set(context)
+
+def get_update_context():
+    return update_context_var.get()
\ No newline at end of file
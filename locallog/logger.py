@@ -2,16 +2,27 @@
 
 import logging
 from logging.handlers import RotatingFileHandler
-import json
+import queue
+import threading
 from datetime import datetime
 from locallog.context import *
+from locallog.sampling import SamplingFilter, parse_rules
+from locallog.serializer import dumps_with_payload, payload_json
+from locallog.update_context import UpdateContextFilter
+from sqlalchemy import insert
+
+import config
 from database.db import Session
 from database.models import Log
 
 
 class JSONFormatter(logging.Formatter):
-    """Форматирует логи в JSON."""
+    """Форматирует логи в JSON. Строка кэшируется на записи и общая для всех обработчиков."""
     def format(self, record):
+        try:
+            return record._json_line
+        except AttributeError:
+            pass
         base = {
             "timestamp": datetime.utcnow().isoformat(),
             "level": record.levelname,
@@ -20,15 +31,13 @@ class JSONFormatter(logging.Formatter):
             "message": record.getMessage(),
             "chat_id": getattr(record, "chat_id", None),
             "user_id": getattr(record, "user_id", None),
-            "payload": getattr(record, "payload", None),
             "logger": record.name,
         }
-        # payload = getattr(record, "payload", None)
-        # if payload:
-        #     base["payload"] = payload
         if record.exc_info:
             base["exception"] = self.formatException(record.exc_info)
-        return json.dumps(base, ensure_ascii=False)
+        # payload кодируется один раз (payload_json) и вставляется готовой строкой
+        record._json_line = dumps_with_payload(base, payload_json(record))
+        return record._json_line
 
 
 
@@ -49,43 +58,160 @@ def setup_internal_logger():
 
 
 class DBHandler(logging.Handler):
-    def __init__(self):
+    """
+    Пишет логи в таблицу logs, не блокируя вызывающий код: emit только кладёт
+    строку в ограниченную очередь, а фоновый поток вставляет их пачками.
+
+    Поведение при переполнении очереди (overflow):
+      - "drop_debug" — после заполнения на debug_watermark отбрасываются DEBUG,
+        при полной очереди — любые записи;
+      - "block" — вызывающий ждёт место до block_timeout секунд, затем запись отбрасывается;
+      - "spill" — не поместившиеся записи дописываются в spill_file (JSON Lines).
+    """
+
+    OVERFLOW_POLICIES = ("drop_debug", "block", "spill")
+
+    def __init__(self, max_queue=10_000, batch_size=200, flush_interval=1.0, overflow="drop_debug",
+                 debug_watermark=0.8, block_timeout=1.0, spill_file="logs_spill.jsonl"):
         super().__init__()
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Неизвестная политика переполнения: {overflow}")
         self.fallback_logger = setup_internal_logger()
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.debug_limit = int(max_queue * debug_watermark)
+        self.block_timeout = block_timeout
+        self.spill_file = spill_file
+        self._spill_lock = threading.Lock()
+        self._stopped = threading.Event()
+
+        # Счётчики
+        self.queued = 0
+        self.written = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.failed = 0
+
+        self._worker = threading.Thread(target=self._run, name="DBHandler", daemon=True)
+        self._worker.start()
+
+    def _make_row(self, record):
+        # Всё, что зависит от контекста вызова (trace_id из contextvar), фиксируем здесь, а не в потоке
+        return {
+            "timestamp": datetime.utcnow(),
+            "level": record.levelname,
+            "event_type": getattr(record, "event_type", None),
+            "message": record.getMessage(),
+            "trace_id": getattr(record, "trace_id", get_trace_id()),
+            "chat_id": getattr(record, "chat_id", None),
+            "user_id": getattr(record, "user_id", None),
+            "payload": payload_json(record),
+        }
 
     def emit(self, record):
+        try:
+            row = self._make_row(record)
+        except Exception:
+            self.handleError(record)
+            return
+
+        if self.overflow == "drop_debug" and record.levelno <= logging.DEBUG and self.queue.qsize() >= self.debug_limit:
+            self.dropped += 1
+            return
+
+        try:
+            if self.overflow == "block":
+                self.queue.put(row, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(row)
+            self.queued += 1
+        except queue.Full:
+            if self.overflow == "spill":
+                self._spill(row)
+            else:
+                self.dropped += 1
+
+    def _spill(self, row):
+        try:
+            line = dumps_with_payload({k: v for k, v in row.items() if k != "payload"}, row["payload"])
+            with self._spill_lock, open(self.spill_file, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            self.spilled += 1
+        except Exception:
+            self.dropped += 1
+
+    def _run(self):
+        while not (self._stopped.is_set() and self.queue.empty()):
+            try:
+                batch = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+            for _ in batch:
+                self.queue.task_done()
+
+    def _write(self, rows):
         try:
             with Session() as session:
-                entry = Log(
-                    timestamp=datetime.utcnow(),
-                    level=record.levelname,
-                    event_type=getattr(record, "event_type", None),
-                    message=record.getMessage(),
-                    trace_id=getattr(record, "trace_id", get_trace_id()),
-                    chat_id=getattr(record, "chat_id", None),
-                    user_id=getattr(record, "user_id", None),
-                    payload=getattr(record, "payload", None),
-                )
-                session.add(entry)
+                session.execute(insert(Log), rows)
                 session.commit()
+            self.written += len(rows)
+            return
+        except Exception:
+            pass
 
-        except Exception as e:
-            # fallback — чтобы не вызывать рекурсию логгера
-            self.fallback_logger.error(
-                f"Ошибка записи лога в БД: {e}",
-                exc_info=True,
-                extra={
-                    "chat_id": getattr(record, "chat_id", None),
-                    "user_id": getattr(record, "user_id", None),
-                    "event_type": getattr(record, "event_type", None),
-                    "trace_id": getattr(record, "trace_id", get_trace_id()),
-                    "payload": {
-                        "failed_message": record.getMessage(),
-                        "trace_id": getattr(record, "trace_id", None),
-                        "event_type": getattr(record, "event_type", None),
+        # Пачка не записалась — пишем по одной, чтобы одна битая запись не утянула остальные
+        for row in rows:
+            try:
+                with Session() as session:
+                    session.execute(insert(Log), [row])
+                    session.commit()
+                self.written += 1
+            except Exception as e:
+                self.failed += 1
+                # fallback — чтобы не вызывать рекурсию логгера
+                self.fallback_logger.error(
+                    f"Ошибка записи лога в БД: {e}",
+                    exc_info=True,
+                    extra={
+                        "chat_id": row["chat_id"],
+                        "user_id": row["user_id"],
+                        "event_type": row["event_type"],
+                        "trace_id": row["trace_id"],
+                        "payload": {
+                            "failed_message": row["message"],
+                            "trace_id": row["trace_id"],
+                            "event_type": row["event_type"],
+                        },
                     },
-                },
-            )
+                )
+
+    def flush(self):
+        """Дожидается записи всего, что уже в очереди."""
+        if self._worker.is_alive():
+            self.queue.join()
+
+    def close(self):
+        self._stopped.set()
+        self._worker.join(timeout=self.flush_interval + 5)
+        super().close()
+
+    def stats(self) -> dict:
+        return {
+            "queue_size": self.queue.qsize(),
+            "queued": self.queued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "failed": self.failed,
+        }
 
 
 def setup_logger(
@@ -96,6 +222,10 @@ def setup_logger(
     log_file="bot.log",
     max_bytes=5 * 1024 * 1024,
     backup_count=3,
+    db_queue_size=10_000,
+    db_batch_size=200,
+    db_overflow="drop_debug",
+    sampling_rules=None,
 ):
     """
       Универсальная настройка логгера.
@@ -104,11 +234,21 @@ def setup_logger(
       :param to_db: запись в базу
       :param to_file: запись в файл (JSON)
       :param log_file: путь к файлу логов
+      :param db_queue_size: размер очереди записи в базу
+      :param db_batch_size: размер пачки вставки в базу
+      :param db_overflow: политика переполнения очереди (drop_debug | block | spill)
+      :param sampling_rules: правила выборки {(event_type, level): SamplingRule}, применяются ко всем выводам
       """
 
     logger = logging.getLogger(name)
     logger.setLevel(logging.DEBUG)
     logger.handlers.clear()  # очистим, чтобы не было дублирования
+    logger.filters.clear()
+
+    if sampling_rules:
+        logger.addFilter(SamplingFilter(sampling_rules))
+    # После выборки: контекст update разбирается только для записей, которые будут выведены
+    logger.addFilter(UpdateContextFilter())
 
     formatter = JSONFormatter()
 
@@ -118,7 +258,7 @@ def setup_logger(
         logger.addHandler(sh)
 
     if to_db:
-        dbh = DBHandler()
+        dbh = DBHandler(max_queue=db_queue_size, batch_size=db_batch_size, overflow=db_overflow)
         logger.addHandler(dbh)
 
     # --- Файл ---
@@ -132,4 +272,24 @@ def setup_logger(
     return logger
 
 # Глобальный экземпляр
-logger = setup_logger(to_console=True, to_db=True, to_file=True)
\ No newline at end of file
+logger = setup_logger(
+    to_console=True,
+    to_db=True,
+    to_file=True,
+    db_queue_size=config.LOG_DB_QUEUE_SIZE,
+    db_batch_size=config.LOG_DB_BATCH_SIZE,
+    db_overflow=config.LOG_DB_OVERFLOW,
+    sampling_rules=parse_rules(config.LOG_SAMPLING),
+)
+
+
+def log_stats(logger=logger) -> dict:
+    """Счётчики выборки и очереди записи в БД для логгера."""
+    stats = {}
+    for f in logger.filters:
+        if isinstance(f, SamplingFilter):
+            stats["sampling"] = f.stats()
+    for h in logger.handlers:
+        if isinstance(h, DBHandler):
+            stats["db"] = h.stats()
+    return stats
\ No newline at end of file
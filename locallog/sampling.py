@@ -0,0 +1,124 @@
+# locallog/sampling.py
+
+import logging
+import threading
+import time
+import zlib
+from collections import OrderedDict, defaultdict
+
+from locallog.context import get_trace_id
+
+
+class SamplingRule:
+    """
+    Правило для пары (event_type, уровень):
+      sample_rate — доля трасс, которые пропускаются (0..1);
+      max_per_second — сколько новых трасс в секунду пропускается из попавших в выборку (None — без ограничения).
+    """
+
+    def __init__(self, sample_rate: float = 1.0, max_per_second: float = None):
+        self.sample_rate = sample_rate
+        self.max_per_second = max_per_second
+        self._tokens = max_per_second or 0
+        self._updated = time.monotonic()
+
+    def take_token(self) -> bool:
+        if self.max_per_second is None:
+            return True
+        now = time.monotonic()
+        self._tokens = min(self.max_per_second, self._tokens + (now - self._updated) * self.max_per_second)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def __repr__(self):
+        return f"SamplingRule({self.sample_rate}, {self.max_per_second})"
+
+
+def parse_rules(spec: str) -> dict:
+    """
+    Разбирает правила вида "event_type:LEVEL=rate/max_per_second; ...".
+    event_type или LEVEL можно заменить на "*", "/max_per_second" — необязательно.
+    Пример: "handle_trigger_message:DEBUG=0.1/20; *:DEBUG=1/200"
+    """
+    rules = {}
+    for part in filter(None, (p.strip() for p in (spec or "").split(";"))):
+        target, _, value = part.partition("=")
+        event_type, _, level = target.strip().partition(":")
+        rate, _, limit = value.strip().partition("/")
+        key = (
+            None if event_type in ("", "*") else event_type,
+            None if level in ("", "*") else logging.getLevelName(level.upper()),
+        )
+        rules[key] = SamplingRule(float(rate), float(limit) if limit else None)
+    return rules
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Выборка и ограничение частоты логов по event_type и уровню.
+
+    Решение принимается один раз на trace_id, поэтому трасса обработки update
+    либо попадает в лог целиком, либо не попадает совсем. Доля трассы —
+    crc32(trace_id), вычисляется один раз и кэшируется: трасса в выборке
+    правила с долей r попадает и в выборку любого правила с большей долей.
+    Ограничение частоты (max_per_second) тратит токен, когда трасса впервые
+    допускается, и это решение действует для всех её записей любого уровня.
+    Записи уровня always_level (по умолчанию WARNING) и выше проходят всегда.
+    """
+
+    def __init__(self, rules: dict = None, always_level: int = logging.WARNING, max_traces: int = 10_000):
+        super().__init__()
+        self.rules = rules or {}
+        self.always_level = always_level
+        self.max_traces = max_traces
+        self._traces = OrderedDict()  # trace_id -> [доля по crc32, допущена: None/True/False], LRU
+        self._lock = threading.Lock()
+        self.suppressed = defaultdict(int)  # event_type -> сколько записей отброшено
+        self.passed = 0
+
+    def _rule_for(self, event_type, levelno):
+        rules = self.rules
+        return (rules.get((event_type, levelno)) or rules.get((event_type, None))
+                or rules.get((None, levelno)) or rules.get((None, None)))
+
+    def filter(self, record) -> bool:
+        if record.levelno >= self.always_level or not self.rules:
+            return True
+
+        event_type = getattr(record, "event_type", None)
+        rule = self._rule_for(event_type, record.levelno)
+        if rule is None:
+            return True
+
+        trace_id = getattr(record, "trace_id", None) or get_trace_id()
+        with self._lock:
+            if trace_id is None:
+                keep = rule.take_token()
+            else:
+                trace = self._traces.get(trace_id)
+                if trace is None:
+                    trace = self._traces[trace_id] = [zlib.crc32(str(trace_id).encode()) / 0xFFFFFFFF, None]
+                    if len(self._traces) > self.max_traces:
+                        self._traces.popitem(last=False)
+                keep = trace[0] < rule.sample_rate
+                if keep:
+                    if trace[1] is None:
+                        # Новая трасса: ограничение частоты проверяется один раз на трассу
+                        trace[1] = rule.take_token()
+                    keep = trace[1]
+
+        if keep:
+            self.passed += 1
+        else:
+            self.suppressed[event_type] += 1
+        return keep
+
+    def stats(self) -> dict:
+        return {
+            "passed": self.passed,
+            "suppressed": sum(self.suppressed.values()),
+            "suppressed_by_event": dict(self.suppressed),
+        }
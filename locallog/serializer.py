@@ -0,0 +1,135 @@
+# locallog/serializer.py
+
+import base64
+import json
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from enum import Enum
+from uuid import UUID
+
+from telegram import TelegramObject
+
+# Ограничения размера: логам не нужны мегабайтные payload
+MAX_STRING = 1000
+MAX_ITEMS = 50
+MAX_DEPTH = 6
+MAX_BYTES = 64
+
+
+class EncodedJSON(str):
+    """Уже сериализованный JSON: повторно не кодируется (см. dumps)."""
+
+
+def _truncate(text: str) -> str:
+    if len(text) > MAX_STRING:
+        return text[:MAX_STRING] + f"…(+{len(text) - MAX_STRING})"
+    return text
+
+
+def _bytes(value) -> str:
+    data = bytes(value)
+    encoded = base64.b64encode(data[:MAX_BYTES]).decode()
+    return f"base64:{encoded}" + (f"…(+{len(data) - MAX_BYTES})" if len(data) > MAX_BYTES else "")
+
+
+# Реестр преобразований для не-JSON типов: тип -> функция(value) -> JSON-совместимое значение
+_registry = {
+    datetime: datetime.isoformat,
+    date: date.isoformat,
+    time: time.isoformat,
+    timedelta: timedelta.total_seconds,
+    Decimal: str,
+    UUID: str,
+    Enum: lambda value: value.value,
+    set: list,
+    frozenset: list,
+    bytes: _bytes,
+    bytearray: _bytes,
+    memoryview: _bytes,
+    TelegramObject: lambda value: value.to_dict(),
+}
+_resolved = {}  # кэш поиска по MRO: конкретный тип -> функция или None
+
+
+def register(type_, converter):
+    """Регистрирует преобразование для типа (и его наследников)."""
+    _registry[type_] = converter
+    _resolved.clear()
+
+
+def _converter_for(type_):
+    try:
+        return _resolved[type_]
+    except KeyError:
+        converter = next((_registry[base] for base in type_.__mro__ if base in _registry), None)
+        _resolved[type_] = converter
+        return converter
+
+
+def to_jsonable(value, depth: int = 0):
+    """
+    Приводит значение к JSON-совместимому виду без исключений: известные типы
+    преобразуются через реестр, большие строки и коллекции обрезаются,
+    неизвестное превращается в короткий repr.
+    """
+    if value is None or value is True or value is False or type(value) in (int, float):
+        return value
+    if type(value) is str:
+        return _truncate(value)
+    if depth >= MAX_DEPTH:
+        return f"<{type(value).__name__}>"
+
+    if isinstance(value, dict):
+        result = {}
+        for i, (key, item) in enumerate(value.items()):
+            if i >= MAX_ITEMS:
+                result["…"] = f"+{len(value) - MAX_ITEMS}"
+                break
+            result[key if type(key) is str else str(key)] = to_jsonable(item, depth + 1)
+        return result
+    if isinstance(value, (list, tuple)):
+        result = [to_jsonable(item, depth + 1) for item in value[:MAX_ITEMS]]
+        if len(value) > MAX_ITEMS:
+            result.append(f"…(+{len(value) - MAX_ITEMS})")
+        return result
+    if isinstance(value, (str, int, float)):  # наследники базовых типов
+        return to_jsonable(str(value) if isinstance(value, str) else value.real, depth)
+
+    converter = _converter_for(type(value))
+    if converter is not None:
+        try:
+            return to_jsonable(converter(value), depth + 1)
+        except Exception:
+            pass
+    try:
+        return _truncate(f"<{type(value).__name__}: {value!r}>")
+    except Exception:
+        return f"<{type(value).__name__}>"
+
+
+def dumps(value) -> str:
+    """json.dumps, который никогда не падает; EncodedJSON возвращается как есть."""
+    if isinstance(value, EncodedJSON):
+        return value
+    return json.dumps(to_jsonable(value), ensure_ascii=False)
+
+
+def payload_json(record):
+    """
+    Сериализованный payload записи лога. Кодируется один раз и кэшируется
+    на самой записи, сколько бы обработчиков её ни выводили.
+    """
+    try:
+        return record._payload_json
+    except AttributeError:
+        payload = getattr(record, "payload", None)
+        encoded = None if payload is None else EncodedJSON(dumps(payload))
+        record._payload_json = encoded
+        return encoded
+
+
+def dumps_with_payload(base: dict, payload) -> str:
+    """JSON-объект base с уже закодированным payload в конце, без повторного кодирования."""
+    head = json.dumps(to_jsonable(base), ensure_ascii=False)
+    separator = ", " if base else ""
+    return f'{head[:-1]}{separator}"payload": {payload if payload is not None else "null"}}}'
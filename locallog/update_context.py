@@ -0,0 +1,124 @@
+# locallog/update_context.py
+
+import logging
+from typing import Optional
+
+from telegram import Update, Message, Chat, User
+
+
+def extract_context_data(update: Update) -> dict:
+    """
+    Универсально извлекает данные о пользователе, чате и тексте из любого типа update.
+    Поддерживает message, edited_message, channel_post, callback_query, inline_query, chat_member и др.
+    """
+
+    msg: Optional[Message] = None
+    chat: Optional[Chat] = None
+    user: Optional[User] = None
+    text: Optional[str] = None
+    update_type: str = "unknown"
+
+    # --- 1. Определяем тип update и извлекаем базовые объекты ---
+    if update.message:
+        msg = update.message
+        update_type = "message"
+    elif update.edited_message:
+        msg = update.edited_message
+        update_type = "edited_message"
+    elif update.channel_post:
+        msg = update.channel_post
+        update_type = "channel_post"
+    elif update.edited_channel_post:
+        msg = update.edited_channel_post
+        update_type = "edited_channel_post"
+    elif update.callback_query:
+        msg = update.callback_query.message
+        user = update.callback_query.from_user
+        text = update.callback_query.data
+        update_type = "callback_query"
+    elif update.inline_query:
+        user = update.inline_query.from_user
+        text = update.inline_query.query
+        update_type = "inline_query"
+    elif update.my_chat_member:
+        chat = update.my_chat_member.chat
+        user = update.my_chat_member.from_user
+        update_type = "my_chat_member"
+    elif update.chat_member:
+        chat = update.chat_member.chat
+        user = update.chat_member.from_user
+        update_type = "chat_member"
+    elif hasattr(update, "message_reaction") and update.message_reaction:
+        msg = update.message_reaction.message
+        user = update.message_reaction.user
+        update_type = "message_reaction"
+
+    # --- 2. Извлекаем chat и user (если их ещё нет) ---
+    if msg:
+        chat = msg.chat
+        user = user or msg.from_user
+        text = text or getattr(msg, "text", None)
+
+    # --- 3. Извлекаем финальные данные ---
+    chat_id = getattr(chat, "id", None)
+    chatname = getattr(chat, "title", None) or getattr(chat, "username", None)
+    user_id = getattr(user, "id", None)
+    username = getattr(user, "username", None)
+
+    # --- 4. Возвращаем универсальный контекст ---
+    return {
+        "text": text[:500] if text else None,
+        "username": username,
+        "chatname": chatname,
+        "chat_id": chat_id,
+        "user_id": user_id,
+        "update_type": update_type,
+    }
+
+
+class UpdateContext:
+    """Ссылка на update текущей обработки; поля для лога разбираются один раз, при первой записи."""
+
+    __slots__ = ("update", "_fields")
+
+    def __init__(self, update):
+        self.update = update
+        self._fields = None
+
+    def fields(self) -> dict:
+        if self._fields is None:
+            ctx = extract_context_data(self.update)
+            self._fields = {
+                "chat_id": ctx["chat_id"],
+                "user_id": ctx["user_id"],
+                "payload": {
+                    "text": ctx["text"],
+                    "username": "@" + ctx["username"] if ctx["username"] else None,
+                    "chatname": ctx["chatname"],
+                    "update_type": ctx["update_type"],
+                },
+            }
+        return self._fields
+
+
+class UpdateContextFilter(logging.Filter):
+    """
+    Дополняет запись контекстом update (см. BotLoggerAdapter): chat_id, user_id
+    и payload, который сливается с payload вызова (у вызова приоритет).
+    Стоит в логгере после SamplingFilter, поэтому отброшенные выборкой записи
+    update не разбирают. Записи не отбрасывает.
+    """
+
+    def filter(self, record) -> bool:
+        context = getattr(record, "update_context", None)
+        if context is None:
+            return True
+        fields = context.fields()
+        if getattr(record, "chat_id", None) is None:
+            record.chat_id = fields["chat_id"]
+        if getattr(record, "user_id", None) is None:
+            record.user_id = fields["user_id"]
+        payload = getattr(record, "payload", None)
+        record.payload = {**fields["payload"], **payload} if payload else fields["payload"]
+        record.update_context = None
+        return True
@@ -0,0 +1,143 @@
+# permissions/roster.py
+import asyncio
+import time
+from collections import OrderedDict
+
+from telegram import ChatMember
+
+import config
+from locallog.logger import logger
+from permissions import store
+
+ADMIN_STATUSES = (ChatMember.OWNER, ChatMember.ADMINISTRATOR)
+
+
+class ChatRoster:
+    """Администраторы одного чата: {user_id: статус} и время загрузки."""
+    __slots__ = ("admins", "loaded_at")
+
+    def __init__(self, admins: dict, loaded_at: float):
+        self.admins = admins
+        self.loaded_at = loaded_at
+
+
+class AdminRoster:
+    """
+    Локальный список администраторов по чатам. Заполняется одним вызовом
+    get_chat_administrators, дальше обновляется из chat_member / my_chat_member
+    update'ов. Записи живут ttl секунд, число чатов ограничено max_chats (LRU),
+    так что к Telegram обращаемся только при промахе или истечении срока.
+
+    При persist=True каждое изменение дублируется в таблицу chat_admins —
+    по ней /my_chats находит чаты пользователя одним запросом. Строки есть
+    только у чатов, где админ сам бот: потеряв права, бот удаляет их.
+    """
+
+    def __init__(self, ttl: float = 600, max_chats: int = 10_000, persist: bool = True):
+        self.ttl = ttl
+        self.max_chats = max_chats
+        self.persist = persist
+        self._rosters = OrderedDict()  # chat_id -> ChatRoster
+        self._inflight = {}            # chat_id -> Task загрузки, чтобы не грузить один чат дважды
+        self.hits = 0
+        self.misses = 0
+        self.api_calls = 0
+
+    def _fresh(self, chat_id: int):
+        roster = self._rosters.get(chat_id)
+        if roster is None:
+            return None
+        if time.monotonic() - roster.loaded_at > self.ttl:
+            del self._rosters[chat_id]
+            return None
+        self._rosters.move_to_end(chat_id)
+        return roster
+
+    def _store(self, chat_id: int, admins: dict):
+        self._rosters[chat_id] = ChatRoster(admins, time.monotonic())
+        self._rosters.move_to_end(chat_id)
+        while len(self._rosters) > self.max_chats:
+            self._rosters.popitem(last=False)
+
+    async def _load(self, bot, chat_id: int) -> ChatRoster:
+        self.api_calls += 1
+        members = await bot.get_chat_administrators(chat_id)
+        admins = {member.user.id: member.status for member in members}
+        self._store(chat_id, admins)
+        if self.persist:
+            # Бот без прав админа чатом не управляет — в /my_chats его быть не должно
+            bot_id = getattr(bot, "id", None)
+            if bot_id is None or bot_id in admins:
+                await self._persist(store.replace_chat_admins(chat_id, admins), chat_id)
+            else:
+                await self._persist(store.delete_chat_admins(chat_id), chat_id)
+        return self._rosters[chat_id]
+
+    async def _persist(self, coro, chat_id: int):
+        # Индекс в БД вторичен: ошибка записи не должна ломать проверку прав
+        try:
+            await coro
+        except Exception:
+            logger.exception("Ошибка записи chat_admins",
+                             extra={"event_type": "admin_roster", "payload": {"chat_id": chat_id}})
+
+    async def get_roster(self, bot, chat_id: int) -> ChatRoster:
+        """Актуальный список админов чата; при промахе — один запрос к Telegram на всех ждущих."""
+        roster = self._fresh(chat_id)
+        if roster is not None:
+            self.hits += 1
+            return roster
+
+        self.misses += 1
+        task = self._inflight.get(chat_id)
+        if task is None:
+            task = asyncio.ensure_future(self._load(bot, chat_id))
+            self._inflight[chat_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(chat_id, None))
+        return await asyncio.shield(task)
+
+    async def get_role(self, bot, chat_id: int, user_id: int) -> str:
+        """Статус пользователя в чате; не-админы считаются участниками (ChatMember.MEMBER)."""
+        roster = await self.get_roster(bot, chat_id)
+        return roster.admins.get(user_id, ChatMember.MEMBER)
+
+    async def apply_member_update(self, chat_id: int, user_id: int, status: str, bot=None):
+        """
+        Инкрементальное обновление из chat_member: повышение, понижение, выход.
+        Если чат не загружен в память и передан bot, список загружается целиком
+        (уже с этим изменением): одна строка в chat_admins скрыла бы чат от
+        дозаполнения индекса, и остальных админов в нём бы не было.
+        """
+        is_admin = status in ADMIN_STATUSES
+        roster = self._rosters.get(chat_id)
+        if roster is None and bot is not None:
+            await self.get_roster(bot, chat_id)
+            return
+        if roster is not None:
+            if is_admin:
+                roster.admins[user_id] = status
+            else:
+                roster.admins.pop(user_id, None)
+        if self.persist:
+            await self._persist(store.set_chat_admin(chat_id, user_id, status if is_admin else None), chat_id)
+
+    def drop(self, chat_id: int):
+        self._rosters.pop(chat_id, None)
+
+    async def forget_chat(self, chat_id: int):
+        """Бот покинул чат или лишён прав: убираем список и из памяти, и из chat_admins."""
+        self.drop(chat_id)
+        if self.persist:
+            await self._persist(store.delete_chat_admins(chat_id), chat_id)
+
+    def stats(self) -> dict:
+        return {
+            "chats": len(self._rosters),
+            "hits": self.hits,
+            "misses": self.misses,
+            "api_calls": self.api_calls,
+        }
+
+
+# Глобальный экземпляр
+admin_roster = AdminRoster(ttl=config.ADMIN_ROSTER_TTL, max_chats=config.ADMIN_ROSTER_MAX_CHATS)
@@ -0,0 +1,51 @@
+# permissions/store.py
+from sqlalchemy import delete, exists, select
+
+from database.db import AsyncReadSession, AsyncSession
+from database.models import Chat, ChatAdmin
+
+
+async def replace_chat_admins(chat_id: int, admins: dict):
+    """Полностью заменяет список админов чата (после загрузки из Telegram)."""
+    async with AsyncSession() as session:
+        await session.execute(delete(ChatAdmin).where(ChatAdmin.chat_id == chat_id))
+        session.add_all(ChatAdmin(chat_id=chat_id, user_id=user_id, status=str(status))
+                        for user_id, status in admins.items())
+        await session.commit()
+
+
+async def set_chat_admin(chat_id: int, user_id: int, status):
+    """Инкрементальное изменение: status=None — пользователь больше не админ."""
+    async with AsyncSession() as session:
+        if status is None:
+            await session.execute(delete(ChatAdmin).where(ChatAdmin.chat_id == chat_id, ChatAdmin.user_id == user_id))
+        else:
+            await session.merge(ChatAdmin(chat_id=chat_id, user_id=user_id, status=str(status)))
+        await session.commit()
+
+
+async def delete_chat_admins(chat_id: int):
+    async with AsyncSession() as session:
+        await session.execute(delete(ChatAdmin).where(ChatAdmin.chat_id == chat_id))
+        await session.commit()
+
+
+async def get_managed_chats(user_id: int) -> list:
+    """Чаты, где пользователь админ: [(Chat, status)] одним запросом по индексу user_id."""
+    async with AsyncReadSession() as session:
+        result = await session.execute(
+            select(Chat, ChatAdmin.status)
+            .join(ChatAdmin, ChatAdmin.chat_id == Chat.id)
+            .where(ChatAdmin.user_id == user_id)
+            .order_by(Chat.id)
+        )
+        return result.all()
+
+
+async def chats_without_admins() -> list:
+    """Зарегистрированные чаты, для которых список админов ещё ни разу не сохранялся."""
+    async with AsyncReadSession() as session:
+        result = await session.scalars(
+            select(Chat.id).where(~exists().where(ChatAdmin.chat_id == Chat.id))
+        )
+        return result.all()
@@ -0,0 +1,230 @@
+# runtime/outbound.py
+import asyncio
+import heapq
+import itertools
+import time
+from collections import OrderedDict, defaultdict
+from datetime import timedelta
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+import config
+from locallog.logger import logger
+
+# Приоритеты (меньше — раньше): ответы в админке важнее ответов триггеров
+PRIORITY_UI = 0
+PRIORITY_TRIGGER = 10
+
+# Методы, на которые действуют лимиты Telegram на сообщения
+THROTTLED_PREFIXES = ("send", "edit", "copy", "forward")
+
+
+class TokenBucket:
+    """rate токенов в секунду, не больше capacity; pause() блокирует до момента (после RetryAfter)."""
+    __slots__ = ("rate", "capacity", "tokens", "updated", "paused_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def wait_time(self, now: float) -> float:
+        """Через сколько секунд будет доступен токен (0 — уже есть)."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.paused_until:
+            return self.paused_until - now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def pause(self, until: float):
+        self.paused_until = max(self.paused_until, until)
+        self.tokens = 0
+
+
+class ChatQueue:
+    """Очередь отправки в один чат: порядок сообщений и лимит чата."""
+    __slots__ = ("lock", "bucket", "depth")
+
+    def __init__(self, bucket: TokenBucket):
+        self.lock = asyncio.Lock()
+        self.bucket = bucket
+        self.depth = 0
+
+
+class OutboundScheduler(BaseRateLimiter):
+    """
+    Планировщик исходящих запросов бота (подключается как rate_limiter ExtBot,
+    поэтому через него идут все вызовы, включая действия триггеров).
+
+    Сообщения в один чат отправляются по очереди с лимитом чата (группы —
+    group_per_minute в минуту, личка — private_rate в секунду), затем
+    ждут общий токен (global_rate в секунду). Общие токены раздаются по
+    приоритету из rate_limit_args={"priority": ...}: PRIORITY_UI раньше
+    PRIORITY_TRIGGER. RetryAfter приостанавливает чат (или всю отправку,
+    если чат неизвестен) на указанное время и повторяет запрос до max_retries раз.
+    Методы без лимитов на сообщения (get_*, answer_callback_query и т.п.)
+    идут сразу, но RetryAfter обрабатывается и для них.
+    """
+
+    def __init__(self, global_rate: float = 30, global_burst: float = 5, group_per_minute: float = 20,
+                 group_burst: float = 3, private_rate: float = 1, private_burst: float = 5,
+                 max_retries: int = 3, max_chats: int = 10_000):
+        # Небольшой burst: иначе после простоя за первую секунду уходит почти 2 × global_rate
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.group_rate = group_per_minute / 60
+        self.group_burst = group_burst
+        self.private_rate = private_rate
+        self.private_burst = private_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self._chats = OrderedDict()  # chat_id -> ChatQueue, LRU
+        self._waiters = []           # куча (priority, seq, future) ждущих общий токен
+        self._seq = itertools.count()
+        self._dispatcher = None
+        self.sent = 0
+        self.retries = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.waiting_by_priority = defaultdict(int)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        for _, _, future in self._waiters:
+            if not future.done():
+                future.cancel()
+        self._waiters.clear()
+
+    def _chat_queue(self, chat_id) -> ChatQueue:
+        queue = self._chats.get(chat_id)
+        if queue is None:
+            is_group = isinstance(chat_id, str) or chat_id < 0  # @username каналов/групп или отрицательный id
+            bucket = (TokenBucket(self.group_rate, self.group_burst) if is_group
+                      else TokenBucket(self.private_rate, self.private_burst))
+            queue = self._chats[chat_id] = ChatQueue(bucket)
+            # Вытесняем только простаивающие чаты
+            for old_id in list(itertools.islice(self._chats, max(0, len(self._chats) - self.max_chats))):
+                if self._chats[old_id].depth == 0:
+                    del self._chats[old_id]
+        else:
+            self._chats.move_to_end(chat_id)
+        return queue
+
+    async def _acquire_global(self, priority: int):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        self.waiting_by_priority[priority] += 1
+        try:
+            await future
+        finally:
+            self.waiting_by_priority[priority] -= 1
+
+    async def _dispatch(self):
+        # Один раздающий цикл: следующий токен получает ждущий с наименьшим приоритетом
+        while self._waiters:
+            delay = self.global_bucket.wait_time(time.monotonic())
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.global_bucket.take()
+                future.set_result(None)
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        priority = (rate_limit_args or {}).get("priority", PRIORITY_UI)
+        chat_id = data.get("chat_id")
+        if not endpoint.startswith(THROTTLED_PREFIXES):
+            return await self._call(callback, args, kwargs)
+        if chat_id is None:
+            return await self._send(callback, args, kwargs, None, priority)
+
+        queue = self._chat_queue(chat_id)
+        queue.depth += 1
+        try:
+            async with queue.lock:
+                return await self._send(callback, args, kwargs, queue, priority)
+        finally:
+            queue.depth -= 1
+
+    async def _send(self, callback, args, kwargs, queue, priority):
+        enqueued = time.monotonic()
+        for attempt in itertools.count():
+            if queue is not None:
+                while (delay := queue.bucket.wait_time(time.monotonic())) > 0:
+                    await asyncio.sleep(delay)
+                queue.bucket.take()
+            await self._acquire_global(priority)
+
+            wait = time.monotonic() - enqueued
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt >= self.max_retries:
+                    self.failed += 1
+                    raise
+                self._on_retry_after(e, queue)  # пауза через бакет чата или общий
+                continue
+            self.sent += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            return result
+
+    async def _call(self, callback, args, kwargs):
+        for attempt in itertools.count():
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt >= self.max_retries:
+                    self.failed += 1
+                    raise
+                await asyncio.sleep(self._on_retry_after(e, None))
+
+    def _on_retry_after(self, error: RetryAfter, queue) -> float:
+        retry_after = error.retry_after
+        seconds = retry_after.total_seconds() if isinstance(retry_after, timedelta) else float(retry_after)
+        self.retries += 1
+        # Пауза для чата, если он известен, иначе — для всей отправки
+        (queue.bucket if queue is not None else self.global_bucket).pause(time.monotonic() + seconds)
+        logger.warning("Flood control: RetryAfter", extra={"event_type": "outbound", "payload": {"seconds": seconds}})
+        return seconds
+
+    def stats(self, top: int = 5) -> dict:
+        deepest = sorted(self._chats, key=lambda chat_id: self._chats[chat_id].depth, reverse=True)[:top]
+        return {
+            "sent": self.sent,
+            "retries": self.retries,
+            "failed": self.failed,
+            "waiting_global": len(self._waiters),
+            "waiting_by_priority": {priority: n for priority, n in self.waiting_by_priority.items() if n},
+            "queued_chats": sum(1 for queue in self._chats.values() if queue.depth),
+            "deepest": {str(chat_id): self._chats[chat_id].depth for chat_id in deepest
+                        if self._chats[chat_id].depth},
+            "avg_wait_ms": round(self.total_wait / self.sent * 1000, 2) if self.sent else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+        }
+
+
+# Глобальный экземпляр
+outbound_scheduler = OutboundScheduler(
+    global_rate=config.OUTBOUND_GLOBAL_RATE,
+    global_burst=config.OUTBOUND_GLOBAL_BURST,
+    group_per_minute=config.OUTBOUND_GROUP_PER_MINUTE,
+    group_burst=config.OUTBOUND_GROUP_BURST,
+    private_rate=config.OUTBOUND_PRIVATE_RATE,
+    private_burst=config.OUTBOUND_PRIVATE_BURST,
+    max_retries=config.OUTBOUND_MAX_RETRIES,
+)
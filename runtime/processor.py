@@ -0,0 +1,218 @@
+# runtime/processor.py
+import asyncio
+import contextlib
+import time
+from collections import OrderedDict
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+import config
+
+
+def ordering_key(update):
+    """
+    Ключ очереди: update'ы с одним ключом обрабатываются строго по порядку.
+    Для лички id чата совпадает с id пользователя, так что его диалог тоже
+    упорядочен. None — порядок не важен (нет ни чата, ни пользователя).
+    """
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return ("user", update.effective_user.id)
+    return None
+
+
+class KeyStats:
+    """Очередь одного чата и её метрики."""
+    __slots__ = ("lock", "depth", "processed", "total_wait", "max_wait")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.depth = 0        # ждут + обрабатывается сейчас
+        self.processed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+
+class OrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Параллельная обработка update'ов с сохранением порядка внутри чата.
+
+    Update сначала встаёт в очередь своего чата (asyncio.Lock отдаёт владение
+    в порядке FIFO), и только дойдя до её головы, занимает один из
+    max_concurrent слотов. Поэтому длинная очередь одного чата не держит
+    слоты, нужные остальным.
+
+    PTB забирает update'ы из update_queue и создаёт на каждый задачу, не
+    дожидаясь процессора, поэтому update'ы в работе считаются здесь, на входе
+    (pending). При pending >= max_pending процессор насыщен (saturated): очередь
+    GatedUpdateQueue перестаёт отдавать update'ы, пока он не освободится, и
+    предел действительно ограничивает число задач и память.
+    """
+
+    def __init__(self, max_concurrent: int = 16, max_pending: int = 1000, max_tracked: int = 10_000):
+        max_pending = max(max_pending, max_concurrent)
+        super().__init__(max_pending)
+        self.max_concurrent = max_concurrent
+        self.max_pending = max_pending
+        self.max_tracked = max_tracked
+        self.pending = 0             # взяты в работу и ещё не завершились
+        self._admitted = 0           # учтены при выдаче из очереди, задача ещё не дошла до process_update
+        self._ready = asyncio.Event()  # не насыщен
+        self._ready.set()
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._queues = {}            # key -> KeyStats, пока в очереди ключа есть update'ы
+        self._stats = OrderedDict()  # key -> KeyStats для метрик, LRU
+        self.active = 0
+        self.queued = 0              # ждут своей очереди или свободного слота
+        self.processed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    @property
+    def saturated(self) -> bool:
+        return self.pending >= self.max_pending
+
+    @property
+    def room(self) -> int:
+        """Сколько ещё update'ов можно взять в работу."""
+        return max(0, self.max_pending - self.pending)
+
+    async def wait_ready(self):
+        """Ждёт, пока процессор не насыщен."""
+        await self._ready.wait()
+
+    def admit(self):
+        """Учитывает update в момент выдачи из очереди — раньше, чем PTB создаст для него задачу."""
+        self._admitted += 1
+        self._add_pending()
+
+    def _add_pending(self):
+        self.pending += 1
+        if self.saturated:
+            self._ready.clear()
+
+    async def process_update(self, update, coroutine):
+        # В BaseUpdateProcessor метод помечен @final только для проверки типов; переопределяем,
+        # чтобы учитывать и update'ы, пришедшие не через GatedUpdateQueue, ещё до семафора PTB
+        if self._admitted:
+            self._admitted -= 1
+        else:
+            self._add_pending()
+        try:
+            await super().process_update(update, coroutine)
+        finally:
+            self.pending -= 1
+            if not self.saturated:
+                self._ready.set()
+
+    def _key_stats(self, key) -> KeyStats:
+        # Очередь с update'ами берётся из _queues, даже если её метрики уже вытеснены из LRU
+        stats = self._queues.get(key) or self._stats.get(key) or KeyStats()
+        self._stats[key] = stats
+        self._stats.move_to_end(key)
+        while len(self._stats) > self.max_tracked:
+            self._stats.popitem(last=False)
+        return stats
+
+    async def do_process_update(self, update, coroutine):
+        key = ordering_key(update)
+        stats = None
+        if key is not None:
+            stats = self._key_stats(key)
+            self._queues[key] = stats
+            stats.depth += 1
+        enqueued = time.monotonic()
+        self.queued += 1
+        started = False
+        try:
+            async with stats.lock if stats is not None else contextlib.nullcontext():
+                async with self._slots:
+                    self.queued -= 1
+                    started = True
+                    self._record_wait(time.monotonic() - enqueued, stats)
+                    self.active += 1
+                    try:
+                        await coroutine
+                    finally:
+                        self.active -= 1
+        finally:
+            if not started:
+                self.queued -= 1  # отменён, не дождавшись очереди
+            if stats is not None:
+                stats.depth -= 1
+                if stats.depth <= 0:
+                    self._queues.pop(key, None)
+
+    def _record_wait(self, wait: float, stats: KeyStats):
+        self.processed += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        if stats is not None:
+            stats.processed += 1
+            stats.total_wait += wait
+            stats.max_wait = max(stats.max_wait, wait)
+
+    def chat_stats(self, key) -> dict:
+        stats = self._queues.get(key) or self._stats.get(key)
+        if stats is None:
+            return {"depth": 0, "processed": 0, "avg_wait_ms": 0.0, "max_wait_ms": 0.0}
+        return {
+            "depth": stats.depth,
+            "processed": stats.processed,
+            "avg_wait_ms": round(stats.total_wait / stats.processed * 1000, 2) if stats.processed else 0.0,
+            "max_wait_ms": round(stats.max_wait * 1000, 2),
+        }
+
+    def stats(self, top: int = 5) -> dict:
+        deepest = sorted(self._queues, key=lambda key: self._queues[key].depth, reverse=True)[:top]
+        slowest = sorted(self._stats, key=lambda key: self._stats[key].max_wait, reverse=True)[:top]
+        return {
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "saturated": self.saturated,
+            "active": self.active,
+            "queued": self.queued,
+            "queued_chats": len(self._queues),
+            "processed": self.processed,
+            "avg_wait_ms": round(self.total_wait / self.processed * 1000, 2) if self.processed else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+            "deepest": {str(key): self.chat_stats(key) for key in deepest},
+            "slowest": {str(key): self.chat_stats(key) for key in slowest},
+        }
+
+
+class GatedUpdateQueue(asyncio.Queue):
+    """
+    update_queue приложения, которая не отдаёт update'ы насыщенному процессору.
+    Пока процессор занят, update'ы копятся здесь (до maxsize), а дальше
+    блокируется put у polling и отвечает 503 webhook.
+    """
+
+    def __init__(self, processor: OrderedUpdateProcessor, maxsize: int = 0):
+        super().__init__(maxsize)
+        self.processor = processor
+
+    async def get(self):
+        while True:
+            await self.processor.wait_ready()
+            if not self.processor.saturated:  # между пробуждением и этой строкой слот мог занять другой
+                break
+        item = await super().get()
+        if isinstance(item, Update):  # служебный сигнал остановки PTB не учитываем
+            self.processor.admit()
+        return item
+
+
+# Глобальный экземпляр
+update_processor = OrderedUpdateProcessor(max_concurrent=config.UPDATE_CONCURRENCY,
+                                          max_pending=config.UPDATE_MAX_PENDING)
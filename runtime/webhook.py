@@ -0,0 +1,229 @@
+# runtime/webhook.py
+import asyncio
+import hmac
+import json
+import signal
+
+from telegram import Update
+
+from locallog.logger import logger
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed",
+           408: "Request Timeout", 411: "Length Required", 413: "Payload Too Large", 503: "Service Unavailable"}
+
+
+class WebhookServer:
+    """
+    Минимальный HTTP/1.1 сервер на asyncio для приёма update'ов от Telegram.
+
+    POST на path принимает один update (как шлёт Telegram) или JSON-массив
+    update'ов (пакет — для воспроизведения записанных update'ов). Заголовок
+    X-Telegram-Bot-Api-Secret-Token сверяется с secret_token. Пакет кладётся
+    в update_queue целиком или не кладётся вовсе: если места не хватает,
+    отвечаем 503 с Retry-After, и Telegram (или replay) повторит запрос позже.
+    Место считается по update'ам в работе (их считает OrderedUpdateProcessor)
+    и по очереди, которую GatedUpdateQueue не отдаёт насыщенному процессору
+    (см. capacity). GET /healthz возвращает статистику.
+    """
+
+    def __init__(self, app, secret_token: str, host: str = "0.0.0.0", port: int = 8443,
+                 path: str = "/telegram", max_body: int = 1024 * 1024, read_timeout: float = 30.0,
+                 retry_after: int = 1):
+        if not secret_token:
+            raise ValueError("Для webhook нужен WEBHOOK_SECRET")
+        self.app = app
+        self.secret_token = secret_token.encode()
+        self.host = host
+        self.port = port
+        self.path = path
+        self.max_body = max_body
+        self.read_timeout = read_timeout
+        self.retry_after = retry_after
+        self._server = None
+        self._connections = set()  # задачи открытых соединений — закрываются в stop()
+        self.requests = 0
+        self.accepted = 0
+        self.rejected_full = 0
+        self.rejected_auth = 0
+        self.rejected_bad = 0
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        # port=0 — свободный порт (для тестов)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            # Keep-alive соединения сами не закроются: отменяем их обработчики
+            for task in list(self._connections):
+                task.cancel()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            keep_alive = True
+            while keep_alive:
+                request = await asyncio.wait_for(self._read_request(reader), self.read_timeout)
+                if request is None:
+                    break
+                method, target, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                status, payload, extra = self._respond(method, target, headers, body)
+                self._write_response(writer, status, payload, extra, keep_alive)
+                await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except _HTTPError as e:
+            self._write_response(writer, e.status, {"error": REASONS[e.status]}, {}, keep_alive=False)
+        except asyncio.CancelledError:
+            pass  # stop(): сервер закрывается, соединение просто обрывается
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None  # клиент закрыл keep-alive соединение
+        try:
+            method, target, _ = line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise _HTTPError(400)
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            raise _HTTPError(411)
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            raise _HTTPError(400)
+        if length > self.max_body:
+            raise _HTTPError(413)
+        body = await reader.readexactly(length) if length else b""
+        return method, target, headers, body
+
+    def _respond(self, method, target, headers, body):
+        self.requests += 1
+        path = target.split("?", 1)[0]
+        if path == "/healthz" and method == "GET":
+            return 200, self.stats(), {}
+        if path != self.path:
+            return 404, {"error": REASONS[404]}, {}
+        if method != "POST":
+            return 405, {"error": REASONS[405]}, {}
+
+        if not hmac.compare_digest(headers.get(SECRET_HEADER, "").encode(), self.secret_token):
+            self.rejected_auth += 1
+            logger.warning("Webhook: неверный секрет", extra={"event_type": "webhook"})
+            return 403, {"error": REASONS[403]}, {}
+
+        try:
+            data = json.loads(body)
+            items = data if isinstance(data, list) else [data]
+            updates = [Update.de_json(item, self.app.bot) for item in items]
+        except Exception:
+            self.rejected_bad += 1
+            return 400, {"error": REASONS[400]}, {}
+
+        if self.capacity() < len(updates):
+            # Бэкпрешер: не принимаем то, что не поместится, — отправитель повторит
+            self.rejected_full += 1
+            return 503, {"error": REASONS[503]}, {"Retry-After": str(self.retry_after)}
+        for update in updates:
+            self.app.update_queue.put_nowait(update)
+        self.accepted += len(updates)
+        return 200, {"accepted": len(updates)}, {}
+
+    def capacity(self) -> float:
+        """
+        Сколько update'ов можно принять сейчас. С GatedUpdateQueue место в
+        очереди уже отражает насыщение процессора. Update'ы в работе сверх
+        max_pending (очередь без шлюза) вычитаются. Для очереди без предела
+        остаётся только место у процессора.
+        """
+        queue = self.app.update_queue
+        processor = self.app.update_processor
+        pending = getattr(processor, "pending", None)
+        if pending is None:  # процессор без учёта update'ов в работе
+            return queue.maxsize - queue.qsize() if queue.maxsize else float("inf")
+        if not queue.maxsize:
+            return processor.max_pending - pending - queue.qsize()
+        return queue.maxsize - queue.qsize() - max(0, pending - processor.max_pending)
+
+    @staticmethod
+    def _write_response(writer, status, payload, extra, keep_alive):
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        head = [f"HTTP/1.1 {status} {REASONS[status]}",
+                "Content-Type: application/json",
+                f"Content-Length: {len(body)}",
+                f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        head += [f"{name}: {value}" for name, value in extra.items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + body)
+
+    def stats(self) -> dict:
+        queue = self.app.update_queue
+        return {
+            "requests": self.requests,
+            "accepted": self.accepted,
+            "rejected_full": self.rejected_full,
+            "rejected_auth": self.rejected_auth,
+            "rejected_bad": self.rejected_bad,
+            "queue": queue.qsize(),
+            "queue_max": queue.maxsize,
+            "pending": getattr(self.app.update_processor, "pending", None),
+            "connections": len(self._connections),
+        }
+
+
+class _HTTPError(Exception):
+    def __init__(self, status: int):
+        super().__init__(status)
+        self.status = status
+
+
+async def serve_webhook(app, server: WebhookServer, webhook_url: str = None, max_connections: int = 40):
+    """
+    Жизненный цикл бота в режиме webhook (аналог run_polling): инициализация,
+    post_init, приём update'ов до SIGINT/SIGTERM, корректная остановка.
+    Без webhook_url set_webhook не вызывается — удобно для локальных прогонов.
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await app.initialize()
+    try:
+        if app.post_init:
+            await app.post_init(app)
+        await server.start()
+        if webhook_url:
+            await app.bot.set_webhook(webhook_url, secret_token=server.secret_token.decode(),
+                                      allowed_updates=Update.ALL_TYPES, max_connections=max_connections)
+        await app.start()
+        logger.info("Webhook запущен", extra={"event_type": "startup",
+                    "payload": {"host": server.host, "port": server.port, "path": server.path}})
+        await stop.wait()
+    finally:
+        await server.stop()
+        if app.running:
+            await app.stop()
+        if app.post_stop:
+            await app.post_stop(app)
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+        logger.info("Webhook остановлен", extra={"event_type": "shutdown", "payload": server.stats()})
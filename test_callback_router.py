@@ -0,0 +1,101 @@
+# test_callback_router.py
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from callbacks.router import MAX_CALLBACK_BYTES, CallbackRouter
+
+
+calls = []
+
+
+async def handler(update, context, *args, **fixed):
+    calls.append((args, fixed))
+
+
+@pytest.fixture
+def router():
+    router = CallbackRouter(version=3, min_version=0)
+    router.add("chat_settings", handler, int, aliases=("settings",))
+    router.add("local_edit_cat", handler, int, int, is_group=False)
+    router.add("back", handler)
+    return router
+
+
+def test_build_and_parse_round_trip(router):
+    data = router.build("local_edit_cat", 5, -100)
+    assert data == "~3|local_edit_cat|5|-100"
+    route, args = router.parse(data)
+    assert route.action == "local_edit_cat"
+    assert args == (5, -100)
+    assert route.fixed == {"is_group": False}
+
+
+def test_unversioned_data_is_version_zero(router):
+    route, args = router.parse("chat_settings|-100")
+    assert (route.action, args) == ("chat_settings", (-100,))
+    router.min_version = 1
+    assert router.parse("chat_settings|-100") is None
+
+
+@pytest.mark.parametrize("data", [
+    "~4|back",              # новее текущей версии (после отката)
+    "~x|back",              # версия не число
+    "~|back",               # версия пустая
+    "~3",                   # только версия
+    "",
+    None,
+])
+def test_rejects_bad_versions(router, data):
+    assert router.parse(data) is None
+
+
+def test_rejects_old_versions_below_minimum(router):
+    router.min_version = 2
+    assert router.parse("~1|back") is None
+    assert router.parse("~2|back") is not None
+
+
+@pytest.mark.parametrize("data", [
+    "~3|unknown",             # неизвестное действие
+    "~3|chat_settings",       # не хватает аргумента
+    "~3|chat_settings|1|2",   # лишний аргумент
+    "~3|chat_settings|abc",   # аргумент не того типа
+])
+def test_rejects_bad_actions_and_args(router, data):
+    assert router.parse(data) is None
+
+
+def test_aliases_share_route(router):
+    route, args = router.parse("~3|settings|7")
+    assert route.action == "chat_settings" and args == (7,)
+
+
+def test_build_checks_arguments_and_size(router):
+    with pytest.raises(ValueError):
+        router.build("unknown")
+    with pytest.raises(ValueError):
+        router.build("chat_settings")
+    with pytest.raises(ValueError):
+        router.build("chat_settings", "x" * MAX_CALLBACK_BYTES)
+    with pytest.raises(ValueError):
+        router.add("back", handler)
+
+
+def test_dispatch_calls_handler_or_rejects(router):
+    answered = []
+
+    async def answer():
+        answered.append(True)
+
+    def update(data):
+        return SimpleNamespace(callback_query=SimpleNamespace(data=data, answer=answer))
+
+    calls.clear()
+    asyncio.run(router.dispatch(update("~3|local_edit_cat|5|-100"), None))
+    assert calls == [((5, -100), {"is_group": False})]
+    asyncio.run(router.dispatch(update("~9|back"), None))
+    assert answered == [True]  # отклонённая кнопка получает ответ, обработчик не вызывается
+    assert len(calls) == 1
+    assert router.stats() == {"routes": 4, "dispatched": 1, "rejected": 1}
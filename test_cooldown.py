@@ -0,0 +1,53 @@
+# test_cooldown.py
+from triggers.cooldown import COALESCED, COOLDOWN, ReplyCooldown
+
+
+def test_first_trigger_is_allowed():
+    assert ReplyCooldown().check(1, 10, now=0) is None
+
+
+def test_repeats_coalesce_while_reply_is_in_flight():
+    cooldown = ReplyCooldown(cooldown=60, coalesce_window=5)
+    cooldown.begin(1, 10)
+    assert cooldown.check(1, 10, now=0) == COALESCED
+    assert cooldown.check(1, 11, now=0) is None  # другая категория
+    assert cooldown.check(2, 10, now=0) is None  # другой чат
+
+
+def test_windows_after_sent_reply():
+    cooldown = ReplyCooldown(cooldown=60, coalesce_window=5)
+    cooldown.begin(1, 10)
+    cooldown.finish(1, 10, now=100)
+    assert cooldown.check(1, 10, now=103) == COALESCED
+    assert cooldown.check(1, 10, now=130) == COOLDOWN
+    assert cooldown.check(1, 10, now=160) is None
+
+
+def test_failed_send_does_not_start_cooldown():
+    cooldown = ReplyCooldown(cooldown=60, coalesce_window=5)
+    cooldown.begin(1, 10)
+    cooldown.finish(1, 10, sent=False, now=100)
+    assert cooldown.check(1, 10, now=100) is None
+    assert cooldown.replies == 0
+
+
+def test_stats_count_suppressed_by_reason_and_key():
+    cooldown = ReplyCooldown(cooldown=60, coalesce_window=5)
+    cooldown.begin(1, 10)
+    cooldown.check(1, 10, now=0)
+    cooldown.check(1, 10, now=0)
+    cooldown.finish(1, 10, now=0)
+    cooldown.check(1, 10, now=30)
+    stats = cooldown.stats()
+    assert stats["replies"] == 1
+    assert stats["suppressed_by_reason"] == {COALESCED: 2, COOLDOWN: 1}
+    assert stats["top_suppressed"] == {"1:10": 3}
+
+
+def test_keys_are_bounded():
+    cooldown = ReplyCooldown(cooldown=60, coalesce_window=5, max_keys=3)
+    for chat_id in range(10):
+        cooldown.begin(chat_id, 1)
+    assert len(cooldown._states) == 3
+    assert cooldown.check(9, 1) == COALESCED
+    assert cooldown.check(0, 1) is None
@@ -0,0 +1,71 @@
+# test_counters.py
+from datetime import datetime, timezone
+
+from triggers.counters import SlidingWindowCounter
+
+NOW = 1_700_000_000.0
+
+
+def test_count_within_window():
+    counter = SlidingWindowCounter(horizon_minutes=10)
+    for offset in (200, 90, 30, 0):  # события приходят по времени
+        counter.add(1, 2, 3, NOW - offset)
+    assert counter.count(1, 2, 3, 1, now=NOW) == 2
+    assert counter.count(1, 2, 3, 5, now=NOW) == 4
+    assert counter.count(1, 2, 4, 5, now=NOW) == 0  # другая категория
+    assert counter.count(1, 9, 3, 5, now=NOW) == 0  # другой пользователь
+
+
+def test_events_beyond_horizon_are_dropped():
+    counter = SlidingWindowCounter(horizon_minutes=1)
+    counter.add(1, 2, 3, NOW - 120)
+    counter.add(1, 2, 3, NOW)
+    assert counter.count(1, 2, 3, 5, now=NOW) == 1
+
+
+def test_events_per_key_are_bounded():
+    counter = SlidingWindowCounter(max_events=4)
+    for i in range(10):
+        counter.add(1, 2, 3, NOW - i)
+    assert counter.count(1, 2, 3, 10, now=NOW) == 4
+
+
+def test_count_many_matches_count():
+    counter = SlidingWindowCounter(horizon_minutes=10)
+    for offset in (400, 100, 0):
+        counter.add(1, 2, 3, NOW - offset)
+        counter.add(1, 2, 4, NOW - offset * 2)
+    windows = [(3, 1), (3, 5), (3, 10), (4, 5), (5, 5)]
+    assert counter.count_many(1, 2, windows, now=NOW) == {
+        (category_id, minutes): counter.count(1, 2, category_id, minutes, now=NOW) for category_id, minutes in windows
+    }
+
+
+def test_stale_and_excess_keys_are_evicted():
+    counter = SlidingWindowCounter(horizon_minutes=1, max_keys=2)
+    counter.add(1, 1, 1, NOW - 600)
+    counter.add(1, 2, 1, NOW)   # первый ключ уже за горизонтом
+    counter.add(1, 3, 1, NOW)
+    counter.add(1, 4, 1, NOW)   # сверх max_keys
+    assert counter.stats()["keys"] == 2
+    assert counter.count(1, 4, 1, 1, now=NOW) == 1
+    assert counter.count(1, 2, 1, 1, now=NOW) == 0
+
+
+def test_ensure_horizon_only_grows():
+    counter = SlidingWindowCounter(horizon_minutes=10)
+    counter.ensure_horizon(5)
+    assert counter.horizon == 600
+    counter.ensure_horizon(30)  # без цикла событий — только горизонт, историю загрузит rebuild()
+    assert counter.horizon == 1800
+
+
+def test_prepend_keeps_newer_events():
+    counter = SlidingWindowCounter(horizon_minutes=60, max_events=3)
+    counter.add(1, 2, 3, NOW - 10)
+    counter.add(1, 2, 3, NOW)
+    older = [datetime.fromtimestamp(NOW - offset, timezone.utc).replace(tzinfo=None) for offset in (300, 200, 100, 5)]
+    counter._prepend([(1, 2, 3, timestamp) for timestamp in older])
+    # Места одно: из событий старше известных берётся самое свежее (NOW - 5 уже не старше)
+    assert list(counter._events[(1, 2, 3)]) == [NOW - 100, NOW - 10, NOW]
+    assert counter.stats()["backfilled"] == 1
@@ -0,0 +1,62 @@
+# test_fuzzy.py
+from triggers.fuzzy import FuzzyIndex, within_distance
+from triggers.normalize import MessageText
+
+
+def index(*keywords, **kwargs):
+    built = FuzzyIndex(**kwargs)
+    for value, keyword in enumerate(keywords):
+        built.add(keyword, value)
+    return built
+
+
+def test_within_distance_edit_operations():
+    assert within_distance("привет", "привет", 1)
+    assert within_distance("привет", "превет", 1)     # замена
+    assert within_distance("привет", "приветт", 1)    # вставка
+    assert within_distance("привет", "привт", 1)      # удаление
+    assert within_distance("привет", "пирвет", 1)     # перестановка соседних
+    assert not within_distance("привет", "пока", 1)
+    assert not within_distance("привет", "прывот", 1)
+    assert within_distance("привет", "прывот", 2)
+
+
+def test_search_finds_typos_and_reports_position():
+    fuzzy = index("привет", "спасибо")
+    assert fuzzy.search(MessageText("ну превет")) == {0: 3}
+    assert fuzzy.search(MessageText("спосибо и привет")) == {1: 0, 0: 10}
+    assert fuzzy.search(MessageText("пока")) == {}
+
+
+def test_short_keywords_match_only_exactly():
+    fuzzy = index("кот", min_length=4)
+    assert fuzzy.search(MessageText("кот")) == {0: 0}
+    assert fuzzy.search(MessageText("кит")) == {}
+
+
+def test_phrases_need_every_word():
+    fuzzy = index("добрый вечер")
+    assert fuzzy.search(MessageText("добрый вечр")) == {0: 0}
+    assert fuzzy.search(MessageText("добрый день")) == {}
+
+
+# Ключи с общими биграммами, но в двух правках друг от друга: "0слово0", "1слово1", ...
+KEYWORDS = [f"{i}слово{i}" for i in range(10)]
+
+
+def test_budget_is_counted_in_candidates():
+    fuzzy = index(*KEYWORDS, max_candidates=10)
+    assert fuzzy.search(MessageText("1слово1")) == {}
+    assert fuzzy.over_budget == 1
+    assert index(*KEYWORDS).search(MessageText("1слово1")) == {1: 0}
+
+
+def test_budget_is_deterministic_with_cache():
+    # Запомненное слово списывает столько же кандидатов, сколько при подсчёте:
+    # повторный поиск обрывается на том же слове, что и первый
+    per_word = index(*KEYWORDS)._near("1слово1")[1]
+    fuzzy = index(*KEYWORDS, max_candidates=per_word * 2)
+    text = MessageText("1слово1 2слово2 3слово3")
+    assert fuzzy.search(text) == {1: 0, 2: 8}
+    assert fuzzy.search(text) == {1: 0, 2: 8}
+    assert fuzzy.over_budget == 2
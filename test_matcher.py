@@ -0,0 +1,90 @@
+# test_matcher.py
+from types import SimpleNamespace
+
+import pytest
+
+from triggers.matcher import (KEYWORD_MODE_FUZZY, KEYWORD_MODE_TOKEN, CompiledCategories, KeywordAutomaton)
+from triggers.normalize import MessageText, fold_text, normalize_text
+
+
+def category(*terms, mode=None, priority=0):
+    return SimpleNamespace(terms=terms, keyword_mode=mode, priority=priority)
+
+
+def automaton(*keywords):
+    built = KeywordAutomaton()
+    for index, keyword in enumerate(keywords):
+        built.add(keyword, index)
+    return built.build()
+
+
+def test_automaton_finds_all_keywords_in_one_pass():
+    assert automaton("he", "she", "his", "hers").search("ushers") == {1: 1, 0: 2, 3: 2}
+
+
+def test_automaton_reports_first_occurrence():
+    assert automaton("ab").search("xxabyyab") == {0: 2}
+
+
+def test_automaton_overlapping_and_nested_keywords():
+    # "abc" заканчивается в узле, чья суффиксная ссылка ведёт в "bc" и "c"
+    assert automaton("abc", "bc", "c").search("abc") == {0: 0, 1: 1, 2: 2}
+
+
+def test_automaton_no_match_and_empty_keyword():
+    built = automaton("", "кот")
+    assert len(built) == 3
+    assert built.search("собака") == {}
+
+
+def test_automaton_is_frozen_after_build():
+    built = automaton("a")
+    with pytest.raises(RuntimeError):
+        built.add("b", 1)
+
+
+def test_normalization_forms():
+    assert fold_text("  Ёжик\tВ  ТУМАНЕ ") == "ежик в тумане"
+    assert fold_text("５%") == "5%"
+    assert normalize_text("Привет, мир!") == "привет мир"
+    assert normalize_text(normalize_text("а-б")) == normalize_text("а-б")
+
+
+def test_message_text_tokens_keep_positions_in_folded_text():
+    text = MessageText("Ну, привет!  Мир")
+    assert text.tokens == ["ну", "привет", "мир"]
+    assert [text.folded[start:start + len(token)] for token, start in zip(text.tokens, text.starts)] == text.tokens
+
+
+def test_substring_mode_keeps_punctuation():
+    compiled = CompiledCategories([category("5%"), category("?!"), category("c++")])
+    assert compiled.matches("скидка 15 процентов") == []
+    assert compiled.matches("скидка 5% и c++") == [0, 2]
+    assert compiled.matches("что?!") == [1]
+
+
+def test_token_mode_matches_whole_words_and_phrases():
+    compiled = CompiledCategories([category("кот", mode=KEYWORD_MODE_TOKEN),
+                                   category("добрый день", mode=KEYWORD_MODE_TOKEN)])
+    assert compiled.matches("котик спит") == []
+    assert compiled.matches("Добрый, день! Кот") == [1, 0]
+    assert compiled.matches("добрый вечер") == []
+
+
+def test_punctuation_only_keywords_skipped_in_word_modes():
+    compiled = CompiledCategories([category("?!", mode=KEYWORD_MODE_TOKEN),
+                                   category("?!", mode=KEYWORD_MODE_FUZZY)])
+    assert compiled.matches("что?!") == []
+    assert compiled.fuzzy is None
+
+
+def test_fuzzy_mode_tolerates_typo():
+    compiled = CompiledCategories([category("привет", mode=KEYWORD_MODE_FUZZY)])
+    assert compiled.matches("превет всем") == [0]
+
+
+def test_ranking_by_priority_then_position_then_order():
+    compiled = CompiledCategories([category("b"), category("a"), category("c", priority=5), category("a")])
+    assert compiled.matches("a b c") == [2, 1, 3, 0]
+    assert compiled.first_match("a b c") == 2
+    assert compiled.first_match("zzz") is None
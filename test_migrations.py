@@ -0,0 +1,69 @@
+# test_migrations.py
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from database.migrations import run_migrations
+from database.models import Base
+
+
+@pytest.fixture
+def engine(tmp_path):
+    # БД в схеме до колонок метаданных чатов, приоритетов и таблицы category_keywords
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE chat_groups (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL, "
+                                "owner_id BIGINT NOT NULL)"))
+        connection.execute(text("CREATE TABLE chats (id BIGINT PRIMARY KEY, group_id INTEGER)"))
+        connection.execute(text("CREATE TABLE categories (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL, "
+                                "keywords VARCHAR, response VARCHAR, chat_id BIGINT, group_id INTEGER, owner_id BIGINT)"))
+        connection.execute(text("INSERT INTO chats (id) VALUES (-100)"))
+        connection.execute(text("INSERT INTO categories (id, name, keywords, response, chat_id) VALUES "
+                                "(1, 'a', 'Привет, ёж, ?!, привет', 'r', -100), (2, 'b', '', 'r', -100)"))
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def keyword_rows(engine):
+    with engine.connect() as connection:
+        return connection.execute(text(
+            "SELECT category_id, position, keyword, normalized FROM category_keywords ORDER BY category_id, position"
+        )).all()
+
+
+def test_adds_missing_columns_and_indexes(engine):
+    run_migrations(engine)
+    inspector = inspect(engine)
+    assert {"title", "type", "username"} <= {column["name"] for column in inspector.get_columns("chats")}
+    assert {"priority", "keyword_mode", "pipeline"} <= {column["name"] for column in inspector.get_columns("categories")}
+    assert "ix_chat_groups_owner_id" in {index["name"] for index in inspector.get_indexes("chat_groups")}
+
+
+def test_backfills_category_keywords(engine):
+    run_migrations(engine)
+    # Повтор "привет" схлопнут, пунктуация сохранена с пустым normalized, пустая строка слов — без строк
+    assert keyword_rows(engine) == [(1, 0, "Привет", "привет"), (1, 1, "ёж", "еж"), (1, 2, "?!", "")]
+
+
+def test_is_idempotent(engine):
+    run_migrations(engine)
+    before = keyword_rows(engine)
+    run_migrations(engine)
+    assert keyword_rows(engine) == before
+
+
+def test_renormalizes_stale_index(engine):
+    run_migrations(engine)
+    with engine.begin() as connection:
+        connection.execute(text("UPDATE category_keywords SET normalized = 'ёж' WHERE keyword = 'ёж'"))
+    run_migrations(engine)
+    assert (1, 1, "ёж", "еж") in keyword_rows(engine)
+
+
+def test_rebuilds_keywords_that_diverged_from_source(engine):
+    # Строки, записанные по прежним правилам: слово из одной пунктуации было отброшено
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO category_keywords (category_id, position, keyword, normalized) "
+                                "VALUES (1, 0, 'Привет', 'привет'), (1, 1, 'ёж', 'еж')"))
+    run_migrations(engine)
+    assert keyword_rows(engine) == [(1, 0, "Привет", "привет"), (1, 1, "ёж", "еж"), (1, 2, "?!", "")]
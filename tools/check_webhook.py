@@ -0,0 +1,112 @@
+# tools/check_webhook.py
+"""
+Сквозная проверка бэкпрешера webhook на запущенном Application: медленный
+обработчик, маленькие пределы процессора и очереди, отправка пакетов
+быстрее, чем они обрабатываются. Проверяет, что:
+  * сервер отвечает 503, когда места нет, и принимает после освобождения;
+  * update'ов в работе никогда не больше max_pending, очередь — не больше maxsize;
+  * обработаны все отправленные update'ы;
+  * остановка с открытыми keep-alive соединениями проходит без ошибок.
+Telegram не нужен: бот работает офлайн. Код выхода 1 — проверка не прошла.
+
+Запуск из корня проекта:
+    python -m tools.check_webhook --updates 300 --max-pending 10 --queue-size 20
+"""
+import argparse
+import asyncio
+import sys
+
+from telegram import Update, User
+from telegram.ext import Application, ExtBot, TypeHandler
+
+from runtime.processor import GatedUpdateQueue, OrderedUpdateProcessor
+from runtime.webhook import WebhookServer
+from tools.replay_updates import Connection, synthetic_updates
+
+SECRET = "check"
+
+
+class OfflineBot(ExtBot):
+    """Бот без обращений к Telegram: get_me отвечает локально."""
+
+    async def get_me(self, *args, **kwargs):
+        self._bot_user = User(1, "check", True, username="check_bot")
+        return self._bot_user
+
+
+async def check(updates: int, batch: int, max_concurrent: int, max_pending: int, queue_size: int,
+                delay: float) -> bool:
+    processor = OrderedUpdateProcessor(max_concurrent=max_concurrent, max_pending=max_pending)
+    app = (Application.builder().bot(OfflineBot("1:check")).updater(None).concurrent_updates(processor)
+           .update_queue(GatedUpdateQueue(processor, maxsize=queue_size)).build())
+    handled = set()
+    peak = {"pending": 0, "queue": 0}
+    errors = []  # необработанные исключения в задачах цикла (в т.ч. соединений сервера)
+    asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context["message"]))
+
+    async def slow_handler(update, context):
+        peak["pending"] = max(peak["pending"], processor.pending)
+        peak["queue"] = max(peak["queue"], app.update_queue.qsize())
+        await asyncio.sleep(delay)
+        handled.add(update.update_id)
+
+    app.add_handler(TypeHandler(Update, slow_handler))
+    server = WebhookServer(app, SECRET, host="127.0.0.1", port=0, retry_after=0)
+    await app.initialize()
+    await server.start()
+    await app.start()
+
+    payloads = synthetic_updates(updates, chats=max_concurrent * 3, text="check")
+    statuses = []
+    conn = Connection("127.0.0.1", server.port, "/telegram", SECRET)
+    for i in range(0, updates, batch):
+        while True:
+            status, _ = await conn.post(payloads[i:i + batch])
+            statuses.append(status)
+            if status != 503:
+                break
+            await asyncio.sleep(delay)  # бэкпрешер: ждём, пока процессор освободится
+
+    for _ in range(int(60 / delay)):
+        if len(handled) == updates:
+            break
+        await asyncio.sleep(delay)
+
+    # Соединение conn остаётся открытым: stop() должен закрыть его сам
+    await server.stop()
+    await app.stop()
+    await app.shutdown()
+    await asyncio.sleep(0)
+    leftover = asyncio.all_tasks() - {asyncio.current_task()}  # незакрытые соединения сервера
+    conn.close()
+
+    rejected = statuses.count(503)
+    results = {
+        "503 received": rejected > 0,
+        "only 200/503": set(statuses) <= {200, 503},
+        f"pending <= {processor.max_pending}": peak["pending"] <= processor.max_pending,
+        f"queue <= {queue_size or 'inf'}": not queue_size or peak["queue"] <= queue_size,
+        "all handled": len(handled) == updates,
+        "clean stop": not errors and not leftover,
+    }
+    print(f"requests={len(statuses)} rejected_503={rejected} handled={len(handled)}/{updates} "
+          f"peak_pending={peak['pending']} peak_queue={peak['queue']}")
+    for error in errors + [f"task left after stop: {task.get_coro()}" for task in leftover]:
+        print(f"error: {error}")
+    for name, ok in results.items():
+        print(f"{'ok  ' if ok else 'FAIL'} {name}")
+    return all(results.values())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=300)
+    parser.add_argument("--batch", type=int, default=10)
+    parser.add_argument("--max-concurrent", type=int, default=2)
+    parser.add_argument("--max-pending", type=int, default=10)
+    parser.add_argument("--queue-size", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=0.01, help="время обработки одного update, с")
+    args = parser.parse_args()
+    ok = asyncio.run(check(args.updates, args.batch, args.max_concurrent, args.max_pending,
+                           args.queue_size, args.delay))
+    sys.exit(0 if ok else 1)
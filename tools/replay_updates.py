@@ -0,0 +1,120 @@
+# tools/replay_updates.py
+"""
+Отправляет записанные update'ы на webhook бота — проверка режима webhook
+целиком, от HTTP до обработчиков.
+
+Файл — JSONL, по одному update (как его присылает Telegram) в строке. Без
+файла генерируются синтетические текстовые сообщения в группы.
+
+Запуск из корня проекта (бот запущен с BOT_MODE=webhook):
+    python -m tools.replay_updates updates.jsonl --secret $WEBHOOK_SECRET
+    python -m tools.replay_updates --synthetic 5000 --chats 50 --text "привет" --batch 20 --connections 4
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter
+
+
+def load_updates(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def synthetic_updates(count: int, chats: int, text: str, first_id: int = 1) -> list:
+    now = int(time.time())
+    return [{
+        "update_id": first_id + i,
+        "message": {
+            "message_id": first_id + i,
+            "date": now,
+            "text": text,
+            "chat": {"id": -1000 - i % chats, "type": "supergroup", "title": f"Replay {i % chats}"},
+            "from": {"id": 10_000 + i % 97, "is_bot": False, "first_name": "Replay"},
+        },
+    } for i in range(count)]
+
+
+class Connection:
+    """Одно keep-alive соединение с webhook."""
+
+    def __init__(self, host: str, port: int, path: str, secret: str):
+        self.host, self.port, self.path, self.secret = host, port, path, secret
+        self.reader = self.writer = None
+
+    async def post(self, payload) -> tuple:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        head = (f"POST {self.path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\nX-Telegram-Bot-Api-Secret-Token: {self.secret}\r\n\r\n")
+        self.writer.write(head.encode() + body)
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while (line := await self.reader.readline()) not in (b"\r\n", b""):
+            name, _, value = line.decode().partition(":")
+            headers[name.strip().lower()] = value.strip()
+        await self.reader.readexactly(int(headers.get("content-length", "0")))
+        if headers.get("connection", "").lower() == "close":
+            self.writer.close()
+            self.writer = None
+        return status, headers
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def replay(updates: list, host: str, port: int, path: str, secret: str,
+                 batch: int, connections: int, max_retries: int):
+    batches = [updates[i:i + batch] if batch > 1 else updates[i] for i in range(0, len(updates), max(batch, 1))]
+    pending = iter(batches)
+    statuses = Counter()
+    retries = 0
+
+    async def worker():
+        nonlocal retries
+        conn = Connection(host, port, path, secret)
+        try:
+            for payload in pending:
+                for attempt in itertools.count():
+                    status, headers = await conn.post(payload)
+                    if status != 503 or attempt >= max_retries:
+                        break
+                    # Бэкпрешер: ждём, сколько просит сервер
+                    retries += 1
+                    await asyncio.sleep(float(headers.get("retry-after", "1")))
+                statuses[status] += 1
+        finally:
+            conn.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(connections)))
+    elapsed = time.perf_counter() - start
+    print(f"updates={len(updates)} requests={len(batches)} batch={batch} connections={connections}")
+    print(f"elapsed={elapsed:.2f}s rate={len(updates) / elapsed:.0f} updates/s retries_503={retries}")
+    print("statuses:", dict(statuses))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file", nargs="?", help="JSONL с update'ами")
+    parser.add_argument("--synthetic", type=int, default=1000, help="сколько сообщений сгенерировать без файла")
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--text", default="привет")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8443)
+    parser.add_argument("--path", default="/telegram")
+    parser.add_argument("--secret", required=True)
+    parser.add_argument("--batch", type=int, default=1, help="update'ов в одном запросе (>1 — JSON-массив)")
+    parser.add_argument("--connections", type=int, default=4)
+    parser.add_argument("--max-retries", type=int, default=20)
+    args = parser.parse_args()
+
+    updates = load_updates(args.file) if args.file else synthetic_updates(args.synthetic, args.chats, args.text)
+    asyncio.run(replay(updates, args.host, args.port, args.path, args.secret,
+                       args.batch, args.connections, args.max_retries))
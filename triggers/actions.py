@@ -1,4 +1,9 @@
 # triggers/actions.py
+from telegram import ReplyParameters
+
+from runtime.outbound import PRIORITY_TRIGGER
+
+
 class Action:
     async def execute(self, message, context):
         raise NotImplementedError
@@ -8,4 +13,19 @@ class SendMessage(Action):
         self.text = text
 
     async def execute(self, message, context):
-        await context["bot"].send_message(chat_id=message.chat.id, text=self.text)
\ No newline at end of file
+        # Через планировщик исходящих (rate_limiter бота) с низким приоритетом: админка отвечает раньше
+        await context["bot"].send_message(chat_id=message.chat.id, text=self.text,
+                                          rate_limit_args={"priority": PRIORITY_TRIGGER})
+
+
+class ReplyMessage(Action):
+    """Ответ на сработавшее сообщение (reply), а не отдельным сообщением в чат."""
+
+    def __init__(self, text):
+        self.text = text
+
+    async def execute(self, message, context):
+        await context["bot"].send_message(chat_id=message.chat.id, text=self.text,
+                                          reply_parameters=ReplyParameters(message.message_id,
+                                                                           allow_sending_without_reply=True),
+                                          rate_limit_args={"priority": PRIORITY_TRIGGER})
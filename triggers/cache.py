@@ -0,0 +1,241 @@
+# triggers/cache.py
+import asyncio
+import threading
+
+from sqlalchemy import select
+
+import config
+from database.chat_meta import chat_fields, chat_metadata
+from database.db import AsyncReadSession
+from database.keywords import load_keywords
+from database.models import Category, Chat
+from .matcher import CompiledCategories
+from .pipeline import category_plan
+
+
+class CachedCategory:
+    """Отвязанная от сессии копия категории — безопасна для чтения из любого потока."""
+    __slots__ = ("id", "name", "keywords", "terms", "keyword_mode", "response", "chat_id", "group_id", "owner_id",
+                 "priority", "plan")
+
+    def __init__(self, cat: Category, terms=()):
+        self.id = cat.id
+        self.name = cat.name
+        self.keywords = cat.keywords
+        self.terms = tuple(terms)  # слова из category_keywords как ввёл админ; нормализует matcher
+        self.keyword_mode = cat.keyword_mode
+        self.response = cat.response
+        self.chat_id = cat.chat_id
+        self.group_id = cat.group_id
+        self.owner_id = cat.owner_id
+        self.priority = cat.priority or 0
+        self.plan = category_plan(cat)  # условия и действия компилируются один раз при загрузке
+
+
+class ChatCategories:
+    """
+    Итоговый набор категорий (локальные поверх групповых) и его автомат.
+    local и group — исходные наборы целиком, включая повторы имени (их
+    показывает меню), categories — результат слияния по имени для поиска.
+    Чаты группы без локальных категорий получают один общий экземпляр
+    (chat_id = None): слияние и компиляция делаются раз на группу.
+    """
+
+    def __init__(self, chat_id, group_id, local: list, group: list):
+        self.chat_id = chat_id
+        self.group_id = group_id
+        self.local = local
+        self.group = group
+        # Мерж: локальные переопределяют групповые, при повторе имени внутри уровня — последняя
+        merged = {cat.name: cat for cat in group}
+        merged.update((cat.name, cat) for cat in local)
+        self.categories = list(merged.values())
+        self.compiled = CompiledCategories(self.categories, fuzzy_distance=config.TRIGGER_FUZZY_MAX_DISTANCE,
+                                           fuzzy_min_length=config.TRIGGER_FUZZY_MIN_LENGTH,
+                                           fuzzy_max_candidates=config.TRIGGER_FUZZY_MAX_CANDIDATES)
+
+    @property
+    def shared(self) -> bool:
+        return self.chat_id is None
+
+    def first_match(self, text):
+        index = self.compiled.first_match(text)
+        return None if index is None else self.categories[index]
+
+    def matches(self, text) -> list:
+        """Все сработавшие категории за один проход, в порядке ранжирования."""
+        return [self.categories[index] for index in self.compiled.matches(text)]
+
+
+class ChatLocals:
+    """Строка чата в кэше: его группа и локальные категории."""
+    __slots__ = ("group_id", "categories")
+
+    def __init__(self, group_id, categories: list):
+        self.group_id = group_id
+        self.categories = categories
+
+
+async def _cached_categories(session, query) -> list:
+    categories = (await session.scalars(query)).all()
+    # Ключевые слова всех категорий — одним запросом по индексу category_id
+    terms = await load_keywords(session, [cat.id for cat in categories])
+    # Все строки уровня: повторы имени схлопываются только при слиянии (ChatCategories)
+    return [CachedCategory(cat, terms.get(cat.id, ())) for cat in categories]
+
+
+async def load_chat_locals(chat_id: int):
+    """Группа чата и его локальные категории. None — чат не зарегистрирован."""
+    async with AsyncReadSession() as session:
+        chat = await session.get(Chat, chat_id)
+        if not chat:
+            return None
+        # Строка уже прочитана — сравнение метаданных чата после перезапуска обходится без записи
+        chat_metadata.remember(chat_id, chat_fields(chat))
+        local = await _cached_categories(session, select(Category).filter_by(chat_id=chat_id))
+        return ChatLocals(chat.group_id, local)
+
+
+async def load_group_categories(group_id: int) -> list:
+    """Категории группы — общие для всех её чатов."""
+    async with AsyncReadSession() as session:
+        return await _cached_categories(session, select(Category).filter_by(group_id=group_id))
+
+
+class CategoryCache:
+    """
+    Кэш итоговых наборов категорий по chat_id. Категории меняются только из
+    админки, поэтому записи живут до явной инвалидации из обработчиков записи в bot.py.
+
+    Хранится по уровням: категории группы — один набор на группу
+    (_groups), локальные — по чатам (_locals), итог — в _entries. Итог
+    пересчитывается из уровней без обращения к БД: изменение групповых
+    категорий перечитывает только группу, а чаты без локальных категорий
+    просто получают новый общий набор группы. Локальные изменения и смена
+    группы затрагивают один чат.
+    """
+
+    def __init__(self, chat_loader=load_chat_locals, group_loader=load_group_categories):
+        self._chat_loader = chat_loader
+        self._group_loader = group_loader
+        self._entries = {}        # chat_id -> ChatCategories | None (чат не зарегистрирован)
+        self._locals = {}         # chat_id -> ChatLocals | None
+        self._groups = {}         # group_id -> общий ChatCategories группы (None — чат без группы)
+        self._group_inflight = {}  # group_id -> Task загрузки: чаты группы ждут одну загрузку
+        self._lock = threading.Lock()
+        self._generation = 0      # растёт при каждой инвалидации, защищает от записи устаревших данных
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.group_loads = 0
+        self.merges = 0
+
+    async def get(self, chat_id: int):
+        """Набор категорий чата; в установившемся режиме — без обращений к БД."""
+        try:
+            entry = self._entries[chat_id]
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        generation = self._generation
+        chat_locals = self._locals.get(chat_id)
+        if chat_locals is None:
+            chat_locals = await self._chat_loader(chat_id)
+        if chat_locals is None:
+            entry = None
+        else:
+            group_view = await self._group_view(chat_locals.group_id)
+            if chat_locals.categories:
+                entry = ChatCategories(chat_id, chat_locals.group_id, chat_locals.categories, group_view.group)
+                self.merges += 1
+            else:
+                entry = group_view
+        with self._lock:
+            # Если за время загрузки что-то инвалидировали — не кладём возможно устаревший снимок
+            if generation == self._generation:
+                self._locals[chat_id] = chat_locals
+                self._entries[chat_id] = entry
+        return entry
+
+    async def _group_view(self, group_id) -> ChatCategories:
+        view = self._groups.get(group_id)
+        if view is not None:
+            return view
+        task = self._group_inflight.get(group_id)
+        if task is None:
+            task = asyncio.ensure_future(self._load_group_view(group_id))
+            self._group_inflight[group_id] = task
+            task.add_done_callback(lambda done: self._group_inflight.get(group_id) is done
+                                   and self._group_inflight.pop(group_id))
+        return await asyncio.shield(task)
+
+    async def _load_group_view(self, group_id) -> ChatCategories:
+        generation = self._generation
+        group = []
+        if group_id:
+            group = await self._group_loader(group_id)
+            self.group_loads += 1
+        view = ChatCategories(None, group_id, [], group)
+        with self._lock:
+            if generation == self._generation:
+                self._groups[group_id] = view
+        return view
+
+    def invalidate(self, chat_id: int):
+        """Изменились локальные категории чата или его группа."""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            self._entries.pop(chat_id, None)
+            self._locals.pop(chat_id, None)
+
+    def invalidate_group(self, group_id):
+        """Изменились категории группы: перечитывается группа, локальные чатов остаются."""
+        if not group_id:
+            return
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            self._groups.pop(group_id, None)
+            self._group_inflight.pop(group_id, None)  # начатая до изменения загрузка устарела
+            for chat_id in [cid for cid, entry in self._entries.items() if entry and entry.group_id == group_id]:
+                del self._entries[chat_id]
+
+    def invalidate_category(self, cat):
+        """Инвалидация по уровню категории: групповая затрагивает все чаты группы."""
+        if cat.group_id:
+            self.invalidate_group(cat.group_id)
+        elif cat.chat_id:
+            self.invalidate(cat.chat_id)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._locals.clear()
+            self._groups.clear()
+            self._group_inflight.clear()
+
+    def stats(self) -> dict:
+        entries = list(self._entries.values())
+        views = {id(entry): entry for entry in entries if entry}.values()  # общий набор группы — один раз
+        return {
+            "entries": len(entries),
+            "shared": sum(1 for entry in entries if entry and entry.shared),
+            "groups": len(self._groups),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "group_loads": self.group_loads,
+            "merges": self.merges,
+            "fuzzy_over_budget": sum(view.compiled.fuzzy.over_budget for view in views
+                                     if view.compiled.fuzzy is not None),
+        }
+
+
+# Глобальный экземпляр
+category_cache = CategoryCache()
@@ -1,28 +1,47 @@
 # triggers/conditions.py
-from datetime import datetime, timedelta
-from database.db import Session
+from datetime import datetime, time, timedelta, timezone
 
-from database.models import TriggerEvent
+from permissions.roster import admin_roster
+from .counters import trigger_counter
+from .normalize import fold_text, message_text
+
+# Стоимость проверки — по ней план конвейера (pipeline.py) упорядочивает условия
+COST_MESSAGE = 0  # только данные сообщения и контекста
+COST_MEMORY = 1   # состояние в памяти (счётчики)
+COST_IO = 2       # может обратиться к Telegram/БД; check асинхронный
 
 
 class Condition:
+    cost = COST_MESSAGE
+
     def check(self, message, context):
         raise NotImplementedError
 
 class KeywordMatch(Condition):
     def __init__(self, keywords):
-        self.keywords = [kw.strip().lower() for kw in keywords.split(",")]
+        # Поиск подстрок, как у ключей категории в режиме substring: пунктуация сохраняется
+        self.keywords = [keyword for keyword in (fold_text(part) for part in keywords.split(",")) if keyword]
 
     def check(self, message, context):
-        text = message.text.lower()
-        return any(keyword in text for keyword in self.keywords)
+        # Нормализованный текст берётся из общего контекста сообщения, а не считается заново
+        text = context.get("text") or message_text(message.text)
+        return any(keyword in text.folded for keyword in self.keywords)
 
 
 
 class UserTriggerCount(Condition):
-    def __init__(self, count, minutes):
+    cost = COST_MEMORY
+
+    def __init__(self, count, minutes, counter=trigger_counter):
+        # Счётчик хранит не больше max_events событий на ключ — больший порог недостижим
+        if not 1 <= count <= counter.max_events:
+            raise ValueError(f"count должен быть от 1 до {counter.max_events}: {count}")
+        if minutes < 1:
+            raise ValueError(f"minutes должно быть не меньше 1: {minutes}")
         self.count = count
         self.minutes = minutes
+        self.counter = counter
+        self.counter.ensure_horizon(minutes)  # при росте горизонта история дозагружается из БД
 
     def check(self, message, context):
         user_id = message.from_user.id
@@ -31,14 +50,46 @@ class UserTriggerCount(Condition):
         if not category_id:
             return False
 
-        with Session() as session:
-            # Подсчитываем триггеры для пользователя в заданном временном окне
-            now = datetime.utcnow()
-
-            recent_triggers = session.query(TriggerEvent).filter(
-                TriggerEvent.user_id == user_id,
-                TriggerEvent.chat_id == chat_id,
-                TriggerEvent.category_id == category_id,
-                TriggerEvent.timestamp >= now - timedelta(minutes=self.minutes)
-            ).count()
-            return recent_triggers >= self.count
\ No newline at end of file
+        # Подсчитываем триггеры для пользователя в заданном временном окне (в памяти, без БД).
+        # Менеджер заранее считает окна всех совпавших категорий одним пакетом (rate_counts)
+        recent_triggers = context.get("rate_counts", {}).get((category_id, self.minutes))
+        if recent_triggers is None:
+            counter = context.get("counter") or self.counter
+            recent_triggers = counter.count(chat_id, user_id, category_id, self.minutes)
+        return recent_triggers >= self.count
+
+
+class TimeOfDay(Condition):
+    """
+    Время сообщения в интервале [start, end) по местному времени (utc_offset
+    часов от UTC); интервал может переходить через полночь.
+    """
+
+    def __init__(self, start: str, end: str, utc_offset: float = 0, days=None):
+        self.start = time.fromisoformat(start)
+        self.end = time.fromisoformat(end)
+        self.tz = timezone(timedelta(hours=utc_offset))
+        self.days = set(days) if days else None  # дни недели, 0 — понедельник
+
+    def check(self, message, context):
+        moment = (message.date or datetime.now(timezone.utc)).astimezone(self.tz)
+        if self.days is not None and moment.weekday() not in self.days:
+            return False
+        now = moment.time()
+        if self.start <= self.end:
+            return self.start <= now < self.end
+        return now >= self.start or now < self.end
+
+
+class UserRole(Condition):
+    """Статус автора в чате (creator, administrator, member) из списка администраторов."""
+    cost = COST_IO
+
+    def __init__(self, roles, roster=admin_roster):
+        self.roles = set(roles)
+        self.roster = roster
+
+    async def check(self, message, context):
+        # Обычно из памяти; при промахе roster один раз спросит Telegram
+        role = await self.roster.get_role(context["bot"], message.chat.id, message.from_user.id)
+        return role in self.roles
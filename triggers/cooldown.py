@@ -0,0 +1,104 @@
+# triggers/cooldown.py
+import time
+from collections import Counter, OrderedDict
+
+import config
+
+COALESCED = "coalesced"
+COOLDOWN = "cooldown"
+
+
+class ReplyState:
+    """Состояние ответов категории в одном чате."""
+    __slots__ = ("pending", "last_sent", "suppressed")
+
+    def __init__(self):
+        self.pending = 0       # ответы в очереди на отправку / в пути
+        self.last_sent = None  # time.monotonic() последнего отправленного ответа
+        self.suppressed = 0
+
+
+class ReplyCooldown:
+    """
+    Подавление повторных ответов по ключу (chat_id, category_id), целиком в памяти.
+
+    coalesce_window — повторные срабатывания, пока ответ ещё в пути (например,
+    ждёт в планировщике исходящих) или отправлен меньше окна назад, сливаются
+    с ним. cooldown — после отправленного ответа категория молчит в этом чате
+    указанное число секунд. Подавляется только ответ: события и счётчики
+    срабатываний пишутся и для подавленных (проверка стоит после них, до условий и отправки).
+    """
+
+    def __init__(self, cooldown: float = 60, coalesce_window: float = 5, max_keys: int = 50_000):
+        self.cooldown = cooldown
+        self.coalesce_window = coalesce_window
+        self.max_keys = max_keys
+        self._states = OrderedDict()  # (chat_id, category_id) -> ReplyState, LRU
+        self.suppressed = Counter()   # причина -> сколько срабатываний подавлено
+        self.replies = 0
+
+    def check(self, chat_id: int, category_id: int, now: float = None):
+        """None — можно отвечать, иначе причина подавления (COALESCED | COOLDOWN)."""
+        state = self._states.get((chat_id, category_id))
+        if state is None:
+            return None
+        if now is None:
+            now = time.monotonic()
+
+        reason = None
+        if state.pending:
+            reason = COALESCED
+        elif state.last_sent is not None:
+            elapsed = now - state.last_sent
+            if elapsed < self.coalesce_window:
+                reason = COALESCED
+            elif elapsed < self.cooldown:
+                reason = COOLDOWN
+        if reason is not None:
+            state.suppressed += 1
+            self.suppressed[reason] += 1
+        return reason
+
+    def begin(self, chat_id: int, category_id: int):
+        """Ответ поставлен в отправку — до finish() новые срабатывания сливаются с ним."""
+        key = (chat_id, category_id)
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = ReplyState()
+        self._states.move_to_end(key)
+        state.pending += 1
+        self._evict()
+
+    def finish(self, chat_id: int, category_id: int, sent: bool = True, now: float = None):
+        state = self._states.get((chat_id, category_id))
+        if state is None:
+            return
+        state.pending = max(0, state.pending - 1)
+        if sent:
+            state.last_sent = time.monotonic() if now is None else now
+            self.replies += 1
+
+    def _evict(self):
+        # Старые ключи в начале; ключ без ответов в пути и за пределами окон можно забыть
+        horizon = time.monotonic() - max(self.cooldown, self.coalesce_window)
+        while self._states:
+            key, state = next(iter(self._states.items()))
+            expired = not state.pending and (state.last_sent is None or state.last_sent < horizon)
+            if expired or len(self._states) > self.max_keys:
+                del self._states[key]
+            else:
+                break
+
+    def stats(self, top: int = 5) -> dict:
+        noisiest = sorted(self._states.items(), key=lambda item: item[1].suppressed, reverse=True)[:top]
+        return {
+            "replies": self.replies,
+            "suppressed": sum(self.suppressed.values()),
+            "suppressed_by_reason": dict(self.suppressed),
+            "top_suppressed": {f"{chat_id}:{category_id}": state.suppressed
+                               for (chat_id, category_id), state in noisiest if state.suppressed},
+        }
+
+
+# Глобальный экземпляр
+reply_cooldown = ReplyCooldown(cooldown=config.TRIGGER_COOLDOWN, coalesce_window=config.TRIGGER_COALESCE_WINDOW)
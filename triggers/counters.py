@@ -0,0 +1,194 @@
+# triggers/counters.py
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+
+from database.db import AsyncReadSession
+from database.models import TriggerEvent
+from locallog.logger import logger
+
+
+def _to_epoch(dt: datetime) -> float:
+    # В trigger_events время хранится как naive UTC (datetime.utcnow)
+    return dt.replace(tzinfo=timezone.utc).timestamp()
+
+
+class SlidingWindowCounter:
+    """
+    Скользящие окна срабатываний в памяти по ключу (chat_id, user_id, category_id).
+
+    На ключ хранится не больше max_events последних отметок времени, поэтому
+    ответ на вопрос «N срабатываний за M минут» стоит O(max_events) в худшем случае
+    и O(1) в типичном. Ключи без событий в пределах горизонта вытесняются
+    (TTL), а общее число ключей ограничено max_keys (LRU).
+
+    Горизонт растёт под условия с длинным окном (ensure_horizon). Окна в
+    памяти полны только за прежний горизонт, поэтому более старые события
+    дозагружаются из trigger_events в фоне (backfill).
+    """
+
+    def __init__(self, horizon_minutes: int = 10, max_events: int = 32, max_keys: int = 50_000):
+        self.horizon = horizon_minutes * 60
+        self.max_events = max_events
+        self.max_keys = max_keys
+        self._events = OrderedDict()  # key -> deque(timestamps), от старых ключей к свежим
+        self._lock = threading.Lock()
+        self._complete = self.horizon  # за сколько секунд окна в памяти полны
+        self._backfill_task = None
+        self.evicted = 0
+        self.backfilled = 0
+
+    def ensure_horizon(self, minutes: int):
+        """
+        Расширяет горизонт хранения под условие с более длинным окном и, если
+        цикл событий запущен, дозагружает недостающую историю. Без цикла её
+        загрузит следующий rebuild().
+        """
+        if minutes * 60 <= self.horizon:
+            return
+        self.horizon = minutes * 60
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._backfill_task is None or self._backfill_task.done():
+            self._backfill_task = loop.create_task(self._backfill())
+
+    async def _backfill(self):
+        # Горизонт мог вырасти ещё раз, пока шла загрузка, — догружаем до текущего
+        while self._complete < self.horizon:
+            horizon = self.horizon
+            now = datetime.utcnow()
+            try:
+                rows = await self._load(now - timedelta(seconds=horizon), now - timedelta(seconds=self._complete))
+            except Exception:
+                logger.exception("Ошибка дозагрузки окон счётчика триггеров",
+                                 extra={"event_type": "trigger_counter", "payload": {"horizon_minutes": horizon // 60}})
+                return
+            self._prepend(rows)
+            self._complete = max(self._complete, horizon)
+
+    def _prepend(self, rows):
+        """Добавляет события старше уже известных по ключу, не вытесняя свежие."""
+        older = {}
+        for chat_id, user_id, category_id, timestamp in rows:
+            older.setdefault((chat_id, user_id, category_id), []).append(_to_epoch(timestamp))
+        with self._lock:
+            for key, timestamps in older.items():
+                events = self._events.get(key)
+                if events is None:
+                    events = deque(maxlen=self.max_events)
+                    self._events[key] = events
+                    self._events.move_to_end(key, last=False)
+                if events:
+                    timestamps = [ts for ts in timestamps if ts < events[0]]
+                room = self.max_events - len(events)
+                if room <= 0 or not timestamps:
+                    continue
+                # Из старых берём самые свежие; appendleft — от новых к старым
+                for ts in reversed(timestamps[-room:]):
+                    events.appendleft(ts)
+                self.backfilled += min(room, len(timestamps))
+
+    def add(self, chat_id: int, user_id: int, category_id: int, timestamp: float = None):
+        if timestamp is None:
+            timestamp = time.time()
+        key = (chat_id, user_id, category_id)
+        with self._lock:
+            events = self._events.get(key)
+            if events is None:
+                events = deque(maxlen=self.max_events)
+                self._events[key] = events
+            else:
+                self._events.move_to_end(key)
+            events.append(timestamp)
+            self._evict(timestamp)
+
+    def count(self, chat_id: int, user_id: int, category_id: int, minutes: int, now: float = None) -> int:
+        """Число срабатываний ключа за последние minutes минут (не больше max_events)."""
+        if now is None:
+            now = time.time()
+        with self._lock:
+            return self._count((chat_id, user_id, category_id), minutes, now)
+
+    def count_many(self, chat_id: int, user_id: int, windows, now: float = None) -> dict:
+        """
+        count() для нескольких пар (category_id, minutes) одного пользователя —
+        под одной блокировкой и с одним now: {(category_id, minutes): число}.
+        """
+        if now is None:
+            now = time.time()
+        with self._lock:
+            return {(category_id, minutes): self._count((chat_id, user_id, category_id), minutes, now)
+                    for category_id, minutes in windows}
+
+    def _count(self, key, minutes: int, now: float) -> int:
+        events = self._events.get(key)
+        if not events:
+            return 0
+        # Отбрасываем вышедшее за горизонт — амортизированно O(1)
+        horizon_cutoff = now - self.horizon
+        while events and events[0] < horizon_cutoff:
+            events.popleft()
+        # Считаем с конца: проходим только события внутри окна
+        cutoff = now - minutes * 60
+        result = 0
+        for ts in reversed(events):
+            if ts < cutoff:
+                break
+            result += 1
+        return result
+
+    def _evict(self, now: float):
+        # Старейшие по последнему событию ключи лежат в начале OrderedDict
+        horizon_cutoff = now - self.horizon
+        while self._events:
+            key, events = next(iter(self._events.items()))
+            if len(self._events) > self.max_keys or not events or events[-1] < horizon_cutoff:
+                del self._events[key]
+                self.evicted += 1
+            else:
+                break
+
+    @staticmethod
+    async def _load(since: datetime, until: datetime = None) -> list:
+        query = (select(TriggerEvent.chat_id, TriggerEvent.user_id, TriggerEvent.category_id, TriggerEvent.timestamp)
+                 .filter(TriggerEvent.timestamp >= since))
+        if until is not None:
+            query = query.filter(TriggerEvent.timestamp < until)
+        async with AsyncReadSession() as session:
+            result = await session.execute(query.order_by(TriggerEvent.timestamp))
+            return result.all()
+
+    async def rebuild(self):
+        """Восстанавливает окна из trigger_events за горизонт (при старте бота)."""
+        horizon = self.horizon
+        rows = await self._load(datetime.utcnow() - timedelta(seconds=horizon))
+
+        with self._lock:
+            self._events.clear()
+        for chat_id, user_id, category_id, timestamp in rows:
+            self.add(chat_id, user_id, category_id, _to_epoch(timestamp))
+        self._complete = max(self._complete, horizon)
+        return len(rows)
+
+    async def close(self):
+        if self._backfill_task is not None and not self._backfill_task.done():
+            self._backfill_task.cancel()
+            await asyncio.gather(self._backfill_task, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self._events),
+            "evicted": self.evicted,
+            "horizon_minutes": self.horizon // 60,
+            "backfilled": self.backfilled,
+        }
+
+
+# Глобальный экземпляр
+trigger_counter = SlidingWindowCounter()
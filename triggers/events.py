@@ -0,0 +1,132 @@
+# triggers/events.py
+import asyncio
+import atexit
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from database.db import AsyncSession, Session
+from database.models import TriggerEvent
+from locallog.logger import logger
+
+
+class TriggerEventBuffer:
+    """
+    Write-behind буфер для trigger_events: события копятся в памяти и пишутся
+    одной пачкой по достижении max_batch строк или раз в max_delay секунд.
+
+    Пока БД доступна, при падении процесса теряется не больше max_batch
+    событий за последние max_delay секунд. Если запись не удаётся, пачка
+    возвращается в очередь, и при падении теряется вся очередь — до
+    max_pending событий. Сверх max_pending самые старые события
+    отбрасываются (предупреждение в лог, счётчик dropped в stats()).
+    Счётчики условий (SlidingWindowCounter) обновляются сразу, поэтому ещё
+    не записанные события уже учитываются.
+    """
+
+    def __init__(self, max_batch: int = 200, max_delay: float = 2.0, max_pending: int = 10_000):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending  # предел очереди, если БД временно недоступна
+        self._pending = []
+        self._wakeup = None
+        self._task = None
+        self._stopped = False
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+
+    def add(self, chat_id: int, user_id: int, category_id: int, timestamp: datetime = None):
+        self._pending.append({
+            "chat_id": chat_id,
+            "user_id": user_id,
+            "category_id": category_id,
+            "timestamp": timestamp or datetime.utcnow(),
+        })
+        self._ensure_worker()
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+
+    def add_many(self, chat_id: int, user_id: int, category_ids, timestamp: datetime = None):
+        """События нескольких категорий одного сообщения — уходят в одну пачку (одну транзакцию)."""
+        timestamp = timestamp or datetime.utcnow()
+        for category_id in category_ids:
+            self.add(chat_id, user_id, category_id, timestamp)
+
+    async def flush(self) -> int:
+        """Записывает всё накопленное одним INSERT; возвращает число строк."""
+        rows, self._pending = self._pending, []
+        if not rows:
+            return 0
+        try:
+            async with AsyncSession() as session:
+                await session.execute(insert(TriggerEvent), rows)
+                await session.commit()
+        except Exception:
+            self._requeue(rows)
+            logger.exception("Ошибка пакетной записи trigger_events",
+                             extra={"event_type": "trigger_events_flush", "payload": {"rows": len(rows)}})
+            return 0
+        self.written += len(rows)
+        self.batches += 1
+        return len(rows)
+
+    def _requeue(self, rows):
+        # Возвращаем строки в очередь, но не даём ей расти бесконечно
+        self._pending = rows + self._pending
+        overflow = len(self._pending) - self.max_pending
+        if overflow > 0:
+            del self._pending[:overflow]
+            self.dropped += overflow
+            logger.warning("Очередь trigger_events переполнена, старые события отброшены",
+                           extra={"event_type": "trigger_events_flush",
+                                  "payload": {"dropped": overflow, "dropped_total": self.dropped,
+                                              "max_pending": self.max_pending}})
+
+    def _ensure_worker(self):
+        if self._task is not None or self._stopped:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while not self._stopped:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.max_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def close(self):
+        """Останавливает фоновую задачу и дописывает остаток (вызывается при остановке бота)."""
+        self._stopped = True
+        if self._task is not None:
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def flush_sync(self):
+        """Последний шанс при выходе интерпретатора, когда цикл событий уже остановлен."""
+        rows, self._pending = self._pending, []
+        if rows:
+            with Session() as session:
+                session.execute(insert(TriggerEvent), rows)
+                session.commit()
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+        }
+
+
+# Глобальный экземпляр
+trigger_events = TriggerEventBuffer()
+atexit.register(trigger_events.flush_sync)
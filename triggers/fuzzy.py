@@ -0,0 +1,153 @@
+# triggers/fuzzy.py
+from collections import defaultdict
+
+
+def within_distance(a: str, b: str, max_distance: int) -> bool:
+    """
+    Расстояние Дамерау-Левенштейна (вставка, удаление, замена, перестановка
+    соседних букв) не больше max_distance. Выходит, как только строка
+    матрицы целиком превысила порог.
+    """
+    if a == b:
+        return True
+    len_a, len_b = len(a), len(b)
+    if abs(len_a - len_b) > max_distance:
+        return False
+    before = None
+    previous = list(range(len_b + 1))
+    for i in range(1, len_a + 1):
+        current = [i] + [0] * len_b
+        char = a[i - 1]
+        row_min = i
+        for j in range(1, len_b + 1):
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != b[j - 1]))
+            if before is not None and j > 1 and char == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, before[j - 2] + 1)
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > max_distance:
+            return False
+        before, previous = previous, current
+    return previous[len_b] <= max_distance
+
+
+def _bigrams(word: str) -> list:
+    padded = f"\x02{word}\x03"
+    return [padded[i:i + 2] for i in range(len(padded) - 1)]
+
+
+class FuzzyIndex:
+    """
+    Нечёткий поиск ключевых слов в словах сообщения: опечатка в пределах
+    max_distance правок. Слова ключей раскладываются на биграммы; кандидаты
+    для слова сообщения — ключи близкой длины с достаточным числом общих
+    биграмм (правка задевает не больше 3 из len + 1 — столько у перестановки),
+    и только они проверяются точным расстоянием. Слова ключей короче
+    min_length сравниваются только точно: в коротком слове одна правка — это уже другое слово.
+
+    Работа по одному сообщению ограничена max_candidates кандидатами
+    (просмотренными записями индекса биграмм — они же ограничивают число
+    проверок расстояния): слово, которое уже не укладывается в остаток, и все
+    следующие нечётко не проверяются (точные совпадения уже найдены другими
+    индексами), а over_budget растёт. Предел считается в работе, а не во времени, поэтому
+    результат зависит только от сообщения и набора ключей, но не от нагрузки
+    на машину. Результаты по словам запоминаются — лексика чата повторяется;
+    запомненное слово списывает из предела столько же, сколько стоило при подсчёте.
+    """
+
+    def __init__(self, max_distance: int = 1, min_length: int = 4, max_candidates: int = 5000,
+                 max_cached: int = 10_000):
+        self.max_distance = max_distance
+        self.min_length = max(min_length, 3 * max_distance + 1)  # иначе фильтр по биграммам ничего не отсекает
+        self.max_candidates = max_candidates
+        self.max_cached = max_cached
+        self._word_ids = {}                # слово ключа -> id
+        self._words = []
+        self._grams = defaultdict(list)    # биграмма -> [id слова]
+        self._phrases = defaultdict(list)  # id первого слова -> [(остальные слова, значение)]
+        self._cache = {}                   # слово сообщения -> (id близких слов ключей, число кандидатов)
+        self.searches = 0
+        self.over_budget = 0
+
+    def _word_id(self, word: str) -> int:
+        word_id = self._word_ids.get(word)
+        if word_id is None:
+            word_id = self._word_ids[word] = len(self._words)
+            self._words.append(word)
+            if len(word) >= self.min_length:
+                for gram in _bigrams(word):
+                    self._grams[gram].append(word_id)
+        return word_id
+
+    def add(self, keyword: str, value):
+        """Добавляет нормализованный ключ (слово или фразу через пробел) со связанным значением."""
+        words = keyword.split(" ")
+        if words[0]:
+            self._phrases[self._word_id(words[0])].append((tuple(words[1:]), value))
+
+    def _near(self, token: str) -> tuple:
+        """(id слов ключей на расстоянии не больше max_distance от token, число просмотренных кандидатов)."""
+        cached = self._cache.get(token)
+        if cached is not None:
+            return cached
+        exact = self._word_ids.get(token)
+        near = [] if exact is None else [exact]
+        candidates = 0
+        length = len(token)
+        if length >= self.min_length - self.max_distance:
+            shared = defaultdict(int)
+            for gram in _bigrams(token):
+                postings = self._grams.get(gram, ())
+                candidates += len(postings)
+                for word_id in postings:
+                    shared[word_id] += 1
+            k = self.max_distance
+            for word_id, count in shared.items():
+                word = self._words[word_id]
+                if (word_id != exact and abs(len(word) - length) <= k
+                        and count >= max(len(word), length) + 1 - 3 * k
+                        and within_distance(token, word, k)):
+                    near.append(word_id)
+        result = (tuple(near), candidates)
+        if len(self._cache) >= self.max_cached:
+            self._cache.clear()
+        self._cache[token] = result
+        return result
+
+    def _phrase_matches(self, tokens: list, start: int, rest: tuple) -> bool:
+        if start + len(rest) > len(tokens):
+            return False
+        for offset, word in enumerate(rest):
+            token = tokens[start + offset]
+            if len(word) < self.min_length:
+                if token != word:
+                    return False
+            elif not within_distance(token, word, self.max_distance):
+                return False
+        return True
+
+    def search(self, text) -> dict:
+        """{значение: позиция начала в text.normalized} для ключей, найденных с учётом опечаток."""
+        self.searches += 1
+        remaining = self.max_candidates
+        tokens, starts = text.tokens, text.starts
+        phrases = self._phrases
+        found = {}
+        for i, token in enumerate(tokens):
+            near, candidates = self._near(token)
+            remaining -= candidates
+            if remaining < 0:
+                self.over_budget += 1
+                break
+            for word_id in near:
+                for rest, value in phrases[word_id]:
+                    if value not in found and (not rest or self._phrase_matches(tokens, i + 1, rest)):
+                        found[value] = starts[i]
+        return found
+
+    def __len__(self):
+        return len(self._words)
+
+    def stats(self) -> dict:
+        return {"words": len(self._words), "searches": self.searches, "over_budget": self.over_budget}
@@ -1,59 +1,137 @@
-# triggers/manager.py
 import asyncio
 
 from locallog.context import get_log
-from .conditions import KeywordMatch, UserTriggerCount
-from .actions import SendMessage
-from database.db import Session
-from database.models import Category, TriggerEvent, Chat
-from datetime import datetime
+from .cache import category_cache
+from .counters import trigger_counter
+from .events import trigger_events
+from .cooldown import reply_cooldown
+from .normalize import MessageText
+from .pipeline import rate_counts
+
+MATCH_FIRST = "first"  # отвечает только лучшая по ранжированию категория
+MATCH_ALL = "all"      # все совпавшие категории (не больше max_replies ответов)
+
 
 class TriggerManager:
+    """
+    Сопоставление сообщения с категориями чата, условия и ответы.
+
+    Ответ может долго ждать в планировщике исходящих (лимит группы — 20
+    сообщений в минуту), поэтому отправляется фоновой задачей: обработка
+    update'а и место в процессоре освобождаются сразу. Задачи создаются по
+    порядку сообщений, а планировщик отправляет в чат по очереди, так что
+    порядок ответов сохраняется. Больше max_in_flight ответов в пути не
+    держим: сверх предела обработка update'а ждёт, пока какой-то из них
+    завершится, — это бэкпрешер на процессор update'ов.
+    """
+
+    def __init__(self, cache=category_cache, counter=trigger_counter, events=trigger_events,
+                 cooldown=reply_cooldown, match_mode: str = MATCH_FIRST, max_replies: int = 3,
+                 max_in_flight: int = 1000):
+        if match_mode not in (MATCH_FIRST, MATCH_ALL):
+            raise ValueError(f"Неизвестный режим совпадений: {match_mode} ({MATCH_FIRST} | {MATCH_ALL})")
+        self.cache = cache
+        self.counter = counter
+        self.events = events
+        self.cooldown = cooldown
+        self.match_mode = match_mode
+        self.max_replies = max_replies
+        self.max_in_flight = max_in_flight
+        self._in_flight = set()  # фоновые задачи ответов
+        self.waited = 0  # сколько раз обработка ждала места под ответ (предел задач достигнут)
+
     async def process_message(self, message, bot):
         log = get_log()
-        def db_operation():
-            with Session() as session:
-                chat_id = message.chat.id
-                chat = session.get(Chat, chat_id)
-                if not chat:
-                    return None
-
-                # Локальные категории (chat_id)
-                local_cats = {cat.name: cat for cat in session.query(Category).filter_by(chat_id=chat_id).all()}
-
-                # Групповые категории (если в группе)
-                group_cats = {}
-                if chat.group_id:
-                    group_cats = {cat.name: cat for cat in session.query(Category).filter_by(group_id=chat.group_id).all()}
-
-                # Мерж: локальные переопределяют групповые
-                merged_cats = {**group_cats, **local_cats}
-
-                for cat in merged_cats.values():
-                    condition_keyword = KeywordMatch(cat.keywords)
-                    if condition_keyword.check(message, {}):
-                        # Записываем событие триггера
-                        trigger_event = TriggerEvent(
-                            chat_id=chat_id,
-                            user_id=message.from_user.id,
-                            category_id=cat.id,
-                            timestamp=datetime.utcnow()
-                        )
-                        session.add(trigger_event)
-                        session.commit()
-                        log.debug(f"Обнаружено ключевое слово категории {cat.name}", extra={"payload": {"category": cat.name}})
-                        return cat
-                return None
-
-        category = await asyncio.to_thread(db_operation)
-
-        if category:
-            # Проверяем условие подсчета триггеров
-            condition_count = UserTriggerCount(count=3, minutes=10)  # Например, 3 триггера за 10 минут
-            context = {"category_id": category.id}
-            if condition_count.check(message, context):
-                action = SendMessage(category.response)
-                await action.execute(message, {"bot": bot})
-
-                # Логируем через отдельный модуль
-                log.debug(f"Сработал счетчик триггеров категории {category.name}",extra={"payload": {"category": category.name}})
\ No newline at end of file
+        chat_id = message.chat.id
+        user_id = message.from_user.id
+
+        # Категории берутся из кэша: в установившемся режиме здесь нет чтений из БД
+        chat_categories = await self.cache.get(chat_id)
+        if chat_categories is None:
+            log.debug("Сообщение из неучтённого чата, пропускаем", extra={"payload": {"chat_id": chat_id}})
+            return
+
+        # Контекст сообщения общий для условий и действий: текст нормализуется один раз,
+        # условия частоты считают по счётчику этого менеджера
+        context = {"bot": bot, "text": MessageText(message.text), "counter": self.counter}
+
+        # Один проход автомата по тексту вместо проверки каждого слова каждой категории
+        if self.match_mode == MATCH_ALL:
+            matches = chat_categories.matches(context["text"])
+        else:
+            category = chat_categories.first_match(context["text"])
+            matches = [category] if category is not None else []
+
+        if not matches:
+            return
+
+        # События всех совпадений уходят в write-behind буфер одной пачкой, счётчики окна обновляются сразу.
+        # Кулдаун подавляет только ответ: срабатывания считаются всегда, иначе ответ одному
+        # пользователю останавливал бы счёт условий частоты для всех в чате
+        category_ids = [category.id for category in matches]
+        self.events.add_many(chat_id, user_id, category_ids)
+        for category_id in category_ids:
+            self.counter.add(chat_id, user_id, category_id)
+        log.debug("Обнаружены ключевые слова категорий", extra={"payload": {"categories": [c.name for c in matches]}})
+
+        # Кулдаун и слияние повторов проверяются в памяти до условий и отправки
+        allowed = []
+        for category in matches:
+            suppressed = self.cooldown.check(chat_id, category.id)
+            if suppressed is None:
+                allowed.append(category)
+            else:
+                log.debug(f"Ответ категории {category.name} подавлен", extra={"payload": {"category": category.name, "reason": suppressed}})
+        if not allowed:
+            return
+
+        # Условия и действия — из скомпилированного плана категории (triggers/pipeline.py);
+        # условия частоты всех совпадений — одним пакетным подсчётом
+        context["rate_counts"] = rate_counts(self.counter, chat_id, user_id, allowed)
+        replies = 0
+        for category in allowed:
+            if replies >= self.max_replies:
+                break
+            context["category_id"] = category.id
+            if not await category.plan.passes(message, context):
+                continue
+            await self._dispatch_reply(message, context, category)
+            replies += 1
+
+            # Логируем через отдельный модуль
+            log.debug(f"Сработали условия категории {category.name}",extra={"payload": {"category": category.name}})
+
+    async def _dispatch_reply(self, message, context, category):
+        if len(self._in_flight) >= self.max_in_flight:
+            self.waited += 1
+            while len(self._in_flight) >= self.max_in_flight:
+                await asyncio.wait(set(self._in_flight), return_when=asyncio.FIRST_COMPLETED)
+        # begin — до создания задачи: следующие сообщения чата сливаются с ответом, пока он в пути.
+        # Копия context: в process_message он меняется для следующей категории
+        self.cooldown.begin(message.chat.id, category.id)
+        task = asyncio.create_task(self._reply(message, dict(context), category))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    async def _reply(self, message, context, category):
+        sent = False
+        try:
+            await category.plan.run(message, context)
+            sent = True
+        except Exception as e:
+            get_log().exception(f"Ошибка ответа категории {category.name}",
+                                extra={"payload": {"category": category.name, "error": str(e)}})
+        finally:
+            self.cooldown.finish(message.chat.id, category.id, sent=sent)
+
+    async def close(self, timeout: float = 10):
+        """Дожидается ответов в пути (при остановке, пока бот ещё работает); не успевшие — отменяются."""
+        if not self._in_flight:
+            return
+        _, pending = await asyncio.wait(set(self._in_flight), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._in_flight), "waited": self.waited}
@@ -0,0 +1,169 @@
+# triggers/matcher.py
+from collections import deque
+
+from .fuzzy import FuzzyIndex
+from .normalize import fold_text, message_text, normalize_text
+
+
+class KeywordAutomaton:
+    """
+    Автомат Ахо-Корасик по набору ключевых слов.
+    Находит все слова за один проход по тексту, независимо от их количества.
+    """
+
+    def __init__(self):
+        self._goto = [{}]      # переходы по символам
+        self._fail = [0]       # суффиксные ссылки
+        self._out = [[]]       # (значение, длина слова), заканчивающиеся в узле
+        self._built = False
+
+    def add(self, keyword: str, value):
+        """Добавляет ключевое слово (уже нормализованное) со связанным значением."""
+        if self._built:
+            raise RuntimeError("Автомат уже собран, добавление слов невозможно")
+        if not keyword:
+            return
+        node = 0
+        for ch in keyword:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((value, len(keyword)))
+
+    def build(self):
+        """Строит суффиксные ссылки (BFS по бору)."""
+        queue = deque()
+        for nxt in self._goto[0].values():
+            self._fail[nxt] = 0
+            queue.append(nxt)
+
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                # Наследуем выходы суффиксной ссылки, чтобы не ходить по ним при поиске
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+        self._built = True
+        return self
+
+    def search(self, text: str) -> dict:
+        """
+        Возвращает {значение: позиция начала первого вхождения} для всех найденных слов.
+        Порядок ключей — порядок первого появления в тексте.
+        """
+        if not self._built:
+            self.build()
+
+        goto, fail, out = self._goto, self._fail, self._out
+        found = {}
+        node = 0
+        for pos, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                for value, length in out[node]:
+                    if value not in found:
+                        found[value] = pos - length + 1
+        return found
+
+    def __len__(self):
+        return len(self._goto) - 1
+
+
+# Как сопоставлять ключевые слова категории (Category.keyword_mode)
+KEYWORD_MODE_SUBSTRING = "substring"  # вхождение подстроки (по умолчанию)
+KEYWORD_MODE_TOKEN = "token"          # совпадение целых слов
+KEYWORD_MODE_FUZZY = "fuzzy"          # целые слова с опечатками (см. fuzzy.py)
+
+
+class CompiledCategories:
+    """
+    Скомпилированный набор категорий чата. Слова категорий в режиме substring
+    собираются в один автомат, в режиме token — в словарь по первому слову:
+    сообщение разбивается на слова один раз, и кандидаты находятся поиском
+    в словаре. Значение — индекс категории в исходном (смерженном) порядке.
+    Слова при компиляции приводятся к той же форме, что и текст сообщений
+    (normalize.py): для подстрок — fold_text с сохранением пунктуации, для
+    слов — normalize_text.
+    Категории в режиме fuzzy попадают в FuzzyIndex, который строится только
+    при их наличии; fuzzy_* — его параметры.
+
+    Совпадения ранжируются по приоритету категории (больше — раньше), затем
+    по позиции первого вхождения в тексте, затем по исходному порядку.
+    """
+
+    def __init__(self, categories, fuzzy_distance: int = 1, fuzzy_min_length: int = 4,
+                 fuzzy_max_candidates: int = 5000):
+        self.automaton = KeywordAutomaton()
+        self.tokens = {}  # первое слово -> [(остальные слова фразы, индекс категории)]
+        self.fuzzy = None
+        self.priorities = []
+        for index, cat in enumerate(categories):
+            self.priorities.append(getattr(cat, "priority", 0) or 0)
+            mode = getattr(cat, "keyword_mode", None)
+            for term in cat.terms:
+                if mode not in (KEYWORD_MODE_FUZZY, KEYWORD_MODE_TOKEN):
+                    # Подстрока ищется с пунктуацией: "5%" без "%" нашлось бы в "15",
+                    # а слово из одной пунктуации ("?!") — тоже подстрока
+                    folded = fold_text(term)
+                    if folded:
+                        self.automaton.add(folded, index)
+                    continue
+                keyword = normalize_text(term)
+                if not keyword:
+                    continue  # в словах нет ничего, кроме пунктуации
+                if mode == KEYWORD_MODE_FUZZY:
+                    if self.fuzzy is None:
+                        self.fuzzy = FuzzyIndex(fuzzy_distance, fuzzy_min_length, fuzzy_max_candidates)
+                    self.fuzzy.add(keyword, index)
+                else:
+                    words = keyword.split(" ")
+                    self.tokens.setdefault(words[0], []).append((tuple(words[1:]), index))
+        self.automaton.build()
+
+    def _search(self, text) -> dict:
+        text = message_text(text)
+        found = self.automaton.search(text.folded) if len(self.automaton) else {}
+        if self.tokens:
+            tokens = self.tokens
+            words = text.tokens
+            for i, word in enumerate(words):
+                candidates = tokens.get(word)
+                if not candidates:
+                    continue
+                for rest, index in candidates:
+                    if rest and tuple(words[i + 1:i + 1 + len(rest)]) != rest:
+                        continue
+                    start = text.starts[i]
+                    if start < found.get(index, start + 1):
+                        found[index] = start
+        if self.fuzzy is not None:
+            for index, start in self.fuzzy.search(text).items():
+                if start < found.get(index, start + 1):
+                    found[index] = start
+        return found
+
+    def matches(self, text) -> list:
+        """Индексы всех категорий, чьи слова есть в тексте (str или MessageText), в порядке ранжирования."""
+        found = self._search(text)
+        priorities = self.priorities
+        return sorted(found, key=lambda index: (-priorities[index], found[index], index))
+
+    def first_match(self, text):
+        """Индекс лучшей по ранжированию категории или None."""
+        found = self._search(text)
+        if not found:
+            return None
+        priorities = self.priorities
+        return min(found, key=lambda index: (-priorities[index], found[index], index))
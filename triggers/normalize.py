@@ -0,0 +1,61 @@
+# triggers/normalize.py
+import re
+import sys
+import unicodedata
+
+# Пунктуация Юникода (категории P*) в пределах BMP — заменяется пробелом.
+# Символы (эмодзи, валюты) остаются: ими тоже бывают ключевые слова
+_PUNCTUATION_RE = re.compile("[{}]".format(re.escape("".join(
+    chr(code) for code in range(min(sys.maxunicode, 0xFFFF) + 1)
+    if unicodedata.category(chr(code)).startswith("P")
+))))
+
+
+def fold_text(text: str) -> str:
+    """
+    Форма для поиска подстрок: NFKC, casefold, ё → е, пробелы схлопнуты.
+    Пунктуация сохраняется: ключ "5%" не должен находиться в "15 яблок".
+    """
+    if not text:
+        return ""
+    if not unicodedata.is_normalized("NFKC", text):  # обычный текст уже в NFKC — проверка дешевле нормализации
+        text = unicodedata.normalize("NFKC", text)
+    return " ".join(text.casefold().replace("ё", "е").split())
+
+
+def normalize_text(text: str) -> str:
+    """
+    Каноническая форма для сопоставления по словам: fold_text и
+    пунктуация → пробел. Одинакова для сообщений и ключевых слов,
+    повторное применение ничего не меняет.
+    """
+    return " ".join(_PUNCTUATION_RE.sub(" ", fold_text(text)).split())
+
+
+class MessageText:
+    """
+    Текст сообщения, нормализованный один раз: folded — строка для поиска
+    подстрок (fold_text), normalized — она же с пунктуацией, заменённой
+    пробелами на месте (позиции совпадают с folded), tokens — слова
+    (как после normalize_text), starts — их позиции.
+    Лежит в контексте обработки сообщения (context["text"]) и общий для всех условий.
+    """
+    __slots__ = ("raw", "folded", "normalized", "tokens", "starts")
+
+    def __init__(self, raw: str):
+        self.raw = raw
+        self.folded = fold_text(raw)
+        self.normalized = normalized = _PUNCTUATION_RE.sub(" ", self.folded)
+        self.tokens = normalized.split()
+        # Пунктуация заменена на месте, поэтому между словами бывает больше одного пробела
+        self.starts = starts = []
+        position = 0
+        for token in self.tokens:
+            position = normalized.find(token, position)
+            starts.append(position)
+            position += len(token)
+
+
+def message_text(text) -> MessageText:
+    """MessageText из строки; уже нормализованный текст возвращается как есть."""
+    return text if isinstance(text, MessageText) else MessageText(text or "")
@@ -0,0 +1,103 @@
+# triggers/pipeline.py
+"""
+Конвейер категории: условия и действия, заданные данными (Category.pipeline, JSON):
+
+    {"conditions": [{"type": "rate", "count": 3, "minutes": 10},
+                    {"type": "time", "from": "09:00", "to": "18:00", "utc_offset": 3},
+                    {"type": "role", "roles": ["member"]},
+                    {"type": "keywords", "keywords": "скидка, акция"}],
+     "actions": [{"type": "send", "text": "..."}, {"type": "reply"}]}
+
+Совпадение по ключевым словам категории уже проверено автоматом, здесь —
+дополнительные условия. Без pipeline (NULL) — прежнее поведение: 3
+срабатывания за 10 минут, затем ответ текстом категории. У действия без
+"text" текст — response категории.
+
+У "rate" count не больше max_events счётчика (32): больше событий на
+ключ он не хранит. Окно длиннее горизонта счётчика расширяет горизонт,
+и недостающая история дозагружается из trigger_events.
+
+При загрузке кэша описание компилируется в Plan: условия упорядочены по
+стоимости (проверки сообщения → счётчики в памяти → обращения к API),
+проверка останавливается на первом непрошедшем. Окна условий "rate" всех
+совпавших категорий сообщения считаются одним пакетом (rate_counts).
+"""
+import inspect
+
+from locallog.logger import logger
+from .actions import ReplyMessage, SendMessage
+from .conditions import COST_IO, KeywordMatch, TimeOfDay, UserRole, UserTriggerCount
+
+CONDITIONS = {
+    "keywords": lambda spec: KeywordMatch(spec["keywords"]),
+    "rate": lambda spec: UserTriggerCount(count=int(spec.get("count", 3)), minutes=int(spec.get("minutes", 10))),
+    "time": lambda spec: TimeOfDay(spec["from"], spec["to"], utc_offset=float(spec.get("utc_offset", 0)),
+                                   days=spec.get("days")),
+    "role": lambda spec: UserRole(spec["roles"]),
+}
+
+ACTIONS = {
+    "send": SendMessage,
+    "reply": ReplyMessage,
+}
+
+DEFAULT_PIPELINE = {
+    "conditions": [{"type": "rate", "count": 3, "minutes": 10}],  # Например, 3 триггера за 10 минут
+    "actions": [{"type": "send"}],
+}
+
+
+class Plan:
+    """Скомпилированный конвейер: условия от дешёвых к дорогим и действия по порядку."""
+    __slots__ = ("conditions", "actions", "rate_windows")
+
+    def __init__(self, conditions: list, actions: list):
+        # sorted устойчив: при равной стоимости сохраняется порядок из описания
+        self.conditions = sorted(conditions, key=lambda condition: getattr(condition, "cost", COST_IO))
+        self.actions = actions
+        # Окна (минуты) условий частоты — для пакетного подсчёта
+        self.rate_windows = tuple({condition.minutes for condition in conditions
+                                   if isinstance(condition, UserTriggerCount)})
+
+    async def passes(self, message, context) -> bool:
+        for condition in self.conditions:
+            result = condition.check(message, context)
+            if inspect.isawaitable(result):  # условиям с I/O (COST_IO) check асинхронный
+                result = await result
+            if not result:
+                return False
+        return True
+
+    async def run(self, message, context):
+        for action in self.actions:
+            await action.execute(message, context)
+
+
+def rate_counts(counter, chat_id: int, user_id: int, categories) -> dict:
+    """Окна условий "rate" всех категорий одним пакетом: {(category_id, minutes): число} для context."""
+    windows = [(category.id, minutes) for category in categories for minutes in category.plan.rate_windows]
+    return counter.count_many(chat_id, user_id, windows) if windows else {}
+
+
+def compile_plan(spec, response: str) -> Plan:
+    """Описание конвейера → Plan. ValueError — описание некорректно."""
+    spec = spec or DEFAULT_PIPELINE
+    try:
+        conditions = [CONDITIONS[item["type"]](item) for item in spec.get("conditions", ())]
+        actions = [ACTIONS[item["type"]](item.get("text", response)) for item in spec.get("actions", ())]
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        raise ValueError(f"Некорректный pipeline: {e!r}") from e
+    if not actions:
+        raise ValueError("В pipeline нет действий")
+    return Plan(conditions, actions)
+
+
+def category_plan(cat) -> Plan:
+    """Plan категории; при ошибке в описании — конвейер по умолчанию и запись в лог."""
+    try:
+        return compile_plan(cat.pipeline, cat.response)
+    except ValueError as e:
+        logger.warning("Pipeline категории не скомпилирован, используется по умолчанию",
+                       extra={"event_type": "trigger_pipeline", "payload": {"category_id": cat.id, "error": str(e)}})
+        return compile_plan(None, cat.response)
+